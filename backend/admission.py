@@ -0,0 +1,325 @@
+"""Admission control for main.py's generation endpoints.
+
+Without it `/api/video-gen` accepts every upload and hands out a job id even
+when the GPU node is already hours behind, and a long video can exhaust host
+memory inside LatentSync (which decodes every frame into RAM). Before a job
+is queued the endpoints now
+
+* estimate its cost per pipeline stage from the probed video (duration,
+  resolution), the reference audio and the script length (`CostModel`),
+* compare the expected wait behind the work already admitted with
+  `max_wait` and the estimated peak memory with the free host memory, and
+* answer 429 with `Retry-After` instead of overcommitting
+  (`AdmissionController.try_admit`).
+
+The cost model is a small per-stage linear regression. Its coefficients are
+learned from the stage timings the scheduler records for every finished job
+(the `timings` column of the job table); until a stage has `MIN_SAMPLES`
+observations the cold-start coefficients below are used.
+"""
+import math
+import threading
+import time
+
+import jobstore
+
+# LatentSync resamples every input video to 25 fps before processing it
+LATENTSYNC_FPS = 25
+
+# F5-TTS clips reference audio to ~15 s, so longer references cost no more
+REF_CLIP_SECONDS = 15.0
+
+# stage -> features of its linear model (an intercept is always added)
+STAGE_FEATURES = {
+    "ffmpeg": ("video_seconds",),
+    "tts": ("script_chars", "ref_seconds"),
+    "lipsync": ("video_frames", "script_chars"),
+}
+
+# cold-start coefficients, intercept first, in seconds
+DEFAULT_COEFS = {
+    "ffmpeg": (1.0, 0.02),
+    "tts": (3.0, 0.05, 0.2),
+    "lipsync": (20.0, 0.05, 0.8),
+}
+
+# observations needed before a stage's fitted coefficients replace the defaults
+MIN_SAMPLES = 5
+
+# ridge strength pulling the fit towards DEFAULT_COEFS (keeps it stable when features are collinear)
+RIDGE = 1e-2
+
+# peak host memory of a lipsync run: decoded frames, looped frames and restored output frames,
+# on top of a base for the models and libraries (main.py makes it configurable)
+LIPSYNC_FRAME_COPIES = 3
+LIPSYNC_BASE_BYTES = 4 * 1024 ** 3
+
+# bounds of the Retry-After header, in seconds
+RETRY_MIN = 5
+RETRY_MAX = 3600
+
+
+def job_features(script, ref_probe=None, video_probe=None):
+    """Cost-model features of a request, from its script and the upload probes (see uploads.summarize_probe)."""
+    features = {"script_chars": len(script or "")}
+    if ref_probe is not None and ref_probe.get("duration"):
+        features["ref_seconds"] = min(ref_probe["duration"], REF_CLIP_SECONDS)
+    if video_probe is not None:
+        if video_probe.get("duration"):
+            features["video_seconds"] = video_probe["duration"]
+            features["video_frames"] = math.ceil(video_probe["duration"] * LATENTSYNC_FPS)
+        elif video_probe.get("frames"):
+            features["video_frames"] = video_probe["frames"]
+        if video_probe.get("width") and video_probe.get("height"):
+            features["video_pixels"] = video_probe["width"] * video_probe["height"]
+    return features
+
+
+def job_memory_bytes(features, base_bytes=LIPSYNC_BASE_BYTES):
+    """Estimated peak host memory of the job's lipsync stage (0 when the video is unknown)."""
+    if "video_frames" not in features or "video_pixels" not in features:
+        return 0
+    return base_bytes + features["video_frames"] * features["video_pixels"] * 3 * LIPSYNC_FRAME_COPIES
+
+
+def available_memory():
+    """`(available, total)` host memory in bytes from /proc/meminfo, or None where it does not exist."""
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.split()[1:]}
+    except (OSError, ValueError, IndexError):
+        return None
+    if "MemAvailable" not in info or "MemTotal" not in info:
+        return None
+    return info["MemAvailable"], info["MemTotal"]
+
+
+def _solve(a, b):
+    """Solve the small dense system a @ x = b by Gaussian elimination with partial pivoting."""
+    n = len(b)
+    m = [list(row) + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            factor = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= factor * m[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class CostModel:
+    """Per-stage linear model of stage seconds, fitted by online least squares."""
+
+    def __init__(self, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        # stage -> [X^T X, X^T y, samples]
+        self._stats = {
+            stage: [[[0.0] * (len(names) + 1) for _ in range(len(names) + 1)], [0.0] * (len(names) + 1), 0]
+            for stage, names in STAGE_FEATURES.items()
+        }
+        self._coefs = {stage: list(coefs) for stage, coefs in DEFAULT_COEFS.items()}
+
+    @staticmethod
+    def _row(stage, features):
+        return [1.0] + [float(features.get(name, 0.0)) for name in STAGE_FEATURES[stage]]
+
+    def observe(self, stage, features, seconds):
+        if stage not in STAGE_FEATURES:
+            return
+        x = self._row(stage, features)
+        with self._lock:
+            xtx, xty, _ = stats = self._stats[stage]
+            for i, xi in enumerate(x):
+                xty[i] += xi * seconds
+                for j, xj in enumerate(x):
+                    xtx[i][j] += xi * xj
+            stats[2] += 1
+            if stats[2] >= self.min_samples:
+                self._refit(stage)
+
+    def _refit(self, stage):
+        """Ridge regression towards the defaults. Caller holds the lock."""
+        xtx, xty, _ = self._stats[stage]
+        prior = DEFAULT_COEFS[stage]
+        a = [[xtx[i][j] + (RIDGE * max(xtx[i][i], 1.0) if i == j else 0.0) for j in range(len(prior))] for i in range(len(prior))]
+        b = [xty[i] + RIDGE * max(xtx[i][i], 1.0) * prior[i] for i in range(len(prior))]
+        coefs = _solve(a, b)
+        if coefs is not None:
+            self._coefs[stage] = coefs
+
+    def learn_job(self, job):
+        """Learn from a finished job row: its recorded stage timings against its request features."""
+        if job is None or job["state"] != jobstore.DONE or not job.get("timings"):
+            return
+        features = job["params"].get("features")
+        if features is None:
+            return
+        for stage, seconds in job["timings"].items():
+            self.observe(stage, features, seconds)
+
+    def bootstrap(self, store, limit=500):
+        """Learn from the most recent finished jobs in `store` (called once at startup). Returns how many."""
+        recent, _ = store.list(limit=limit, state=jobstore.DONE)
+        for job in recent:
+            self.learn_job(job)
+        return len(recent)
+
+    def estimate(self, stage, features):
+        x = self._row(stage, features)
+        with self._lock:
+            coefs = self._coefs[stage]
+            return max(0.0, sum(c * xi for c, xi in zip(coefs, x)))
+
+    def status(self):
+        with self._lock:
+            return {
+                stage: {
+                    "features": list(STAGE_FEATURES[stage]),
+                    "coefficients": list(self._coefs[stage]),
+                    "samples": self._stats[stage][2],
+                    "fitted": self._stats[stage][2] >= self.min_samples,
+                }
+                for stage in STAGE_FEATURES
+            }
+
+
+class Rejected(Exception):
+    """A job was not admitted. `status_code` is 429 (retry later) or 413 (never fits)."""
+
+    def __init__(self, reason, retry_after=None, status_code=429):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class AdmissionController:
+    """Tracks the estimated remaining work of admitted jobs and decides on new ones.
+
+    Main.py feeds job-table updates into `on_job_update()`: entering a stage
+    starts its clock, the scheduler's `timings` write marks it finished, and
+    a terminal state drops the job (and teaches the cost model when it
+    succeeded).
+    """
+
+    def __init__(self, model, stage_limits, max_wait=1800, memory_reserve=2 * 1024 ** 3):
+        self.model = model
+        self.stage_limits = dict(stage_limits)
+        # seconds a new job may expect to wait behind admitted work; 0 disables the wait check
+        self.max_wait = float(max_wait)
+        # host memory kept free besides the job's own estimate
+        self.memory_reserve = int(memory_reserve)
+        self._lock = threading.Lock()
+        # job_id -> {"stages": {stage: estimated seconds}, "running": (stage, started) or None, "memory": bytes}
+        self._jobs = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    def estimate(self, features, stages):
+        return {stage: round(self.model.estimate(stage, features), 1) for stage in stages}
+
+    def _backlog(self, now):
+        """Seconds of admitted work per stage slot. Caller holds the lock."""
+        backlog = {}
+        for job in self._jobs.values():
+            running = job["running"]
+            for stage, seconds in job["stages"].items():
+                if running is not None and running[0] == stage:
+                    seconds = max(0.0, seconds - (now - running[1]))
+                backlog[stage] = backlog.get(stage, 0.0) + seconds
+        return {stage: seconds / self.stage_limits.get(stage, 1) for stage, seconds in backlog.items()}
+
+    def try_admit(self, job_id, estimate, memory=0):
+        """Admit a job with per-stage `estimate` and peak `memory` bytes, or raise Rejected.
+
+        The check and the admission happen under one lock hold, so concurrent
+        requests cannot both pass against the same backlog.
+        """
+        self.try_admit_group({job_id: (estimate, memory)})
+
+    def try_admit_group(self, jobs):
+        """try_admit() for jobs that are taken or refused together (a batch).
+
+        `jobs` maps job_id -> (estimate, memory). The group is checked as one
+        job with the summed estimates and the largest memory, then each job is
+        tracked on its own.
+        """
+        total = {}
+        for estimate, _ in jobs.values():
+            for stage, seconds in estimate.items():
+                total[stage] = total.get(stage, 0.0) + seconds
+        memory = max([memory for _, memory in jobs.values()] or [0])
+        with self._lock:
+            try:
+                self._check_locked(total, memory)
+            except Rejected:
+                self.rejected += 1
+                raise
+            for job_id, (estimate, job_memory) in jobs.items():
+                self._jobs[job_id] = {"stages": dict(estimate), "running": None, "memory": job_memory}
+                self.admitted += 1
+
+    def _check_locked(self, estimate, memory):
+        """Raise Rejected unless a job with per-stage `estimate` and peak `memory` bytes can be taken now. Caller holds the lock."""
+        backlog = self._backlog(time.time())
+        wait = max([backlog.get(stage, 0.0) for stage in estimate] or [0.0])
+        own = sum(estimate.values())
+        if self.max_wait and wait > 0 and wait + own > self.max_wait:
+            raise Rejected(
+                f"server busy: about {wait:.0f}s of queued work ahead of this job (limit {self.max_wait:.0f}s)",
+                retry_after=min(RETRY_MAX, max(RETRY_MIN, math.ceil(wait + own - self.max_wait))),
+            )
+        meminfo = available_memory() if memory else None
+        if meminfo is not None:
+            free, total = meminfo
+            if memory + self.memory_reserve > total:
+                raise Rejected(
+                    f"job needs about {memory / 1024 ** 3:.1f} GiB of memory; this server has {total / 1024 ** 3:.1f} GiB",
+                    status_code=413,
+                )
+            if self._jobs and memory + self.memory_reserve > free:
+                raise Rejected(
+                    f"not enough free memory for this job right now ({free / 1024 ** 3:.1f} GiB free)",
+                    retry_after=min(RETRY_MAX, max(RETRY_MIN, math.ceil(wait or backlog.get("lipsync", 0.0)))),
+                )
+
+    def on_job_update(self, job_id, fields, job):
+        """JobStore hook (via main.py): follow stage progress and forget finished jobs."""
+        if job is None:
+            return
+        with self._lock:
+            tracked = self._jobs.get(job_id)
+            if tracked is not None:
+                if "timings" in fields:
+                    for stage in job.get("timings") or {}:
+                        tracked["stages"].pop(stage, None)
+                    if tracked["running"] is not None and tracked["running"][0] not in tracked["stages"]:
+                        tracked["running"] = None
+                stage = fields.get("stage")
+                if stage in tracked["stages"]:
+                    tracked["running"] = (stage, time.time())
+            finished = job["state"] in jobstore.TERMINAL_STATES and "state" in fields
+            if finished:
+                self._jobs.pop(job_id, None)
+        if finished:
+            self.model.learn_job(job)
+
+    def status(self):
+        with self._lock:
+            backlog = self._backlog(time.time())
+            tracked = len(self._jobs)
+        return {
+            "max_wait": self.max_wait,
+            "memory_reserve": self.memory_reserve,
+            "tracked_jobs": tracked,
+            "backlog_seconds": {stage: round(seconds, 1) for stage, seconds in backlog.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "cost_model": self.model.status(),
+        }
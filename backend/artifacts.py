@@ -0,0 +1,31 @@
+"""Atomic publication of job outputs.
+
+Generators write to a `partial_path()` next to the final file and the job
+renames it into place with `publish()` once it is complete. `os.replace` is
+atomic on the same filesystem, so anything that sees `generated_out.wav` or
+`final_output.mp4` sees the whole file and the download endpoints never have
+to guess whether a writer is still busy.
+"""
+import os
+
+from result_cache import link_or_copy
+
+
+def partial_path(path):
+    """`.../final_output.mp4` -> `.../final_output.partial.mp4` (keeps the extension for ffmpeg/soundfile)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.partial{ext}"
+
+
+def publish(partial, path):
+    """Move a finished `partial` file to `path` in one step."""
+    os.replace(partial, path)
+    return path
+
+
+def publish_copy(src, path):
+    """Publish a link/copy of an existing file (e.g. a cache entry) at `path`."""
+    partial = partial_path(path)
+    link_or_copy(src, partial)
+    return publish(partial, path)
+
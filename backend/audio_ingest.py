@@ -0,0 +1,67 @@
+"""Single audio ingest stage for main.py's jobs.
+
+Before this, one job decoded the same audio several times: main.py extracted
+the video's track to 44.1 kHz stereo, F5-TTS loaded it again with torchaudio
+and resampled to 24 kHz, and LatentSync decoded the generated speech twice
+more at 16 kHz (Whisper's `load_audio`, which spawns ffmpeg, and decord's
+`read_audio` for muxing).
+
+`ingest()` now runs one ffmpeg process per input. It decodes the audio once,
+downmixes it to mono in ffmpeg's float pipeline, and splits it into one
+resampled branch per consumer. Every branch is written as a mono 16-bit WAV
+next to the job:
+
+* `TTS_RATE` (24 kHz) is F5-TTS's reference input, which it loads without
+  resampling.
+* `WHISPER_RATE` (16 kHz) is LatentSync's Whisper input and the track that is
+  muxed into the output video.
+
+The generated speech (24 kHz) does not go through ffmpeg again. The TTS
+worker resamples it to 16 kHz in memory and writes both files
+(run_infer.synthesize's `out_wav_16k`).
+"""
+import os
+
+from artifacts import partial_path, publish
+from procs import run_process
+from scheduler import JobFailed
+
+TTS_RATE = 24000
+WHISPER_RATE = 16000
+
+
+def ingest_command(src, outputs):
+    """ffmpeg command decoding `src` once into `{sample_rate: wav_path}` (mono, 16-bit)."""
+    rates = sorted(outputs, reverse=True)
+    labels = [f"[a{i}]" for i in range(len(rates))]
+    graph = "[0:a:0]aformat=sample_fmts=fltp:channel_layouts=mono"
+    if len(rates) > 1:
+        graph += f",asplit={len(rates)}"
+    graph += "".join(labels)
+    for label, rate in zip(labels, rates):
+        graph += f";{label}aresample={rate}[out{rate}]"
+    cmd = ["ffmpeg", "-y", "-nostdin", "-loglevel", "error", "-i", src, "-filter_complex", graph]
+    for rate in rates:
+        cmd += ["-map", f"[out{rate}]", "-acodec", "pcm_s16le", outputs[rate]]
+    return cmd
+
+
+async def ingest(src, outputs, tag):
+    """Decode `src` (audio or video) once into every `{sample_rate: wav_path}` of `outputs`.
+
+    Each file is written to its partial path and published when ffmpeg is
+    done. Returns `outputs`. Raises JobFailed on error.
+    """
+    partials = {rate: partial_path(path) for rate, path in outputs.items()}
+    try:
+        returncode, tail = await run_process(ingest_command(src, partials), "%s ffmpeg:" % tag)
+    except FileNotFoundError:
+        raise JobFailed("ffmpeg not found on server; cannot decode audio")
+    if returncode != 0:
+        for partial in partials.values():
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise JobFailed("failed to decode audio (ffmpeg error): %s" % " ".join(tail[-3:]))
+    for rate, path in outputs.items():
+        publish(partials[rate], path)
+    return outputs
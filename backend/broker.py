@@ -0,0 +1,828 @@
+"""Job broker between main.py and inference workers, possibly on other hosts.
+
+Without a broker main.py can only run the TTS and lipsync stages on the
+machine that accepted the upload (in a subprocess or the local worker pool).
+With `BROKER_URL` set, each stage is submitted as a *task* instead and any
+number of `broker_worker.py` processes pull tasks of their kind:
+
+    task = broker.claim(["lipsync"], worker_id)       # worker takes the next task
+    broker.heartbeat(task["id"], worker_id, progress)  # every few seconds, extends the lease
+    broker.complete(task["id"], worker_id, result)     # or broker.fail(...)
+
+A claimed task carries a lease. Main.py calls `requeue_expired()`
+periodically; tasks whose worker stopped heartbeating (crashed, lost its
+host) go back to the queue, up to `MAX_ATTEMPTS` claims. `cancel()` marks a
+task cancelled, and the worker running it learns so from its next heartbeat
+(which returns False) and kills the inference.
+
+Inputs and outputs travel through shared storage: paths in task params and
+results are relative to the runs root (`to_storage()` / `from_storage()`),
+so every host may mount the shared runs directory wherever it likes.
+
+Implementations, chosen by `open_broker(url)`:
+
+* `memory://`                 - `InProcessBroker`, workers are threads of the API process
+* `sqlite:///path/broker.db`  - `SQLiteBroker`, one database file on a shared filesystem
+* `redis://host:port/db`      - `RedisBroker`, any server speaking the Redis protocol
+  (a Redis install, or `resp_server.py` as a local stand-in)
+"""
+import asyncio
+import collections
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+# Task states. `queued` and `claimed` are live; the rest are terminal.
+QUEUED = "queued"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = (DONE, FAILED, CANCELLED)
+
+# seconds a claim stays valid without a heartbeat
+LEASE_SECONDS = 30
+# how often workers heartbeat; well inside the lease
+HEARTBEAT_INTERVAL = 5
+# claims per task before it is failed (the task keeps killing its workers, or they keep dying)
+MAX_ATTEMPTS = 3
+# a worker that has not heartbeated for this long is no longer listed as live
+WORKER_TTL = 3 * HEARTBEAT_INTERVAL
+# how often main.py polls a submitted task
+POLL_SECONDS = 0.5
+
+# task params / result keys holding file paths that are rewritten relative to the storage root
+PATH_KEYS = (
+    "ref_audio", "out_wav", "out_wav_16k", "video_path", "audio_path", "video_out_path", "temp_dir",
+    "alignment_cache", "stream_dir",
+)
+
+
+class BrokerError(RuntimeError):
+    """A task failed, was cancelled or vanished."""
+
+
+def to_storage(params, root):
+    """Copy of `params` with the paths under `root` made relative to it."""
+    root = os.path.abspath(root)
+    converted = dict(params)
+    for key in PATH_KEYS:
+        path = converted.get(key)
+        if path:
+            relative = os.path.relpath(os.path.abspath(path), root)
+            if relative.startswith(os.pardir):
+                raise ValueError(f"{key}={path} is outside the shared storage root {root}")
+            converted[key] = relative.replace(os.sep, "/")
+    return converted
+
+
+def from_storage(params, root):
+    """Inverse of to_storage() on the worker's host, whose mount point of the storage is `root`."""
+    converted = dict(params)
+    for key in PATH_KEYS:
+        path = converted.get(key)
+        if path and not os.path.isabs(path):
+            converted[key] = os.path.join(os.path.abspath(root), *path.split("/"))
+    return converted
+
+
+def _new_task(kind, params):
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "params": params,
+        "state": QUEUED,
+        "worker": None,
+        "attempts": 0,
+        "lease_until": None,
+        "result": None,
+        "error": None,
+        "progress": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class Broker:
+    """Interface shared by the implementations below. All methods are blocking and thread-safe."""
+
+    def submit(self, kind, params):
+        """Queue a task for workers of `kind`. Returns its id."""
+        raise NotImplementedError
+
+    def claim(self, kinds, worker_id):
+        """Take the oldest queued task of one of `kinds`, or None."""
+        raise NotImplementedError
+
+    def heartbeat(self, task_id, worker_id, progress=None):
+        """Extend the lease of a claimed task (and record its progress). False: stop working on it."""
+        raise NotImplementedError
+
+    def complete(self, task_id, worker_id, result):
+        raise NotImplementedError
+
+    def fail(self, task_id, worker_id, error):
+        raise NotImplementedError
+
+    def cancel(self, task_id):
+        raise NotImplementedError
+
+    def get(self, task_id):
+        """The task dict (see `_new_task`), or None."""
+        raise NotImplementedError
+
+    def forget(self, task_id):
+        """Delete a task record (the submitter has read its outcome)."""
+        raise NotImplementedError
+
+    def requeue_expired(self):
+        """Requeue (or fail, after MAX_ATTEMPTS) claimed tasks whose lease ran out. Returns their ids."""
+        raise NotImplementedError
+
+    def touch_worker(self, worker_id, info):
+        """Record that a worker is alive; `info` is shown by workers()/status()."""
+        raise NotImplementedError
+
+    def workers(self):
+        """Live workers: `{worker_id: info}` with `last_seen`."""
+        raise NotImplementedError
+
+    def queue_lengths(self):
+        """`{kind: queued tasks}`"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def status(self):
+        return {"broker": type(self).__name__, "queued": self.queue_lengths(), "workers": self.workers()}
+
+    async def wait(self, task_id, on_progress=None, poll=POLL_SECONDS):
+        """Await a submitted task from the event loop and return its result.
+
+        `on_progress(progress)` is called when the worker reports new
+        progress. Cancelling the caller cancels the task. The task record is
+        forgotten once its outcome has been read.
+        """
+        last_progress = None
+        try:
+            while True:
+                task = await asyncio.to_thread(self.get, task_id)
+                if task is None:
+                    raise BrokerError(f"task {task_id} vanished from the broker")
+                if task["progress"] and task["progress"] != last_progress:
+                    last_progress = task["progress"]
+                    if on_progress is not None:
+                        on_progress(last_progress)
+                if task["state"] == DONE:
+                    return task["result"] or {}
+                if task["state"] in (FAILED, CANCELLED):
+                    raise BrokerError(task["error"] or f"task {task['state']}")
+                await asyncio.sleep(poll)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.cancel, task_id)
+            raise
+        finally:
+            await asyncio.to_thread(self.forget, task_id)
+
+
+class InProcessBroker(Broker):
+    """Dict-backed broker for a single process (workers run as threads next to the API)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        # kind -> deque of queued task ids, oldest first
+        self._queues = collections.defaultdict(collections.deque)
+        self._workers = {}
+
+    def submit(self, kind, params):
+        task = _new_task(kind, params)
+        with self._lock:
+            self._tasks[task["id"]] = task
+            self._queues[kind].append(task["id"])
+        return task["id"]
+
+    def claim(self, kinds, worker_id):
+        now = time.time()
+        with self._lock:
+            for kind in kinds:
+                queue = self._queues.get(kind)
+                while queue:
+                    task = self._tasks.get(queue.popleft())
+                    if task is None or task["state"] != QUEUED:
+                        continue
+                    task.update(state=CLAIMED, worker=worker_id, lease_until=now + LEASE_SECONDS, updated_at=now)
+                    task["attempts"] += 1
+                    return dict(task)
+        return None
+
+    def _owned(self, task_id, worker_id):
+        task = self._tasks.get(task_id)
+        if task is None or task["state"] != CLAIMED or task["worker"] != worker_id:
+            return None
+        return task
+
+    def heartbeat(self, task_id, worker_id, progress=None):
+        now = time.time()
+        with self._lock:
+            task = self._owned(task_id, worker_id)
+            if task is None:
+                return False
+            task.update(lease_until=now + LEASE_SECONDS, updated_at=now)
+            if progress:
+                task["progress"] = dict(progress)
+            return True
+
+    def _finish(self, task_id, worker_id, **fields):
+        with self._lock:
+            task = self._owned(task_id, worker_id)
+            if task is None:
+                return False
+            task.update(lease_until=None, updated_at=time.time(), **fields)
+            return True
+
+    def complete(self, task_id, worker_id, result):
+        return self._finish(task_id, worker_id, state=DONE, result=result)
+
+    def fail(self, task_id, worker_id, error):
+        return self._finish(task_id, worker_id, state=FAILED, error=error)
+
+    def cancel(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None and task["state"] not in TERMINAL_STATES:
+                task.update(state=CANCELLED, error="cancelled", lease_until=None, updated_at=time.time())
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def forget(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def requeue_expired(self):
+        now = time.time()
+        expired = []
+        with self._lock:
+            for task in self._tasks.values():
+                if task["state"] != CLAIMED or task["lease_until"] > now:
+                    continue
+                expired.append(task["id"])
+                if task["attempts"] >= MAX_ATTEMPTS:
+                    task.update(state=FAILED, error=f"worker lost {task['attempts']} times", lease_until=None)
+                else:
+                    task.update(state=QUEUED, worker=None, lease_until=None)
+                    self._queues[task["kind"]].append(task["id"])
+                task["updated_at"] = now
+        return expired
+
+    def touch_worker(self, worker_id, info):
+        with self._lock:
+            self._workers[worker_id] = dict(info, last_seen=time.time())
+
+    def workers(self):
+        now = time.time()
+        with self._lock:
+            return {wid: dict(info) for wid, info in self._workers.items() if now - info["last_seen"] < WORKER_TTL}
+
+    def queue_lengths(self):
+        with self._lock:
+            return {
+                kind: sum(1 for tid in queue if self._tasks.get(tid, {}).get("state") == QUEUED)
+                for kind, queue in self._queues.items()
+            }
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    worker      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    result      TEXT,
+    error       TEXT,
+    progress    TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_queue ON tasks (state, kind, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    id          TEXT PRIMARY KEY,
+    info        TEXT NOT NULL,
+    last_seen   REAL NOT NULL
+);
+"""
+
+
+class SQLiteBroker(Broker):
+    """Broker in one SQLite file that the API and the workers open, e.g. on a shared filesystem.
+
+    Claims run in `BEGIN IMMEDIATE` transactions, i.e. under SQLite's file
+    lock, so two workers never take the same task. The default rollback
+    journal is kept (not WAL) because WAL needs shared memory that network
+    filesystems do not provide.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(_SQLITE_SCHEMA)
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _row_to_task(row):
+        if row is None:
+            return None
+        task = dict(row)
+        for name in ("params", "result", "progress"):
+            task[name] = json.loads(task[name]) if task[name] else None
+        return task
+
+    def submit(self, kind, params):
+        task = _new_task(kind, params)
+        self._transaction(
+            lambda conn: conn.execute(
+                "INSERT INTO tasks (id, kind, params, state, attempts, created_at, updated_at) VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (task["id"], kind, json.dumps(params), QUEUED, task["created_at"], task["updated_at"]),
+            )
+        )
+        return task["id"]
+
+    def claim(self, kinds, worker_id):
+        kinds = list(kinds)
+
+        def take(conn):
+            now = time.time()
+            row = conn.execute(
+                f"SELECT id FROM tasks WHERE state = ? AND kind IN ({','.join('?' * len(kinds))}) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, *kinds),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET state = ?, worker = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (CLAIMED, worker_id, now + LEASE_SECONDS, now, row["id"]),
+            )
+            return self._row_to_task(conn.execute("SELECT * FROM tasks WHERE id = ?", (row["id"],)).fetchone())
+
+        return self._transaction(take) if kinds else None
+
+    def _update_owned(self, task_id, worker_id, assignments, args):
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE tasks SET {assignments}, updated_at = ? WHERE id = ? AND state = ? AND worker = ?",
+                (*args, time.time(), task_id, CLAIMED, worker_id),
+            )
+        return cur.rowcount == 1
+
+    def heartbeat(self, task_id, worker_id, progress=None):
+        if progress:
+            return self._update_owned(
+                task_id, worker_id, "lease_until = ?, progress = ?", (time.time() + LEASE_SECONDS, json.dumps(progress))
+            )
+        return self._update_owned(task_id, worker_id, "lease_until = ?", (time.time() + LEASE_SECONDS,))
+
+    def complete(self, task_id, worker_id, result):
+        return self._update_owned(
+            task_id, worker_id, "state = ?, result = ?, lease_until = NULL", (DONE, json.dumps(result))
+        )
+
+    def fail(self, task_id, worker_id, error):
+        return self._update_owned(task_id, worker_id, "state = ?, error = ?, lease_until = NULL", (FAILED, error))
+
+    def cancel(self, task_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET state = ?, error = 'cancelled', lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND state IN (?, ?)",
+                (CANCELLED, time.time(), task_id, QUEUED, CLAIMED),
+            )
+
+    def get(self, task_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row)
+
+    def forget(self, task_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def requeue_expired(self):
+        def requeue(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT id, attempts FROM tasks WHERE state = ? AND lease_until <= ?", (CLAIMED, now)
+            ).fetchall()
+            for row in rows:
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE tasks SET state = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                        (FAILED, f"worker lost {row['attempts']} times", now, row["id"]),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE tasks SET state = ?, worker = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                        (QUEUED, now, row["id"]),
+                    )
+            return [row["id"] for row in rows]
+
+        return self._transaction(requeue)
+
+    def touch_worker(self, worker_id, info):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workers (id, info, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET info = excluded.info, last_seen = excluded.last_seen",
+                (worker_id, json.dumps(info), time.time()),
+            )
+
+    def workers(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, info, last_seen FROM workers WHERE last_seen > ?", (time.time() - WORKER_TTL,)
+            ).fetchall()
+        return {row["id"]: dict(json.loads(row["info"]), last_seen=row["last_seen"]) for row in rows}
+
+    def queue_lengths(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*) FROM tasks WHERE state = ? GROUP BY kind", (QUEUED,)
+            ).fetchall()
+        return {kind: count for kind, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RespError(RuntimeError):
+    """An error reply from the server."""
+
+
+class RespClient:
+    """Minimal blocking client for the Redis serialization protocol (RESP2).
+
+    Enough for the broker's commands; avoids a redis-py dependency. One
+    connection, serialized by a lock, reconnected once on a broken socket.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", self.db)
+
+    def _disconnect(self):
+        for closable in (self._reader, self._sock):
+            try:
+                if closable is not None:
+                    closable.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _roundtrip(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)[:-2]
+            return data.decode()
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"unexpected reply: {line!r}")
+
+    def execute(self, *args):
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._roundtrip(*args)
+                except (ConnectionError, OSError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def transaction(self, prepare):
+        """Run an optimistic WATCH/MULTI/EXEC transaction and return its value.
+
+        `prepare(call)` WATCHes keys and reads them with `call(*args)` on this
+        connection, then returns `(commands, value)`: the commands to run as
+        one step (a list of argument tuples) and the value to return. When a
+        watched key changes before EXEC nothing runs and `prepare` is called
+        again; with no commands the transaction is dropped and `value`
+        returned as is.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    while True:
+                        commands, value = prepare(self._roundtrip)
+                        if not commands:
+                            self._roundtrip("UNWATCH")
+                            return value
+                        self._roundtrip("MULTI")
+                        for command in commands:
+                            self._roundtrip(*command)
+                        if self._roundtrip("EXEC") is not None:
+                            return value
+                except RespError:
+                    # the connection may be inside MULTI or mid-reply; start the next call afresh
+                    self._disconnect()
+                    raise
+                except (ConnectionError, OSError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class RedisBroker(Broker):
+    """Broker on a Redis-protocol server.
+
+    Layout (all keys under `prefix`): `task:<id>` hash per task, `queue:<kind>`
+    list of queued ids, `leases` sorted set of claimed ids scored by lease
+    expiry, `kinds` set, `workers` hash of worker id -> JSON info. Every
+    state change (submit, claim, heartbeat, complete/fail, cancel, requeue)
+    is one WATCH/MULTI/EXEC transaction that rereads the task's state, like
+    the SQLite broker's transactions: a claim pops the queue, takes the lease
+    and marks the task claimed in one step, so a worker dying halfway loses
+    nothing, and a cancel between a check and a write makes the writer retry
+    and see it.
+    """
+
+    # finished task records expire on their own if the submitter never reads them
+    FINISHED_TTL = 24 * 60 * 60
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, prefix="capstone:broker:"):
+        self.client = RespClient(host, port, db=db, password=password)
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    def _hash(self, values):
+        args = []
+        for name, value in values.items():
+            if name in ("params", "result", "progress"):
+                value = json.dumps(value)
+            args += [name, "" if value is None else value]
+        return args
+
+    @staticmethod
+    def _parse(flat):
+        if not flat:
+            return None
+        raw = dict(zip(flat[::2], flat[1::2]))
+        task = {name: (raw.get(name) or None) for name in _new_task("", None)}
+        for name in ("params", "result", "progress"):
+            task[name] = json.loads(task[name]) if task[name] else None
+        for name in ("lease_until", "created_at", "updated_at"):
+            task[name] = float(task[name]) if task[name] else None
+        task["attempts"] = int(task["attempts"] or 0)
+        return task
+
+    def submit(self, kind, params):
+        task = _new_task(kind, params)
+        commands = [
+            ("HSET", self._key("task", task["id"]), *self._hash(task)),
+            ("SADD", self._key("kinds"), kind),
+            ("RPUSH", self._key("queue", kind), task["id"]),
+        ]
+        return self.client.transaction(lambda call: (commands, task["id"]))
+
+    def claim(self, kinds, worker_id):
+        for kind in kinds:
+            queue = self._key("queue", kind)
+
+            def take(call):
+                call("WATCH", queue)
+                task_id = call("LINDEX", queue, 0)
+                if task_id is None:
+                    return [], None
+                key = self._key("task", task_id)
+                call("WATCH", key)
+                if call("HGET", key, "state") != QUEUED:
+                    # cancelled (or forgotten) while queued: drop it and look at the next one
+                    return [("LPOP", queue)], False
+                now = time.time()
+                return [
+                    ("LPOP", queue),
+                    ("ZADD", self._key("leases"), now + LEASE_SECONDS, task_id),
+                    ("HSET", key, "state", CLAIMED, "worker", worker_id, "lease_until", now + LEASE_SECONDS, "updated_at", now),
+                    ("HINCRBY", key, "attempts", 1),
+                ], task_id
+
+            while True:
+                task_id = self.client.transaction(take)
+                if task_id is None:
+                    break
+                if task_id:
+                    return self.get(task_id)
+        return None
+
+    def _update_owned(self, task_id, worker_id, commands):
+        """Run `commands(key)` as one step if `worker_id` still holds the claim on the task; returns whether it did."""
+        key = self._key("task", task_id)
+
+        def update(call):
+            call("WATCH", key)
+            state, worker = call("HMGET", key, "state", "worker")
+            if state != CLAIMED or worker != worker_id:
+                return [], False
+            return commands(key), True
+
+        return self.client.transaction(update)
+
+    def heartbeat(self, task_id, worker_id, progress=None):
+        lease_until = time.time() + LEASE_SECONDS
+        fields = {"lease_until": lease_until, "updated_at": time.time()}
+        if progress:
+            fields["progress"] = progress
+        return self._update_owned(
+            task_id,
+            worker_id,
+            lambda key: [("ZADD", self._key("leases"), lease_until, task_id), ("HSET", key, *self._hash(fields))],
+        )
+
+    def _finish(self, task_id, worker_id, fields):
+        fields = self._hash(dict(fields, lease_until=None, updated_at=time.time()))
+        return self._update_owned(
+            task_id,
+            worker_id,
+            lambda key: [
+                ("HSET", key, *fields),
+                ("ZREM", self._key("leases"), task_id),
+                ("EXPIRE", key, self.FINISHED_TTL),
+            ],
+        )
+
+    def complete(self, task_id, worker_id, result):
+        return self._finish(task_id, worker_id, {"state": DONE, "result": result})
+
+    def fail(self, task_id, worker_id, error):
+        return self._finish(task_id, worker_id, {"state": FAILED, "error": error})
+
+    def cancel(self, task_id):
+        key = self._key("task", task_id)
+
+        def cancel(call):
+            call("WATCH", key)
+            kind, state = call("HMGET", key, "kind", "state")
+            if state is None or state in TERMINAL_STATES:
+                return [], None
+            return [
+                ("HSET", key, "state", CANCELLED, "error", "cancelled", "lease_until", "", "updated_at", time.time()),
+                ("LREM", self._key("queue", kind), 0, task_id),
+                ("ZREM", self._key("leases"), task_id),
+                ("EXPIRE", key, self.FINISHED_TTL),
+            ], None
+
+        self.client.transaction(cancel)
+
+    def get(self, task_id):
+        return self._parse(self.client.execute("HGETALL", self._key("task", task_id)))
+
+    def forget(self, task_id):
+        self.client.execute("DEL", self._key("task", task_id))
+
+    def requeue_expired(self):
+        leases = self._key("leases")
+
+        def requeue(call, task_id):
+            key = self._key("task", task_id)
+            call("WATCH", key)
+            task = self._parse(call("HGETALL", key))
+            now = time.time()
+            if task is None or task["state"] != CLAIMED:
+                # finished, cancelled or forgotten: only the lease entry is left
+                return [("ZREM", leases, task_id)], False
+            if task["lease_until"] is not None and task["lease_until"] > now:
+                # heartbeated since the range was read
+                return [], False
+            if task["attempts"] >= MAX_ATTEMPTS:
+                return [
+                    ("HSET", key, "state", FAILED, "error", f"worker lost {task['attempts']} times", "lease_until", "", "updated_at", now),
+                    ("ZREM", leases, task_id),
+                    ("EXPIRE", key, self.FINISHED_TTL),
+                ], True
+            return [
+                ("HSET", key, "state", QUEUED, "worker", "", "lease_until", "", "updated_at", now),
+                ("ZREM", leases, task_id),
+                ("RPUSH", self._key("queue", task["kind"]), task_id),
+            ], True
+
+        expired = []
+        for task_id in self.client.execute("ZRANGEBYSCORE", leases, "-inf", time.time()):
+            # concurrent sweeps both watch the task; whichever commits second rereads it as no longer claimed
+            if self.client.transaction(lambda call: requeue(call, task_id)):
+                expired.append(task_id)
+        return expired
+
+    def touch_worker(self, worker_id, info):
+        self.client.execute("HSET", self._key("workers"), worker_id, json.dumps(dict(info, last_seen=time.time())))
+
+    def workers(self):
+        flat = self.client.execute("HGETALL", self._key("workers")) or []
+        now = time.time()
+        live = {}
+        for worker_id, raw in zip(flat[::2], flat[1::2]):
+            info = json.loads(raw)
+            if now - info["last_seen"] < WORKER_TTL:
+                live[worker_id] = info
+        return live
+
+    def queue_lengths(self):
+        kinds = self.client.execute("SMEMBERS", self._key("kinds")) or []
+        return {kind: self.client.execute("LLEN", self._key("queue", kind)) for kind in kinds}
+
+    def close(self):
+        self.client.close()
+
+
+def open_broker(url):
+    """Create the broker described by `url` (see the module docstring)."""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return InProcessBroker()
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path, like SQLAlchemy
+        return SQLiteBroker(parsed.path[1:] if parsed.path.startswith("/") else parsed.path)
+    if parsed.scheme == "redis":
+        db = int(parsed.path.strip("/") or 0)
+        return RedisBroker(parsed.hostname or "localhost", parsed.port or 6379, db=db, password=parsed.password)
+    raise ValueError(f"unsupported broker url: {url!r}")
+
+
+def broker_description(url):
+    """`url` without credentials, for logs."""
+    parsed = urlparse(url)
+    if parsed.password:
+        return url.replace(f":{parsed.password}@", ":***@")
+    return url
+
@@ -0,0 +1,187 @@
+"""Inference node that pulls TTS or lipsync tasks from the job broker (see broker.py).
+
+Runs a local WorkerPool of resident `worker.py` processes and, for every
+pool slot, a thread that claims a task, runs it on the pool and heartbeats
+while it runs. Inputs are read from and outputs written to the shared runs
+directory, mounted on this host at `--storage-root`. LatentSync's scratch
+files stay on local disk.
+
+    python broker_worker.py --broker sqlite:////mnt/shared/broker.sqlite3 \\
+        --kind lipsync --storage-root /mnt/shared/runs --workers 1
+
+A task whose heartbeat is refused (cancelled by the API, or requeued because
+this node was presumed dead) has its worker killed, like a cancelled job in
+the local pool. If this process dies, its tasks are requeued by the API once
+their leases run out.
+"""
+import argparse
+import concurrent.futures
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from broker import HEARTBEAT_INTERVAL, broker_description, from_storage, open_broker, to_storage
+from worker_pool import WorkerPool
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# working directory of worker.py per kind (LatentSync resolves configs/ and checkpoints/ relative to it)
+KIND_CWD = {"tts": BACKEND_DIR, "lipsync": os.path.join(BACKEND_DIR, "latentsync")}
+# how long an idle slot waits before asking the broker again
+IDLE_POLL_SECONDS = 1.0
+# how often a running task is checked for new progress, which is forwarded ahead of the next heartbeat
+PROGRESS_POLL_SECONDS = 0.5
+
+
+class BrokerWorker:
+    """Feeds broker tasks of `pool.kind` to `pool`, one claim loop per pool slot."""
+
+    def __init__(self, broker, pool, storage_root, worker_id=None, scratch_dir=None):
+        self.broker = broker
+        self.pool = pool
+        self.storage_root = storage_root
+        self.worker_id = worker_id or f"{socket.gethostname()}-{pool.kind}-{uuid.uuid4().hex[:8]}"
+        self.scratch_dir = scratch_dir or tempfile.gettempdir()
+        self.stopped = threading.Event()
+        self.running = {}
+        self.tasks_done = 0
+        self.tasks_failed = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._announce_forever, daemon=True, name=f"{self.worker_id}-announce").start()
+        for slot in range(self.pool.size):
+            threading.Thread(target=self._claim_forever, daemon=True, name=f"{self.worker_id}-slot{slot}").start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _info(self):
+        with self._lock:
+            running = list(self.running)
+        return {
+            "kinds": [self.pool.kind],
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "slots": self.pool.size,
+            "ready": self.pool.ready,
+            "running": running,
+            "tasks_done": self.tasks_done,
+            "tasks_failed": self.tasks_failed,
+        }
+
+    def _announce_forever(self):
+        while not self.stopped.is_set():
+            try:
+                self.broker.touch_worker(self.worker_id, self._info())
+            except Exception:
+                logging.exception("[broker-worker] heartbeat to the broker failed")
+            self.stopped.wait(HEARTBEAT_INTERVAL)
+
+    def _claim_forever(self):
+        while not self.stopped.is_set():
+            if not self.pool.ready:
+                # do not take work that would sit behind a model still warming up
+                self.stopped.wait(IDLE_POLL_SECONDS)
+                continue
+            try:
+                task = self.broker.claim([self.pool.kind], self.worker_id)
+            except Exception:
+                logging.exception("[broker-worker] claim failed")
+                task = None
+            if task is None:
+                self.stopped.wait(IDLE_POLL_SECONDS)
+                continue
+            self._run(task)
+
+    def _run(self, task):
+        task_id = task["id"]
+        logging.info("[broker-worker] %s claimed %s task %s (attempt %d)", self.worker_id, task["kind"], task_id, task["attempts"])
+        params = from_storage(task["params"], self.storage_root)
+        scratch = None
+        if "temp_dir" in params:
+            # scratch files do not need to go through shared storage
+            scratch = os.path.join(self.scratch_dir, f"broker-{task_id}")
+            params["temp_dir"] = scratch
+        progress = {}
+        # progress as of the last heartbeat, and when that was
+        sent = [None, time.time()]
+
+        def on_progress(message):
+            progress.update({k: v for k, v in message.items() if k not in ("id", "event")})
+
+        with self._lock:
+            self.running[task_id] = time.time()
+        future = self.pool.submit(params, on_progress=on_progress)
+        try:
+            while True:
+                try:
+                    result = future.result(timeout=PROGRESS_POLL_SECONDS)
+                except concurrent.futures.TimeoutError:
+                    current = dict(progress)
+                    if current == sent[0] and time.time() - sent[1] < HEARTBEAT_INTERVAL:
+                        continue
+                    if not self.broker.heartbeat(task_id, self.worker_id, current):
+                        logging.warning("[broker-worker] task %s was cancelled or reassigned; stopping it", task_id)
+                        self.pool.cancel(future)
+                        return
+                    sent[:] = [current, time.time()]
+                    continue
+                except Exception as e:
+                    self.tasks_failed += 1
+                    self.broker.fail(task_id, self.worker_id, f"{type(e).__name__}: {e}")
+                    return
+                break
+            self.tasks_done += 1
+            self.broker.complete(task_id, self.worker_id, to_storage(result, self.storage_root))
+        except Exception:
+            logging.exception("[broker-worker] lost contact with the broker while running task %s", task_id)
+            self.pool.cancel(future)
+        finally:
+            with self._lock:
+                self.running.pop(task_id, None)
+            if scratch is not None:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull F5-TTS / LatentSync tasks from the job broker")
+    parser.add_argument("--broker", default=os.environ.get("BROKER_URL"), help="broker url (see broker.py); default $BROKER_URL")
+    parser.add_argument("--kind", choices=sorted(KIND_CWD), required=True)
+    parser.add_argument("--storage-root", default=os.environ.get("RUNS_ROOT", os.path.join(BACKEND_DIR, "runs")),
+                        help="where the shared runs directory is mounted on this host")
+    parser.add_argument("--workers", type=int, default=1, help="resident worker processes (concurrent tasks)")
+    parser.add_argument("--python", default=sys.executable, help="interpreter for worker.py (e.g. LatentSync's venv)")
+    parser.add_argument("--scratch-dir", default=None, help="local directory for LatentSync scratch files")
+    args = parser.parse_args()
+    if not args.broker:
+        parser.error("--broker (or BROKER_URL) is required")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    broker = open_broker(args.broker)
+    pool = WorkerPool(args.kind, args.python, KIND_CWD[args.kind], size=args.workers)
+    pool.start()
+    node = BrokerWorker(broker, pool, args.storage_root, scratch_dir=args.scratch_dir).start()
+    logging.info(
+        "[broker-worker] %s serving %s tasks from %s (storage root %s)",
+        node.worker_id, args.kind, broker_description(args.broker), args.storage_root,
+    )
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.stop()
+        pool.shutdown()
+        broker.close()
+
+
+if __name__ == "__main__":
+    main()
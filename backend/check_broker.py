@@ -0,0 +1,285 @@
+"""Check the job brokers (broker.py) against the lifecycle main.py and broker_worker.py rely on.
+
+Runs the same scenarios on every implementation: `memory://`, SQLite in a
+temporary file and Redis, by default on resp_server.py started in this
+process (`--redis-url` points it at a real server instead):
+
+* submit and claim: oldest task first, only of the claimed kinds
+* heartbeat, complete and fail: only by the worker holding the claim
+* cancel: of a queued task (never claimed) and of a claimed one (its
+  heartbeat and complete return False and the task stays cancelled)
+* cancel during claim: a cancel() racing each claim() always wins over the
+  worker's later complete()
+* lease expiry: a task whose worker stops heartbeating is requeued by
+  requeue_expired() and claimed by another worker, a heartbeating one is
+  not, and after MAX_ATTEMPTS lost workers the task fails
+* races: worker threads claim and complete tasks while other threads cancel
+  them and sweep expired leases. Every task must end in exactly one terminal
+  state that matches what its calls returned, and none may be left queued.
+
+Prints one line per scenario and broker and exits non-zero on any failure.
+
+    python check_broker.py
+    python check_broker.py --brokers redis --redis-url redis://localhost:6379/15 --tasks 500
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import broker
+from resp_server import RespServer
+
+
+class CheckFailed(AssertionError):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def check_claim(b):
+    first = b.submit("tts", {"n": 1})
+    second = b.submit("tts", {"n": 2})
+    other = b.submit("lipsync", {"n": 3})
+    expect(b.queue_lengths().get("tts") == 2, f"queue lengths {b.queue_lengths()}")
+    expect(b.claim(["ffmpeg"], "w1") is None, "claimed a task of a kind nobody submitted")
+    task = b.claim(["tts"], "w1")
+    expect(task is not None and task["id"] == first, "did not claim the oldest task")
+    expect(task["state"] == broker.CLAIMED and task["worker"] == "w1" and task["attempts"] == 1, f"claimed task {task}")
+    expect(task["params"] == {"n": 1}, f"params {task['params']}")
+    expect(b.claim(["tts"], "w2")["id"] == second, "second claim did not get the next task")
+    expect(b.claim(["tts"], "w3") is None, "claimed from an empty queue")
+    expect(b.claim(["tts", "lipsync"], "w3")["id"] == other, "did not fall through to the next kind")
+
+
+def check_finish(b):
+    task_id = b.submit("tts", {})
+    b.claim(["tts"], "w1")
+    expect(b.heartbeat(task_id, "w1", {"window": 1}), "heartbeat of the claiming worker refused")
+    expect(b.get(task_id)["progress"] == {"window": 1}, "progress not recorded")
+    expect(not b.heartbeat(task_id, "w2"), "heartbeat of another worker accepted")
+    expect(not b.complete(task_id, "w2", {"x": 1}), "complete by another worker accepted")
+    expect(b.complete(task_id, "w1", {"out": "a.wav"}), "complete refused")
+    task = b.get(task_id)
+    expect(task["state"] == broker.DONE and task["result"] == {"out": "a.wav"}, f"completed task {task}")
+    expect(not b.fail(task_id, "w1", "late"), "fail after complete accepted")
+    failed = b.submit("tts", {})
+    b.claim(["tts"], "w1")
+    expect(b.fail(failed, "w1", "boom"), "fail refused")
+    expect(b.get(failed)["state"] == broker.FAILED and b.get(failed)["error"] == "boom", "failed task")
+    b.forget(task_id)
+    expect(b.get(task_id) is None, "forgotten task still there")
+
+
+def check_cancel(b):
+    queued = b.submit("tts", {})
+    b.cancel(queued)
+    expect(b.get(queued)["state"] == broker.CANCELLED, "queued task not cancelled")
+    expect(b.claim(["tts"], "w1") is None, "claimed a cancelled task")
+    claimed = b.submit("tts", {})
+    b.claim(["tts"], "w1")
+    b.cancel(claimed)
+    expect(not b.heartbeat(claimed, "w1"), "heartbeat of a cancelled task accepted")
+    expect(not b.complete(claimed, "w1", {}), "complete of a cancelled task accepted")
+    expect(b.get(claimed)["state"] == broker.CANCELLED, "cancelled task changed state")
+    expect(b.requeue_expired() == [], "requeued a cancelled task")
+
+
+def check_leases(b, lease):
+    lost = b.submit("tts", {})
+    kept = b.submit("tts", {})
+    b.claim(["tts"], "w1")
+    b.claim(["tts"], "w2")
+    deadline = time.time() + 2 * lease
+    while time.time() < deadline:
+        b.heartbeat(kept, "w2")
+        time.sleep(lease / 4)
+    expect(b.requeue_expired() == [lost], "expired lease not requeued (or a live one was)")
+    expect(b.get(lost)["state"] == broker.QUEUED, "requeued task not queued")
+    expect(b.get(kept)["state"] == broker.CLAIMED, "heartbeating task lost its claim")
+    task = b.claim(["tts"], "w3")
+    expect(task is not None and task["id"] == lost and task["attempts"] == 2, f"requeued task claimed as {task}")
+    expect(not b.complete(lost, "w1", {}), "the lost worker completed a requeued task")
+    expect(b.complete(lost, "w3", {}), "the new worker could not complete")
+    expect(b.complete(kept, "w2", {}), "the heartbeating worker could not complete")
+
+    doomed = b.submit("tts", {})
+    for attempt in range(1, broker.MAX_ATTEMPTS + 1):
+        expect(b.claim(["tts"], f"w{attempt}")["id"] == doomed, f"attempt {attempt} did not claim the task")
+        time.sleep(lease * 1.5)
+        expect(b.requeue_expired() == [doomed], f"attempt {attempt} not expired")
+    task = b.get(doomed)
+    expect(task["state"] == broker.FAILED and "lost" in task["error"], f"task after {broker.MAX_ATTEMPTS} lost workers: {task}")
+    expect(b.claim(["tts"], "w9") is None, "claimed a failed task")
+
+
+def check_cancel_claim(b, tasks):
+    """Cancel each task while a worker claims it; the worker completes only once cancel() returned."""
+    done = 0
+    for _ in range(tasks):
+        task_id = b.submit("contended", {})
+        start, cancelled = threading.Barrier(2), threading.Event()
+
+        def cancel():
+            start.wait()
+            b.cancel(task_id)
+            cancelled.set()
+
+        canceller = threading.Thread(target=cancel)
+        canceller.start()
+        start.wait()
+        task = b.claim(["contended"], "w1")
+        cancelled.wait()
+        if task is not None and b.complete(task_id, "w1", {}):
+            done += 1
+        canceller.join()
+        expect(b.get(task_id)["state"] == broker.CANCELLED, f"task cancelled during its claim ended {b.get(task_id)['state']}")
+    expect(done == 0, f"{done} tasks completed after they were cancelled")
+    expect(b.claim(["contended"], "w1") is None, "a cancelled task is still queued")
+
+
+def check_races(b, tasks, lease):
+    ids = [b.submit("race", {"n": n}) for n in range(tasks)]
+    completed, claims, errors = set(), {}, []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def work(worker_id):
+        rng = random.Random(worker_id)
+        try:
+            while not stop.is_set():
+                task = b.claim(["race"], worker_id)
+                if task is None:
+                    time.sleep(0.001)
+                    continue
+                with lock:
+                    claims[task["id"]] = claims.get(task["id"], 0) + 1
+                if rng.random() < 0.1:
+                    continue  # "crash": never heartbeat, the sweeper requeues it
+                b.heartbeat(task["id"], worker_id)
+                if b.complete(task["id"], worker_id, {"by": worker_id}):
+                    with lock:
+                        completed.add(task["id"])
+        except Exception as e:  # noqa: BLE001 - reported below
+            errors.append(e)
+
+    def cancel():
+        rng = random.Random(0)
+        try:
+            for task_id in rng.sample(ids, len(ids) // 3):
+                b.cancel(task_id)
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    def sweep():
+        try:
+            while not stop.is_set():
+                b.requeue_expired()
+                time.sleep(lease / 4)
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    threads += [threading.Thread(target=cancel), threading.Thread(target=sweep), threading.Thread(target=sweep)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 30 + tasks * lease
+    while time.time() < deadline:
+        states = [b.get(task_id)["state"] for task_id in ids]
+        if all(state in broker.TERMINAL_STATES for state in states) or errors:
+            break
+        time.sleep(lease)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    expect(not errors, f"{len(errors)} calls raised, e.g. {errors[:1]!r}")
+
+    tasks_by_state = {}
+    for task_id in ids:
+        task = b.get(task_id)
+        tasks_by_state.setdefault(task["state"], []).append(task_id)
+        if task_id in completed:
+            expect(task["state"] == broker.DONE, f"complete() returned True but the task is {task['state']}")
+        else:
+            expect(task["state"] != broker.DONE, "task is done but no complete() succeeded")
+        expect(task["attempts"] == claims.get(task_id, 0), f"{task['attempts']} attempts recorded, {claims.get(task_id, 0)} claims seen")
+    stuck = {state: len(found) for state, found in tasks_by_state.items() if state not in broker.TERMINAL_STATES}
+    expect(not stuck, f"tasks left unfinished: {stuck}")
+    return {state: len(found) for state, found in tasks_by_state.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--brokers", default="memory,sqlite,redis", help="comma-separated, of memory, sqlite, redis")
+    parser.add_argument("--redis-url", help="a Redis server to use (default: resp_server.py on a free local port)")
+    parser.add_argument("--tasks", type=int, default=200, help="tasks in the race scenario")
+    parser.add_argument("--lease", type=float, default=0.2, help="seconds; replaces broker.LEASE_SECONDS for the run")
+    args = parser.parse_args()
+
+    broker.LEASE_SECONDS = args.lease
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.brokers.split(","):
+            if name == "redis" and not args.redis_url:
+                port = free_port()
+                RespServer("127.0.0.1", port).start()
+                url = f"redis://127.0.0.1:{port}/0"
+            else:
+                url = {
+                    "memory": "memory://",
+                    "sqlite": "sqlite:///" + os.path.join(tmp, "broker.db"),
+                    "redis": args.redis_url,
+                }[name]
+            scenarios = [
+                ("claim", check_claim),
+                ("finish", check_finish),
+                ("cancel", check_cancel),
+                ("cancel during claim", lambda b: check_cancel_claim(b, args.tasks)),
+                ("leases", lambda b: check_leases(b, args.lease)),
+                ("races", lambda b: check_races(b, args.tasks, args.lease)),
+            ]
+            for scenario, check in scenarios:
+                # a fresh key prefix / database per scenario so their queues don't mix
+                if name == "redis":
+                    parsed = urlparse(url)
+                    b = broker.RedisBroker(
+                        parsed.hostname or "localhost",
+                        parsed.port or 6379,
+                        db=int(parsed.path.strip("/") or 0),
+                        password=parsed.password,
+                        prefix=f"check:{os.getpid()}:{scenario.replace(' ', '_')}:",
+                    )
+                elif name == "sqlite":
+                    b = broker.open_broker(url.replace("broker.db", f"{scenario.replace(' ', '_')}.db"))
+                else:
+                    b = broker.open_broker(url)
+                start = time.perf_counter()
+                try:
+                    outcome = check(b)
+                except CheckFailed as e:
+                    failed = True
+                    print(f"{name:7s} {scenario:19s} FAILED: {e}")
+                else:
+                    extra = f"  {outcome}" if outcome else ""
+                    print(f"{name:7s} {scenario:19s} ok ({time.perf_counter() - start:.1f}s){extra}")
+                finally:
+                    b.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
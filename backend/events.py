@@ -0,0 +1,71 @@
+"""Per-job event fan-out for the `/api/jobs/{job_id}/events` SSE stream.
+
+Jobs run as coroutines on the asyncio loop that also serves the SSE
+responses, but not every event starts there: the progress callbacks of the
+resident worker pools (worker_pool.py) are called from their dispatcher
+threads, and broker progress may be forwarded from other threads too. So
+`publish()` may be called from any thread and hands each event to the
+subscriber's loop with `call_soon_threadsafe`. Events are small dicts
+`{"event": name, "data": {...}}`:
+
+* `state`    - job state/stage changed (`{"state", "stage", "error"}`)
+* `progress` - in-stage progress, e.g. `{"stage": "lipsync", "window": 3, "windows": 12}`
+* `artifact` - an output was published and can be downloaded (`{"name", "url"}`)
+
+The last progress event of each running job is kept so a client that
+connects mid-stage starts from the current position.
+"""
+import asyncio
+import collections
+import json
+import threading
+
+
+def format_sse(event):
+    """Encode one event as a server-sent-events message."""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class EventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # job_id -> list of (loop, asyncio.Queue)
+        self._subscribers = collections.defaultdict(list)
+        self._last_progress = {}
+
+    def subscribe(self, job_id):
+        """Register a queue on the running loop that receives `job_id`'s events."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[job_id].append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(job_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[job_id] = subscribers
+            else:
+                self._subscribers.pop(job_id, None)
+
+    def publish(self, job_id, event, data):
+        """Deliver an event to every current subscriber of `job_id`. Safe from any thread."""
+        message = {"event": event, "data": data}
+        with self._lock:
+            if event == "progress":
+                self._last_progress[job_id] = message
+            elif event == "state":
+                last = self._last_progress.get(job_id)
+                if last is not None and last["data"].get("stage") != data.get("stage"):
+                    del self._last_progress[job_id]
+            subscribers = list(self._subscribers.get(job_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # the subscriber's loop is closed; it will unsubscribe itself
+                pass
+
+    def last_progress(self, job_id):
+        with self._lock:
+            return self._last_progress.get(job_id)
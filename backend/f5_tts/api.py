@@ -1,5 +1,6 @@
 import random
 import sys
+import time
 from importlib.resources import files
 
 import soundfile as sf
@@ -8,17 +9,25 @@ import tqdm
 from cached_path import cached_path
 
 from f5_tts.infer.utils_infer import (
+    add_timing,
+    build_voice_profile,
     hop_length,
+    infer_long_form_process,
     infer_process,
+    infer_stream_process,
     load_model,
     load_vocoder,
-    preprocess_ref_audio_text,
-    remove_silence_for_generated_wav,
+    remove_silence_from_wave,
     save_spectrogram,
     load_duration_model,
     target_sample_rate,
+    voice_cond,
 )
+from f5_tts.infer.onnx_backend import OnnxTransformer, OnnxVocos, export_onnx, has_onnx_export
+from f5_tts.infer.precision import apply_precision
+from f5_tts.infer.voice_store import VoiceStore, voice_id as compute_voice_id
 from f5_tts.model import DiT, UNetT
+from f5_tts.model.compiled import DEFAULT_BUCKETS
 from f5_tts.model.utils import seed_everything
 
 
@@ -36,6 +45,14 @@ class F5TTS:
         duration_model=True,
         duration_model_path=None,
         device=None,
+        voice_dir=None,
+        voice_max_bytes=None,
+        voice_ttl=None,
+        compile_buckets=None,
+        compile_dir=None,
+        precision=None,
+        backend="torch",
+        onnx_dir=None,
     ):
         # Initialize parameters
         self.final_wave = None
@@ -50,14 +67,34 @@ class F5TTS:
         )
 
         if duration_model:
-            self.duration_model = load_duration_model(cache_dir=duration_model_path)
+            self.duration_model = load_duration_model(cache_dir=duration_model_path, device=self.device)
         else:
             self.duration_model = None
 
+        # Preprocessed reference voices, on disk under voice_dir (None: in memory only), evicted by
+        # least recent use past voice_max_bytes and voice_ttl seconds (None: unbounded)
+        self.voices = VoiceStore(voice_dir, max_bytes=voice_max_bytes, ttl=voice_ttl)
+
         # Load models
         self.load_vocoder_model(vocoder_name, local_path=vocos_local_path)
         self.load_ema_model(model_type, ckpt_file, vocoder_name, vocab_file, ode_method, use_ema, local_path=model_local_path)
 
+        # CPU only: "int8" (dynamic quantization) or "bf16" (autocast) for the transformer and Vocos, see precision.py
+        self.precision = precision
+        if precision is not None:
+            self.precision = apply_precision(self.ema_model, self.vocoder, precision, self.device, vocoder_name)
+
+        # "onnx": sample and vocode with onnxruntime, exported to onnx_dir on first use (see onnx_backend.py)
+        self.backend = backend
+        if backend == "onnx":
+            self.use_onnx(onnx_dir)
+        elif backend != "torch":
+            raise ValueError(f"Unknown backend {backend!r}, expected 'torch' or 'onnx'")
+
+        # Compiled sampling for these length buckets (True: DEFAULT_BUCKETS), kernels cached in compile_dir
+        if compile_buckets:
+            self.compile_sampling(DEFAULT_BUCKETS if compile_buckets is True else compile_buckets, compile_dir)
+
     def load_vocoder_model(self, vocoder_name, local_path):
         self.vocoder = load_vocoder(vocoder_name, local_path is not None, local_path, self.device)
 
@@ -82,11 +119,59 @@ class F5TTS:
             model_cls, model_cfg, ckpt_file, mel_spec_type, vocab_file, ode_method, use_ema, self.device
         )
 
-    def export_wav(self, wav, file_wave, remove_silence=False):
-        sf.write(file_wave, wav, self.target_sample_rate)
+    def compile_sampling(self, buckets=DEFAULT_BUCKETS, cache_dir=None, show_info=print):
+        """Compile the transformer for each length bucket now (see CFM.compile_sampling).
+
+        Later generations pad every chunk up to its bucket and reuse these
+        graphs; chunks longer than the largest bucket run eagerly.
+        """
+        warmup = self.ema_model.compile_sampling(buckets, cache_dir=cache_dir)
+        for (bucket, _), seconds in warmup.items():
+            show_info(f"compiled sampling for {bucket} frames in {seconds:.1f}s")
+        return warmup
+
+    def use_onnx(self, onnx_dir, threads=None, show_info=print):
+        """Run the transformer and Vocos through onnxruntime from now on (CPU, DiT with Vocos, full precision).
+
+        The graphs in `onnx_dir` must come from this checkpoint; they are
+        exported there first if the directory has none.
+        """
+        if self.device != "cpu" or self.mel_spec_type != "vocos" or self.precision not in (None, "fp32"):
+            raise ValueError("The onnx backend runs the DiT and Vocos in fp32 on the cpu")
+        if not has_onnx_export(onnx_dir):
+            show_info(f"Exporting the model to ONNX in {onnx_dir}")
+            export_onnx(self.ema_model, self.vocoder, onnx_dir)
+        self.ema_model.onnx = OnnxTransformer(onnx_dir, self.ema_model.transformer.dim, threads)
+        self.vocoder = OnnxVocos(onnx_dir, self.vocoder, threads)
+
+    def add_voice(self, ref_file, ref_text="", show_info=print):
+        """Preprocess a reference recording once and store it; returns its voice id.
+
+        Pass the id as `voice_id` to infer()/infer_stream() to skip clipping,
+        transcription and the reference mel. A reference that is already
+        stored (same file content and `ref_text`) is not processed again.
+        """
+        voice_id = compute_voice_id(ref_file, ref_text)
+        if voice_id not in self.voices:
+            self.voices.save(build_voice_profile(voice_id, ref_file, ref_text, show_info=show_info, device=self.device))
+        return voice_id
+
+    def get_voice(self, ref_file=None, ref_text="", voice_id=None, target_rms=0.1, show_info=print):
+        """The stored profile for `voice_id`, or for `ref_file` (added on first use), with its cond mel ready."""
+        if voice_id is None:
+            voice_id = self.add_voice(ref_file, ref_text or "", show_info=show_info)
+        voice = self.voices.get(voice_id)
+        if voice is None:
+            raise KeyError(f"Unknown voice id: {voice_id}")
+        if voice.cond(self.mel_spec_type, target_rms) is None:
+            voice_cond(voice, self.ema_model, self.mel_spec_type, target_rms, self.device)
+            self.voices.save(voice)
+        return voice
 
+    def export_wav(self, wav, file_wave, remove_silence=False):
         if remove_silence:
-            remove_silence_for_generated_wav(file_wave)
+            wav = remove_silence_from_wave(wav, self.target_sample_rate)
+        sf.write(file_wave, wav, self.target_sample_rate)
 
     def export_spectrogram(self, spect, file_spect):
         save_spectrogram(spect, file_spect)
@@ -109,17 +194,27 @@ class F5TTS:
         file_wave=None,
         file_spect=None,
         seed=-1,
+        timings=None,
+        batch_chunks=False,
+        max_batch_frames=None,
+        voice_id=None,
     ):
+        """Synthesize `gen_text` in the voice of `ref_file` (transcribed if `ref_text` is empty),
+        or of the stored voice `voice_id` (see add_voice), in which case `ref_file` and
+        `ref_text` are not used. Returns (wave, sample rate, spectrogram).
+        """
         if seed == -1:
             seed = random.randint(0, sys.maxsize)
         seed_everything(seed)
         self.seed = seed
 
-        ref_file, ref_text = preprocess_ref_audio_text(ref_file, ref_text, device=self.device)
+        start = time.perf_counter()
+        voice = self.get_voice(ref_file, ref_text, voice_id, target_rms, show_info=show_info)
+        add_timing(timings, "tts_ref_preprocess", start)
 
         wav, sr, spect = infer_process(
-            ref_file,
-            ref_text,
+            voice,
+            voice.ref_text,
             gen_text,
             self.ema_model,
             self.vocoder,
@@ -135,6 +230,9 @@ class F5TTS:
             speed=speed,
             fix_duration=fix_duration,
             device=self.device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
         )
 
         if file_wave is not None:
@@ -145,6 +243,126 @@ class F5TTS:
 
         return wav, sr, spect
 
+    def infer_stream(
+        self,
+        ref_file,
+        ref_text,
+        gen_text,
+        show_info=print,
+        progress=tqdm,
+        target_rms=0.1,
+        cross_fade_duration=0.15,
+        sway_sampling_coef=-1,
+        cfg_strength=2,
+        nfe_step=32,
+        speed=1.0,
+        fix_duration=None,
+        seed=-1,
+        timings=None,
+        batch_chunks=False,
+        max_batch_frames=None,
+        voice_id=None,
+    ):
+        """Generator form of infer(): yields waveform blocks (numpy, at self.target_sample_rate)
+        as soon as each text chunk is synthesized, instead of the whole wave at the end.
+
+        The blocks concatenate to the wave infer() returns for the same seed;
+        only the cross-fade tail of each chunk waits for the next one. Silence
+        removal and the spectrogram need the whole wave and are not offered.
+        """
+        if seed == -1:
+            seed = random.randint(0, sys.maxsize)
+        seed_everything(seed)
+        self.seed = seed
+
+        start = time.perf_counter()
+        voice = self.get_voice(ref_file, ref_text, voice_id, target_rms, show_info=show_info)
+        add_timing(timings, "tts_ref_preprocess", start)
+
+        yield from infer_stream_process(
+            voice,
+            voice.ref_text,
+            gen_text,
+            self.ema_model,
+            self.vocoder,
+            self.duration_model,
+            self.mel_spec_type,
+            show_info=show_info,
+            progress=progress,
+            target_rms=target_rms,
+            cross_fade_duration=cross_fade_duration,
+            nfe_step=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            speed=speed,
+            fix_duration=fix_duration,
+            device=self.device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+        )
+
+    def infer_long_form(
+        self,
+        ref_file,
+        ref_text,
+        gen_text,
+        file_wave,
+        show_info=print,
+        progress=tqdm,
+        target_rms=0.1,
+        cross_fade_duration=0.15,
+        sway_sampling_coef=-1,
+        cfg_strength=2,
+        nfe_step=32,
+        speed=1.0,
+        fix_duration=None,
+        seed=-1,
+        timings=None,
+        batch_chunks=False,
+        max_batch_frames=None,
+        voice_id=None,
+    ):
+        """infer() for scripts of any length (audiobooks): the wave goes straight into the WAV
+        `file_wave` as chunks finish, so memory does not grow with the script.
+
+        There is no spectrogram and no silence removal. Returns (file_wave,
+        sample rate, number of samples).
+        """
+        if seed == -1:
+            seed = random.randint(0, sys.maxsize)
+        seed_everything(seed)
+        self.seed = seed
+
+        start = time.perf_counter()
+        voice = self.get_voice(ref_file, ref_text, voice_id, target_rms, show_info=show_info)
+        add_timing(timings, "tts_ref_preprocess", start)
+
+        samples = infer_long_form_process(
+            voice,
+            voice.ref_text,
+            gen_text,
+            self.ema_model,
+            self.vocoder,
+            file_wave,
+            self.duration_model,
+            self.mel_spec_type,
+            show_info=show_info,
+            progress=progress,
+            target_rms=target_rms,
+            cross_fade_duration=cross_fade_duration,
+            nfe_step=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            speed=speed,
+            fix_duration=fix_duration,
+            device=self.device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+        )
+        return file_wave, self.target_sample_rate, samples
+
 
 if __name__ == "__main__":
     f5tts = F5TTS()
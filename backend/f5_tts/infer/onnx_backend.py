@@ -0,0 +1,228 @@
+"""ONNX export of F5-TTS and an onnxruntime backend for sampling and vocoding.
+
+export_onnx() writes three graphs to a directory, all with dynamic batch and
+length axes:
+
+* context.onnx: the part of a DiT forward that stays the same across ODE
+  steps (DiT.precompute()): the text embedding plus the cond/text half of the
+  input projection. Inputs: cond (b n 100), text (b n, padded with -1 to the
+  frames) and drop (b, bool: which rows are the null cfg branch).
+* transformer.onnx: one flow prediction from x (b n 100), context, the time
+  and a bool mask (b n). CFM.sample runs its conditional and null branches
+  as the two halves of one 2b batch (fused_cfg), so one call per step serves
+  both.
+* vocos.onnx: the Vocos backbone and head up to the complex spectrum
+  (real, imag). ONNX has no inverse STFT, so Vocos' own ISTFT module turns the
+  spectrum into audio in torch.
+
+OnnxTransformer runs the first two graphs with onnxruntime. With it set as
+CFM.onnx, CFM.sample keeps its own Euler/midpoint loop (torchdiffeq), and
+each step of a branch binds the torch tensors to the session by pointer
+(I/O binding) and writes the prediction into a preallocated tensor, so no
+tensor is copied on the way in or out. OnnxVocos decodes through
+vocos.onnx and can stand in for the Vocos vocoder. F5TTS(backend="onnx")
+sets both up, exporting first if the directory has no graphs yet.
+
+Only the DiT backbone with the Vocos vocoder is supported. Needs onnx,
+onnxscript (export) and onnxruntime.
+"""
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from f5_tts.model import DiT
+
+GRAPHS = ("context.onnx", "transformer.onnx", "vocos.onnx")
+ONNX_TYPES = {torch.float32: np.float32, torch.bool: np.bool_, torch.int64: np.int64}
+
+
+class ContextGraph(nn.Module):
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, cond, text, drop):
+        return self.transformer.precompute(cond, text, drop_audio_cond=drop, drop_text=drop)["context"]
+
+
+class TransformerGraph(nn.Module):
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, x, context, time, mask):
+        cache = {"context": context, "rope": self.transformer.rotary_embed.forward_from_seq_len(x.shape[1])}
+        return self.transformer(
+            x=x, cond=None, text=None, time=time, mask=mask, drop_audio_cond=False, drop_text=False, cache=cache
+        )
+
+
+class VocosGraph(nn.Module):
+    """Vocos.decode up to the ISTFT: ISTFTHead.forward without its last line."""
+
+    def __init__(self, vocos):
+        super().__init__()
+        self.backbone = vocos.backbone
+        self.out = vocos.head.out
+
+    def forward(self, mel):
+        x = self.out(self.backbone(mel)).transpose(1, 2)
+        mag, p = x.chunk(2, dim=1)
+        mag = torch.clip(torch.exp(mag), max=1e2)
+        return mag * torch.cos(p), mag * torch.sin(p)
+
+
+def export_onnx(model, vocoder, out_dir, opset=18):
+    """Write the CFM `model`'s DiT and the Vocos `vocoder` to `out_dir` as GRAPHS (see above)."""
+    if not isinstance(model.transformer, DiT):
+        raise ValueError(f"ONNX export supports the DiT backbone, not {type(model.transformer).__name__}")
+    os.makedirs(out_dir, exist_ok=True)
+    model.eval()
+    batch, frames = torch.export.Dim("batch"), torch.export.Dim("frames", min=2)
+    mel_frames = torch.export.Dim("mel_frames", min=2)
+    n_mels, device = model.num_channels, model.device
+    # example inputs: a 2-row batch (conditional and null branch) of 64 frames
+    cond = torch.randn(2, 64, n_mels, device=device)
+    text = torch.zeros(2, 64, dtype=torch.long, device=device)
+    drop = torch.tensor([False, True], device=device)
+    mask = torch.ones(2, 64, dtype=torch.bool, device=device)
+    with torch.no_grad():
+        context = ContextGraph(model.transformer)(cond, text, drop)
+    graphs = {
+        "context.onnx": (
+            ContextGraph(model.transformer),
+            (cond, text, drop),
+            ["cond", "text", "drop"],
+            ["context"],
+            {"cond": {0: batch, 1: frames}, "text": {0: batch, 1: frames}, "drop": {0: batch}},
+        ),
+        "transformer.onnx": (
+            TransformerGraph(model.transformer),
+            (torch.randn_like(cond), context, torch.tensor(0.5, device=device), mask),
+            ["x", "context", "time", "mask"],
+            ["pred"],
+            {"x": {0: batch, 1: frames}, "context": {0: batch, 1: frames}, "time": {}, "mask": {0: batch, 1: frames}},
+        ),
+        "vocos.onnx": (
+            VocosGraph(vocoder),
+            (torch.randn(2, n_mels, 64, device=device),),
+            ["mel"],
+            ["real", "imag"],
+            {"mel": {0: batch, 2: mel_frames}},
+        ),
+    }
+    with torch.inference_mode(False), torch.no_grad():
+        for name, (module, args, input_names, output_names, dynamic_shapes) in graphs.items():
+            torch.onnx.export(
+                module.eval(),
+                args,
+                os.path.join(out_dir, name),
+                dynamo=True,
+                input_names=input_names,
+                output_names=output_names,
+                dynamic_shapes=dynamic_shapes,
+                opset_version=opset,
+                external_data=True,
+            )
+    return out_dir
+
+
+def has_onnx_export(onnx_dir):
+    return all(os.path.exists(os.path.join(onnx_dir, name)) for name in GRAPHS)
+
+
+def load_session(path, threads=None, providers=("CPUExecutionProvider",)):
+    """onnxruntime session with all graph optimizations, `threads` intra-op threads (None: one per core)."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=list(providers))
+
+
+def run_bound(session, inputs, outputs):
+    """Run `session` reading the torch tensors `inputs` and writing into `outputs` in place (dicts by name)."""
+    binding = session.io_binding()
+    for name, tensor in inputs.items():
+        _bind(binding.bind_input, name, tensor)
+    for name, tensor in outputs.items():
+        _bind(binding.bind_output, name, tensor)
+    session.run_with_iobinding(binding)
+    return outputs
+
+
+def _bind(bind, name, tensor):
+    if not tensor.is_contiguous():
+        raise ValueError(f"{name} must be contiguous to be bound")
+    bind(
+        name,
+        tensor.device.type,
+        tensor.device.index or 0,
+        ONNX_TYPES[tensor.dtype],
+        list(tensor.shape),
+        tensor.data_ptr(),
+    )
+
+
+class OnnxSamplingSession:
+    """SamplingSession (cfm.py) on onnxruntime: the context graph once, then one transformer run per step."""
+
+    def __init__(self, runtime, cond, text, drop):
+        self.runtime = runtime
+        batch, frames = cond.shape[:2]
+        # the text embedding pads (and cuts) the text to the frames; done here so both have one length axis
+        text = F.pad(text[:, :frames], (0, max(0, frames - text.shape[1])), value=-1)
+        if not torch.is_tensor(drop):
+            drop = torch.full((batch,), drop, dtype=torch.bool)
+        self.context = cond.new_empty(batch, frames, runtime.dim)
+        inputs = {"cond": cond.float().contiguous(), "text": text.long().contiguous(), "drop": drop.to(cond.device)}
+        run_bound(runtime.context, inputs, {"context": self.context})
+        self.pred = cond.new_empty(batch, frames, cond.shape[-1])
+        self.full_mask = torch.ones(batch, frames, dtype=torch.bool, device=cond.device)
+        # context and output stay bound for all steps; each step rebinds x, the time and the mask
+        self.binding = runtime.transformer.io_binding()
+        _bind(self.binding.bind_input, "context", self.context)
+        _bind(self.binding.bind_output, "pred", self.pred)
+
+    def __call__(self, x, time, mask=None):
+        x = x.float().contiguous()
+        time = time.float().reshape(()).contiguous()
+        mask = self.full_mask if mask is None else mask.contiguous()
+        for name, tensor in (("x", x), ("time", time), ("mask", mask)):
+            _bind(self.binding.bind_input, name, tensor)
+        self.runtime.transformer.run_with_iobinding(self.binding)
+        # the caller combines the prediction into a new tensor before the next step overwrites it
+        return self.pred
+
+
+class OnnxTransformer:
+    """context.onnx and transformer.onnx of an export_onnx() directory; set as CFM.onnx to sample with them."""
+
+    def __init__(self, onnx_dir, dim, threads=None, providers=("CPUExecutionProvider",)):
+        self.dim = dim
+        self.context = load_session(os.path.join(onnx_dir, "context.onnx"), threads, providers)
+        self.transformer = load_session(os.path.join(onnx_dir, "transformer.onnx"), threads, providers)
+
+    def session(self, cond, text, drop):
+        return OnnxSamplingSession(self, cond, text, drop)
+
+
+class OnnxVocos:
+    """Vocos.decode through vocos.onnx; the ISTFT runs in torch with `vocoder`'s own module."""
+
+    def __init__(self, onnx_dir, vocoder, threads=None, providers=("CPUExecutionProvider",)):
+        self.istft = vocoder.head.istft
+        self.n_freqs = vocoder.head.out.out_features // 2
+        self.session = load_session(os.path.join(onnx_dir, "vocos.onnx"), threads, providers)
+
+    @torch.inference_mode()
+    def decode(self, mel):
+        mel = mel.float().contiguous()
+        spectrum = {name: mel.new_empty(mel.shape[0], self.n_freqs, mel.shape[-1]) for name in ("real", "imag")}
+        run_bound(self.session, {"mel": mel}, spectrum)
+        return self.istft(torch.complex(spectrum["real"], spectrum["imag"]))
@@ -0,0 +1,100 @@
+"""Reduced-precision CPU inference for the F5-TTS transformer and the Vocos vocoder.
+
+On CUDA load_checkpoint runs the model in fp16. On CPU it stays in fp32,
+where the 22-layer, 1024-dim DiT is too slow for anything but short
+scripts. apply_precision() switches a loaded model and vocoder to one of
+PRECISIONS:
+
+* "fp32": unchanged.
+* "int8": dynamic INT8 quantization (torch.ao.quantization.quantize_dynamic)
+  of the nn.Linear layers. In the transformer that is the attention
+  projections, the FeedForward layers, the AdaLN modulations and the output
+  projection. In the Vocos backbone it is the ConvNeXt pointwise layers.
+  Weights are stored as int8 with one scale per output channel, and
+  activations are quantized on the fly. Convolutions, norms and embeddings
+  stay fp32. So do two Linear layers. The input projection is used
+  column-sliced by precompute(). The Vocos head's output is exponentiated
+  into magnitudes, where quantization errors would be amplified.
+* "bf16": the transformer (forward and precompute) and the Vocos backbone run
+  under torch.autocast("cpu", bfloat16). Matmuls and convolutions are then
+  computed in bf16, which is fast with AVX512-BF16/AMX. Their outputs are
+  cast back to fp32, so the ODE state and the ISTFT head stay fp32. On a CPU
+  without native bf16, bf16 would only be emulated and slower than fp32, so
+  the model stays in fp32 and a message says so.
+
+BigVGAN is a convolutional vocoder with no Linear layers worth quantizing,
+so only the transformer changes when it is used.
+"""
+import functools
+
+import torch
+from torch import nn
+from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def bf16_supported():
+    """Whether this CPU computes bf16 natively (oneDNN with AVX512-BF16 or AMX)."""
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def quantize_linears(module, exclude=()):
+    """Replace the nn.Linear layers of `module` (except those named in `exclude`) by dynamic INT8 ones, in place."""
+    names = {
+        name for name, child in module.named_modules() if isinstance(child, nn.Linear) and name not in exclude
+    }
+    quantize_dynamic(module, {name: per_channel_dynamic_qconfig for name in names}, dtype=torch.qint8, inplace=True)
+    return module
+
+
+def _to_float32(value):
+    if isinstance(value, torch.Tensor):
+        return value.float() if value.is_floating_point() else value
+    if isinstance(value, dict):
+        return {key: _to_float32(item) for key, item in value.items()}
+    if isinstance(value, (tuple, list)):
+        return type(value)(_to_float32(item) for item in value)
+    return value
+
+
+def autocast_methods(module, names, dtype=torch.bfloat16):
+    """Run the methods `names` of `module` under CPU autocast to `dtype`, with their outputs cast back to fp32."""
+    for name in names:
+        method = getattr(module, name)
+
+        @functools.wraps(method)
+        def autocast_method(*args, method=method, **kwargs):
+            with torch.autocast("cpu", dtype=dtype):
+                return _to_float32(method(*args, **kwargs))
+
+        setattr(module, name, autocast_method)
+    return module
+
+
+def apply_precision(model, vocoder, precision, device="cpu", mel_spec_type="vocos", show_info=print):
+    """Switch the CFM `model` and `vocoder` to `precision` (see PRECISIONS) in place; returns the precision used."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    if precision == "fp32":
+        return precision
+    if torch.device(device).type != "cpu":
+        raise ValueError(f"precision={precision!r} is a CPU mode; on {device} the model runs in fp16 already")
+
+    model.eval()
+    vocos = vocoder.backbone if mel_spec_type == "vocos" else None
+    if precision == "bf16":
+        if not bf16_supported():
+            show_info("This CPU has no native bf16; running in fp32")
+            return "fp32"
+        autocast_methods(model.transformer, [name for name in ("forward", "precompute") if hasattr(model.transformer, name)])
+        if vocos is not None:
+            autocast_methods(vocos, ["forward"])
+    else:
+        quantize_linears(model.transformer, exclude={"input_embed.proj"})
+        if vocos is not None:
+            quantize_linears(vocos)
+    return precision
@@ -0,0 +1,141 @@
+"""Energy-based silence detection on audio held in memory (NumPy).
+
+This replaces the parts of pydub.silence that inference used. The parameters
+and results are the same as pydub's: positions and lengths in milliseconds,
+a threshold in dBFS, and silence measured as the RMS of every
+`min_silence_len` window starting at each `seek_step` ms. pydub slices an
+AudioSegment and calls audioop.rms once per window, which is a Python loop
+over every millisecond of audio. Here the squared samples are summed up
+once and read at every millisecond boundary, so every window's energy is
+a difference of two running sums. Runs of silent windows are then merged
+with array ops. Cut points match pydub's. The one difference: where pydub
+pads the last part with zeros because its length in ms rounds up past the
+audio (less than a millisecond), the part here ends with the audio.
+
+Audio is a float array with time on the last axis: shape (n,) or
+(channels, n), as torchaudio.load and soundfile (transposed) return it.
+Full scale is 1.0, so -50 dBFS here means the same as -50 dBFS in pydub for
+16-bit audio.
+"""
+import numpy as np
+
+
+def ms_to_samples(ms, sample_rate):
+    """Sample offset of a position in ms, truncated like pydub's slicing."""
+    return int(ms * sample_rate / 1000)
+
+
+def duration_ms(length, sample_rate):
+    """Length in ms of `length` samples, rounded like len(AudioSegment)."""
+    return round(1000 * length / sample_rate)
+
+
+def cumulative_energy(samples, sample_rate):
+    """Running sum of squared samples (all channels) and of the sample count, at every ms boundary."""
+    samples = np.asarray(samples, dtype=np.float64)
+    length = samples.shape[-1]
+    bounds = np.minimum((np.arange(duration_ms(length, sample_rate) + 1) * sample_rate) // 1000, length)
+    # fold the channels (a view, no copy) into one energy per sample
+    squares = np.square(samples).reshape(-1, length).sum(axis=0)
+    energy = np.concatenate(([0.0], np.cumsum(squares)))
+    channels = samples.size // length if length else 1
+    return energy[bounds], bounds * channels
+
+
+def detect_silence(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """[start, end] ms ranges of at least `min_silence_len` ms whose RMS stays at or below `silence_thresh` dBFS."""
+    seg_len = duration_ms(samples.shape[-1], sample_rate)
+    if seg_len < min_silence_len:
+        return []
+
+    last_start = seg_len - min_silence_len
+    starts = np.arange(0, last_start + 1, seek_step)
+    if last_start % seek_step:
+        starts = np.append(starts, last_start)
+
+    energy, counts = cumulative_energy(samples, sample_rate)
+    window_energy = energy[starts + min_silence_len] - energy[starts]
+    window_counts = counts[starts + min_silence_len] - counts[starts]
+    # rms <= threshold, compared as mean squares; an empty window has rms 0
+    threshold = (10 ** (silence_thresh / 20)) ** 2
+    silent = starts[window_energy <= threshold * window_counts]
+    if not len(silent):
+        return []
+
+    # a new range starts where the next silent window neither follows on nor overlaps the previous one
+    gaps = np.diff(silent)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = silent[np.concatenate(([0], breaks + 1))]
+    range_ends = silent[np.concatenate((breaks, [len(silent) - 1]))] + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """[start, end] ms ranges between the silences of detect_silence()."""
+    silent_ranges = detect_silence(samples, sample_rate, min_silence_len, silence_thresh, seek_step)
+    seg_len = duration_ms(samples.shape[-1], sample_rate)
+    if not silent_ranges:
+        return [[0, seg_len]]
+    if silent_ranges[0] == [0, seg_len]:
+        return []
+
+    nonsilent_ranges = []
+    prev_end = 0
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if prev_end != seg_len:
+        nonsilent_ranges.append([prev_end, seg_len])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+def split_on_silence(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, keep_silence=100, seek_step=1):
+    """The non-silent parts of `samples` (views, in order), each padded with up to
+    `keep_silence` ms of the silence around it (True: all of it, False: none).
+    Where two paddings would overlap they meet half way.
+    """
+    seg_len = duration_ms(samples.shape[-1], sample_rate)
+    if isinstance(keep_silence, bool):
+        keep_silence = seg_len if keep_silence else 0
+
+    ranges = [
+        [start - keep_silence, end + keep_silence]
+        for start, end in detect_nonsilent(samples, sample_rate, min_silence_len, silence_thresh, seek_step)
+    ]
+    for previous, following in zip(ranges, ranges[1:]):
+        if following[0] < previous[1]:
+            previous[1] = (previous[1] + following[0]) // 2
+            following[0] = previous[1]
+    return [
+        samples[..., ms_to_samples(max(start, 0), sample_rate) : ms_to_samples(min(end, seg_len), sample_rate)]
+        for start, end in ranges
+    ]
+
+
+def concatenate(segments, like):
+    """Join segments along time; an empty array shaped like `like` when there are none."""
+    if not segments:
+        return like[..., :0]
+    return np.concatenate(segments, axis=-1)
+
+
+def clip_at_silences(samples, sample_rate, max_ms, min_ms, **split_kwargs):
+    """Join the non-silent parts of `samples` (see split_on_silence) up to about `max_ms`.
+
+    Parts are added in order until one would take a clip already longer
+    than `min_ms` past `max_ms`. Returns the clip and whether it stopped
+    early. The clip can still be longer than `max_ms` when a single part is.
+    """
+    kept = []
+    length = 0
+    for segment in split_on_silence(samples, sample_rate, **split_kwargs):
+        if (
+            duration_ms(length, sample_rate) > min_ms
+            and duration_ms(length + segment.shape[-1], sample_rate) > max_ms
+        ):
+            return concatenate(kept, samples), True
+        kept.append(segment)
+        length += segment.shape[-1]
+    return concatenate(kept, samples), False
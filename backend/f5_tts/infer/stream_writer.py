@@ -0,0 +1,95 @@
+"""Incremental audio writers for F5TTS.infer_stream.
+
+Both take float waveform blocks as they are generated and write them to a
+binary file object at once, so a listener (a pipe, a socket, a player
+reading a FIFO) can start before synthesis ends.
+
+* WavStreamWriter writes 16-bit PCM WAV. The header's size fields are not
+  known up front. On a seekable file they are patched on close(). On a pipe or
+  socket they stay at 0xFFFFFFFF, the usual "length unknown" value of
+  streamed WAV, which ffmpeg, sox and browsers read up to end-of-stream.
+* OpusStreamWriter pipes the PCM through ffmpeg into Ogg/Opus (ffmpeg with
+  libopus must be on PATH).
+"""
+import struct
+import subprocess
+
+import numpy as np
+
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def to_pcm16(samples):
+    """Float samples in [-1, 1] as little-endian 16-bit PCM bytes."""
+    samples = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+    return (samples * 32767.0).astype("<i2").tobytes()
+
+
+class WavStreamWriter:
+    def __init__(self, fileobj, sample_rate, channels=1):
+        self.fileobj = fileobj
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.data_bytes = 0
+        try:
+            self.seekable = fileobj.seekable()
+        except (AttributeError, OSError):
+            self.seekable = False
+        self.fileobj.write(self._header(UNKNOWN_SIZE))
+        self.fileobj.flush()
+
+    def _header(self, data_bytes):
+        block_align = self.channels * 2
+        riff_size = UNKNOWN_SIZE if data_bytes == UNKNOWN_SIZE else 36 + data_bytes
+        return (
+            b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.sample_rate,
+                                    self.sample_rate * block_align, block_align, 16)
+            + b"data" + struct.pack("<I", data_bytes)
+        )
+
+    def write(self, samples):
+        data = to_pcm16(samples)
+        self.fileobj.write(data)
+        self.fileobj.flush()
+        self.data_bytes += len(data)
+
+    def close(self):
+        if self.seekable:
+            self.fileobj.seek(0)
+            self.fileobj.write(self._header(self.data_bytes))
+            self.fileobj.seek(0, 2)
+        self.fileobj.flush()
+
+
+class OpusStreamWriter:
+    def __init__(self, fileobj, sample_rate, channels=1, bitrate="64k"):
+        self.fileobj = fileobj
+        fileobj.flush()
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+                "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+                "-c:a", "libopus", "-b:a", bitrate,
+                # hand every page to the listener as soon as it is encoded
+                "-flush_packets", "1", "-page_duration", "20000",
+                "-f", "ogg", "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=fileobj,
+        )
+
+    def write(self, samples):
+        self.process.stdin.write(to_pcm16(samples))
+        self.process.stdin.flush()
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg opus encoder exited with code {self.process.returncode}")
+
+
+STREAM_WRITERS = {
+    "wav": WavStreamWriter,
+    "opus": OpusStreamWriter,
+}
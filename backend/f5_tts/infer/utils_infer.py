@@ -11,17 +11,20 @@ import torch
 import numpy as np
 import matplotlib
 import matplotlib.pylab as plt
+import soundfile as sf
 import hashlib
 import re
 import tempfile
+import time
 
 from huggingface_hub import snapshot_download, hf_hub_download
 from importlib.resources import files
 from pathlib import Path
-from pydub import AudioSegment, silence
 from transformers import pipeline
 from vocos import Vocos
 
+from f5_tts.infer import silence
+from f5_tts.infer.voice_store import VoiceProfile
 from f5_tts.model import CFM
 from f5_tts.model.utils import (
     get_tokenizer,
@@ -51,10 +54,27 @@ cfg_strength = 2.0
 sway_sampling_coef = -1.0
 speed = 1.0
 fix_duration = None
+long_form_max_batch_frames = 16384  # batch_chunks budget of the long-form mode when none is given
 
 # -----------------------------------------
 
 
+# optional per-stage timing (used by the backend's /metrics)
+
+
+def add_timing(timings, name, start, device=None):
+    """Add the seconds since `start` (a time.perf_counter() value) to timings[name].
+
+    No-op when `timings` is None. On CUDA the device is synchronized first so
+    asynchronous kernels are charged to the stage that launched them.
+    """
+    if timings is None:
+        return
+    if device is not None and str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+    timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
 # chunk text into smaller pieces
 
 
@@ -237,7 +257,7 @@ def fetch_from_hub(hf_repo: str, cache_dir: None | str) -> Path:
     return model_path
 
 
-def load_duration_model(hf_model_name_or_path="lucasnewman/f5-tts-mlx", cache_dir=None):
+def load_duration_model(hf_model_name_or_path="lucasnewman/f5-tts-mlx", cache_dir=None, device=device):
     from f5_tts.model.modules import DurationPredictor, DurationTransformer
 
     path = fetch_from_hub(hf_model_name_or_path, cache_dir)
@@ -326,55 +346,48 @@ def load_duration_model(hf_model_name_or_path="lucasnewman/f5-tts-mlx", cache_di
         # Load the adjusted state dict
         duration_predictor.load_state_dict(new_state_dict, strict=False)
 
-        return duration_predictor
+        return duration_predictor.to(device).eval()
 
 
 # preprocess reference audio and text
 
 
-def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_info=print, device=device):
+def preprocess_ref_audio(ref_audio_orig, ref_text, clip_short=True, show_info=print, device=device):
+    """Decode, clip and (without `ref_text`) transcribe a reference, all in memory.
+
+    Returns `(audio, sample_rate, ref_text)`, audio as a float32 array of
+    shape (channels, n) at the file's own sample rate.
+    """
     show_info("Converting audio...")
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
-        aseg = AudioSegment.from_file(ref_audio_orig)
+    audio, sr = torchaudio.load(ref_audio_orig)
+    audio = audio.numpy()
 
-        if clip_short:
-            # 1. try to find long silence for clipping
-            non_silent_segs = silence.split_on_silence(
-                aseg, min_silence_len=1000, silence_thresh=-50, keep_silence=1000
-            )
-            non_silent_wave = AudioSegment.silent(duration=0)
-            for non_silent_seg in non_silent_segs:
-                if len(non_silent_wave) > 6000 and len(non_silent_wave + non_silent_seg) > 15000:
-                    show_info("Audio is over 15s, clipping short. (1)")
-                    break
-                non_silent_wave += non_silent_seg
-
-            # 2. try to find short silence for clipping if 1. failed
-            if len(non_silent_wave) > 15000:
-                non_silent_segs = silence.split_on_silence(
-                    aseg, min_silence_len=100, silence_thresh=-40, keep_silence=1000
-                )
-                non_silent_wave = AudioSegment.silent(duration=0)
-                for non_silent_seg in non_silent_segs:
-                    if len(non_silent_wave) > 6000 and len(non_silent_wave + non_silent_seg) > 15000:
-                        show_info("Audio is over 15s, clipping short. (2)")
-                        break
-                    non_silent_wave += non_silent_seg
+    if clip_short:
+        # 1. try to find long silence for clipping
+        clipped, stopped = silence.clip_at_silences(
+            audio, sr, max_ms=15000, min_ms=6000, min_silence_len=1000, silence_thresh=-50, keep_silence=1000
+        )
+        if stopped:
+            show_info("Audio is over 15s, clipping short. (1)")
 
-            aseg = non_silent_wave
+        # 2. try to find short silence for clipping if 1. failed
+        if silence.duration_ms(clipped.shape[-1], sr) > 15000:
+            clipped, stopped = silence.clip_at_silences(
+                audio, sr, max_ms=15000, min_ms=6000, min_silence_len=100, silence_thresh=-40, keep_silence=1000
+            )
+            if stopped:
+                show_info("Audio is over 15s, clipping short. (2)")
 
-            # 3. if no proper silence found for clipping
-            if len(aseg) > 15000:
-                aseg = aseg[:15000]
-                show_info("Audio is over 15s, clipping short. (3)")
+        audio = clipped
 
-        aseg.export(f.name, format="wav")
-        ref_audio = f.name
+        # 3. if no proper silence found for clipping
+        if silence.duration_ms(audio.shape[-1], sr) > 15000:
+            audio = audio[..., : silence.ms_to_samples(15000, sr)]
+            show_info("Audio is over 15s, clipping short. (3)")
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
 
-    # Compute a hash of the reference audio file
-    with open(ref_audio, "rb") as audio_file:
-        audio_data = audio_file.read()
-        audio_hash = hashlib.md5(audio_data).hexdigest()
+    # Compute a hash of the reference audio
+    audio_hash = hashlib.md5(audio.tobytes() + str((sr, audio.shape)).encode()).hexdigest()
 
     global _ref_audio_cache
     if audio_hash in _ref_audio_cache:
@@ -388,7 +401,7 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
                 initialize_asr_pipeline(device=device)
             show_info("No reference text provided, transcribing reference audio...")
             ref_text = asr_pipe(
-                ref_audio,
+                {"raw": audio.mean(axis=0), "sampling_rate": sr},
                 chunk_length_s=30,
                 batch_size=128,
                 generate_kwargs={"task": "transcribe"},
@@ -407,12 +420,76 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
         else:
             ref_text += ". "
 
-    return ref_audio, ref_text
+    return audio, sr, ref_text
+
+
+def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_info=print, device=device):
+    """preprocess_ref_audio() for callers that want the clip as a file: returns `(wav_path, ref_text)`.
+
+    The WAV is a new temporary file the caller owns.
+    """
+    audio, sr, ref_text = preprocess_ref_audio(ref_audio_orig, ref_text, clip_short, show_info, device)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
+        sf.write(f, audio.T, sr, format="WAV", subtype="PCM_16")
+    return f.name, ref_text
+
+
+# reference voice profiles (see voice_store.py)
+
+
+def build_voice_profile(voice_id, ref_audio_orig, ref_text, show_info=print, device=device):
+    """Run all reference preprocessing for `ref_audio_orig` (clipping, transcription, downmix, resampling) once.
+
+    Returns a VoiceProfile without cond mels; voice_cond() adds them.
+    """
+    audio, sr, ref_text = preprocess_ref_audio(ref_audio_orig, ref_text, show_info=show_info, device=device)
+    audio = torch.from_numpy(audio)
+    if audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0, keepdim=True)
+    # measured before resampling, as generate_chunks does for a plain reference
+    rms = torch.sqrt(torch.mean(torch.square(audio))).item()
+    if sr != target_sample_rate:
+        audio = torchaudio.transforms.Resample(sr, target_sample_rate)(audio)
+    return VoiceProfile(voice_id, audio, target_sample_rate, rms, ref_text)
+
+
+def normalize_ref_audio(audio, rms, target_rms=target_rms):
+    """Raise a quiet reference to `target_rms` (louder ones are left alone)."""
+    if rms < target_rms:
+        audio = audio * target_rms / rms
+    return audio
+
+
+def voice_cond(voice, model_obj, mel_spec_type=mel_spec_type, target_rms=target_rms, device=device):
+    """The cond mel of `voice` for this model's mel type; computed and kept in the profile on first use."""
+    cond = voice.cond(mel_spec_type, target_rms)
+    if cond is None:
+        audio = normalize_ref_audio(voice.audio, voice.rms, target_rms).to(device)
+        with torch.inference_mode():
+            cond = model_obj.mel_spec(audio).permute(0, 2, 1)
+        voice.set_cond(mel_spec_type, target_rms, cond)
+        return cond
+    return cond.to(device)
 
 
 # infer process: chunk text -> infer batches [i.e. infer_batch_process()]
 
 
+def split_gen_text(ref_audio, ref_text, gen_text, show_info=print):
+    """Load the reference (a path or a VoiceProfile) and split `gen_text` into chunks that fit the model's window next to it."""
+    if isinstance(ref_audio, VoiceProfile):
+        audio, sr = ref_audio.audio, ref_audio.sample_rate
+    else:
+        audio, sr = torchaudio.load(ref_audio)
+    max_chars = int(len(ref_text.encode("utf-8")) / (audio.shape[-1] / sr) * (25 - audio.shape[-1] / sr))
+    gen_text_batches = chunk_text(gen_text, max_chars=max_chars)
+    for i, gen_text in enumerate(gen_text_batches):
+        print(f"gen_text {i}", gen_text)
+
+    show_info(f"Generating audio in {len(gen_text_batches)} batches...")
+    return audio, sr, gen_text_batches
+
+
 def infer_process(
     ref_audio,
     ref_text,
@@ -431,17 +508,60 @@ def infer_process(
     speed=speed,
     fix_duration=fix_duration,
     device=device,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
 ):
-    # Split the input text into batches
-    audio, sr = torchaudio.load(ref_audio)
-    max_chars = int(len(ref_text.encode("utf-8")) / (audio.shape[-1] / sr) * (25 - audio.shape[-1] / sr))
-    gen_text_batches = chunk_text(gen_text, max_chars=max_chars)
-    for i, gen_text in enumerate(gen_text_batches):
-        print(f"gen_text {i}", gen_text)
-
-    show_info(f"Generating audio in {len(gen_text_batches)} batches...")
+    audio, sr, gen_text_batches = split_gen_text(ref_audio, ref_text, gen_text, show_info)
     return infer_batch_process(
-        (audio, sr),
+        ref_audio if isinstance(ref_audio, VoiceProfile) else (audio, sr),
+        ref_text,
+        gen_text_batches,
+        model_obj,
+        vocoder,
+        prediction_model=prediction_model,
+        mel_spec_type=mel_spec_type,
+        progress=progress,
+        target_rms=target_rms,
+        cross_fade_duration=cross_fade_duration,
+        nfe_step=nfe_step,
+        cfg_strength=cfg_strength,
+        sway_sampling_coef=sway_sampling_coef,
+        speed=speed,
+        fix_duration=fix_duration,
+        device=device,
+        timings=timings,
+        batch_chunks=batch_chunks,
+        max_batch_frames=max_batch_frames,
+    )
+
+
+def infer_stream_process(
+    ref_audio,
+    ref_text,
+    gen_text,
+    model_obj,
+    vocoder,
+    prediction_model=None,
+    mel_spec_type=mel_spec_type,
+    show_info=print,
+    progress=tqdm,
+    target_rms=target_rms,
+    cross_fade_duration=cross_fade_duration,
+    nfe_step=nfe_step,
+    cfg_strength=cfg_strength,
+    sway_sampling_coef=sway_sampling_coef,
+    speed=speed,
+    fix_duration=fix_duration,
+    device=device,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
+):
+    """Like infer_process, but a generator of float waveform blocks at target_sample_rate (see infer_batch_process_stream)."""
+    audio, sr, gen_text_batches = split_gen_text(ref_audio, ref_text, gen_text, show_info)
+    yield from infer_batch_process_stream(
+        ref_audio if isinstance(ref_audio, VoiceProfile) else (audio, sr),
         ref_text,
         gen_text_batches,
         model_obj,
@@ -457,13 +577,103 @@ def infer_process(
         speed=speed,
         fix_duration=fix_duration,
         device=device,
+        timings=timings,
+        batch_chunks=batch_chunks,
+        max_batch_frames=max_batch_frames,
     )
 
 
+def infer_long_form_process(
+    ref_audio,
+    ref_text,
+    gen_text,
+    model_obj,
+    vocoder,
+    file_wave,
+    prediction_model=None,
+    mel_spec_type=mel_spec_type,
+    show_info=print,
+    progress=tqdm,
+    target_rms=target_rms,
+    cross_fade_duration=cross_fade_duration,
+    nfe_step=nfe_step,
+    cfg_strength=cfg_strength,
+    sway_sampling_coef=sway_sampling_coef,
+    speed=speed,
+    fix_duration=fix_duration,
+    device=device,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
+):
+    """Like infer_process, but writes the cross-faded wave into the WAV `file_wave` as chunks finish.
+
+    Nothing the size of the whole script is kept: each block is appended to
+    the file (soundfile fixes up the header on close), no spectrogram is
+    made, and batches take consecutive chunks of at most
+    `max_batch_frames` (default long_form_max_batch_frames) frames. Peak
+    memory therefore follows the chunk/batch size, not the script length.
+    Returns the number of samples written.
+    """
+    audio, sr, gen_text_batches = split_gen_text(ref_audio, ref_text, gen_text, show_info)
+    with sf.SoundFile(file_wave, "w", samplerate=target_sample_rate, channels=1, format="WAV") as out:
+        for block in infer_batch_process_stream(
+            ref_audio if isinstance(ref_audio, VoiceProfile) else (audio, sr),
+            ref_text,
+            gen_text_batches,
+            model_obj,
+            vocoder,
+            prediction_model=prediction_model,
+            mel_spec_type=mel_spec_type,
+            progress=progress,
+            target_rms=target_rms,
+            cross_fade_duration=cross_fade_duration,
+            nfe_step=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            speed=speed,
+            fix_duration=fix_duration,
+            device=device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames or long_form_max_batch_frames,
+            in_order_batches=True,
+        ):
+            out.write(block)
+        return out.frames
+
+
+# group chunks into padded batches for infer_batch_process
+
+
+def group_chunks(durations, max_batch_frames=None, in_order=False):
+    """Split chunk indices into batches whose padded size (len(batch) * longest duration) stays within `max_batch_frames`.
+
+    Chunks are grouped in order of duration so a batch pads little; a chunk
+    longer than the budget gets a batch of its own. With `in_order` a batch
+    takes consecutive chunks instead, so chunks finish in about text order
+    and a streaming consumer (see in_text_order) holds back at most one
+    batch. Returns lists of indices into `durations`.
+    """
+    order = range(len(durations)) if in_order else sorted(range(len(durations)), key=lambda i: durations[i])
+    groups = []
+    longest = 0
+    for i in order:
+        if groups and (
+            max_batch_frames is None or (len(groups[-1]) + 1) * max(longest, durations[i]) <= max_batch_frames
+        ):
+            groups[-1].append(i)
+            longest = max(longest, durations[i])
+        else:
+            groups.append([i])
+            longest = durations[i]
+    return groups
+
+
 # infer batches
 
 
-def infer_batch_process(
+def generate_chunks(
     ref_audio,
     ref_text,
     gen_text_batches,
@@ -473,116 +683,206 @@ def infer_batch_process(
     mel_spec_type="vocos",
     progress=tqdm,
     target_rms=0.1,
-    cross_fade_duration=0.15,
     nfe_step=32,
     cfg_strength=2.0,
     sway_sampling_coef=-1,
     speed=0.8,
     fix_duration=None,
     device=None,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
+    in_order_batches=False,
 ):
-    audio, sr = ref_audio
-    if audio.shape[0] > 1:
-        audio = torch.mean(audio, dim=0, keepdim=True)
-
-    rms = torch.sqrt(torch.mean(torch.square(audio)))
-    if rms < target_rms:
-        audio = audio * target_rms / rms
-    if sr != target_sample_rate:
-        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
-        audio = resampler(audio)
-    audio = audio.to(device)
-
-    generated_waves = []
-    spectrograms = []
+    """Synthesize every text chunk; yields `(index, wave, spectrogram)` as each chunk's vocoder pass finishes.
+
+    `ref_audio` is `(audio, sr)` as loaded, or a VoiceProfile whose stored
+    waveform and cond mel are used as they are.
+    Chunks come in order, except with `batch_chunks`, which samples the chunks
+    together in padded batches of at most `max_batch_frames` frames (batch
+    size x longest duration; None: all chunks) and vocodes each batch in one
+    call. Batched results differ from one-by-one sampling only through the
+    noise drawn. `in_order_batches` batches consecutive chunks instead of
+    chunks of similar length (see group_chunks). `timings`, if given, accumulates seconds under
+    tts_ref_preprocess, tts_duration, tts_sampling and tts_vocoder.
+    """
+    start = time.perf_counter()
+    if isinstance(ref_audio, VoiceProfile):
+        # already downmixed and resampled
+        rms = ref_audio.rms
+        audio = normalize_ref_audio(ref_audio.audio, rms, target_rms).to(device)
+        cond = voice_cond(ref_audio, model_obj, mel_spec_type, target_rms, device)
+    else:
+        audio, sr = ref_audio
+        if audio.shape[0] > 1:
+            audio = torch.mean(audio, dim=0, keepdim=True)
+
+        rms = torch.sqrt(torch.mean(torch.square(audio)))
+        audio = normalize_ref_audio(audio, rms, target_rms)
+        if sr != target_sample_rate:
+            resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
+            audio = resampler(audio)
+        audio = audio.to(device)
+        # the cond mel is the same for every chunk
+        with torch.inference_mode():
+            cond = model_obj.mel_spec(audio).permute(0, 2, 1)
+    add_timing(timings, "tts_ref_preprocess", start, device)
 
     if len(ref_text[-1].encode("utf-8")) == 1:
         ref_text = ref_text + " "
-    for i, gen_text in enumerate(progress.tqdm(gen_text_batches)):
-        # Prepare the text
-        text_list = [ref_text + gen_text]
-        final_text_list = convert_char_to_pinyin(text_list)
-
-        ref_audio_len = audio.shape[-1] // hop_length
-        duration=None
-        if fix_duration is not None:
-            duration = int(fix_duration * target_sample_rate / hop_length)
-        elif prediction_model:
-            duration_in_sec = prediction_model(audio, text_list)
-            print(duration_in_sec)
-            frame_rate = model_obj.mel_spec.target_sample_rate // model_obj.mel_spec.hop_length
-            duration = (duration_in_sec * frame_rate / speed).to(torch.long).item()
-            print(f"Got duration of {duration} frames ({duration_in_sec.item()} secs) for generated speech")
-
-        if duration is None:
-            # Calculate duration
-            ref_text_len = len(ref_text.encode("utf-8"))
-            gen_text_len = len(gen_text.encode("utf-8"))
-            duration = ref_audio_len + int(ref_audio_len / ref_text_len * gen_text_len / speed)
-
-        # inference
-        with torch.inference_mode():
-            generated, _ = model_obj.sample(
-                cond=audio,
-                text=final_text_list,
-                duration=duration,
-                steps=nfe_step,
-                cfg_strength=cfg_strength,
-                sway_sampling_coef=sway_sampling_coef,
-            )
-
-            generated = generated.to(torch.float32)
-            generated = generated[:, ref_audio_len:, :]
-            generated_mel_spec = generated.permute(0, 2, 1)
-            if mel_spec_type == "vocos":
-                generated_wave = vocoder.decode(generated_mel_spec)
-            elif mel_spec_type == "bigvgan":
-                generated_wave = vocoder(generated_mel_spec)
-            if rms < target_rms:
-                generated_wave = generated_wave * rms / target_rms
-
-            # wav -> numpy
-            generated_wave = generated_wave.squeeze().cpu().numpy()
-
-            generated_waves.append(generated_wave)
-            spectrograms.append(generated_mel_spec[0].cpu().numpy())
-
-    # Combine all generated waves with cross-fading
-    if cross_fade_duration <= 0:
-        # Simply concatenate
-        final_wave = np.concatenate(generated_waves)
+    ref_audio_len = audio.shape[-1] // hop_length
+
+    # Prepare the text and the duration (in mel frames) of every chunk
+    texts = [convert_char_to_pinyin([ref_text + gen_text])[0] for gen_text in gen_text_batches]
+
+    start = time.perf_counter()
+    if fix_duration is not None:
+        durations = [int(fix_duration * target_sample_rate / hop_length)] * len(texts)
+    elif prediction_model:
+        # one padded forward for all chunks, on the reference mel when the predictor uses the same one
+        same_mel = prediction_model._mel_spec.mel_spec_type == model_obj.mel_spec.mel_spec_type
+        durations = prediction_model.predict_frames(
+            cond if same_mel else audio, [ref_text + gen_text for gen_text in gen_text_batches], speed=speed
+        ).tolist()
     else:
-        final_wave = generated_waves[0]
-        for i in range(1, len(generated_waves)):
-            prev_wave = final_wave
-            next_wave = generated_waves[i]
-
-            # Calculate cross-fade samples, ensuring it does not exceed wave lengths
-            cross_fade_samples = int(cross_fade_duration * target_sample_rate)
-            cross_fade_samples = min(cross_fade_samples, len(prev_wave), len(next_wave))
-
-            if cross_fade_samples <= 0:
-                # No overlap possible, concatenate
-                final_wave = np.concatenate([prev_wave, next_wave])
-                continue
+        # Calculate duration
+        ref_text_len = len(ref_text.encode("utf-8"))
+        durations = [
+            ref_audio_len + int(ref_audio_len / ref_text_len * len(gen_text.encode("utf-8")) / speed)
+            for gen_text in gen_text_batches
+        ]
+    add_timing(timings, "tts_duration", start, device)
+
+    if batch_chunks and len(texts) > 1:
+        # One ODE solve per group of chunks instead of one per chunk
+        # CFM.sample lengthens a too-short duration to cover the reference and the text (and caps it);
+        # do it here so every chunk's end is known when the padded batch is cut apart again
+        max_frames = 4096
+        durations = [
+            min(max(duration, max(cond.shape[1], len(text)) + 1), max_frames)
+            for text, duration in zip(texts, durations)
+        ]
+        for group in progress.tqdm(group_chunks(durations, max_batch_frames, in_order_batches)):
+            with torch.inference_mode():
+                start = time.perf_counter()
+                generated, _ = model_obj.sample(
+                    cond=cond.expand(len(group), -1, -1),
+                    text=[texts[i] for i in group],
+                    duration=torch.tensor([durations[i] for i in group], device=cond.device),
+                    steps=nfe_step,
+                    cfg_strength=cfg_strength,
+                    sway_sampling_coef=sway_sampling_coef,
+                    max_duration=max_frames,
+                )
+                add_timing(timings, "tts_sampling", start, device)
+
+                start = time.perf_counter()
+                generated = generated.to(torch.float32)
+                mels = [generated[row, ref_audio_len : durations[i], :] for row, i in enumerate(group)]
+                # pad with each chunk's last frame rather than with what the solver left past its end
+                longest = max(mel.shape[0] for mel in mels)
+                padded = torch.stack(
+                    [torch.cat([mel, mel[-1:].expand(longest - mel.shape[0], -1)]) for mel in mels]
+                ).permute(0, 2, 1)
+                if mel_spec_type == "vocos":
+                    waves = vocoder.decode(padded)
+                elif mel_spec_type == "bigvgan":
+                    waves = vocoder(padded).squeeze(1)
+                if rms < target_rms:
+                    waves = waves * rms / target_rms
+                waves = waves.cpu().numpy()
+                finished = [
+                    (i, waves[row, : mel.shape[0] * hop_length], mel.permute(1, 0).cpu().numpy())
+                    for row, (i, mel) in enumerate(zip(group, mels))
+                ]
+                add_timing(timings, "tts_vocoder", start)
+            # outside inference_mode, which is thread-wide state the consumer should not run under
+            yield from finished
+    else:
+        for i in progress.tqdm(range(len(texts))):
+            # inference
+            with torch.inference_mode():
+                start = time.perf_counter()
+                generated, _ = model_obj.sample(
+                    cond=cond,
+                    text=[texts[i]],
+                    duration=durations[i],
+                    steps=nfe_step,
+                    cfg_strength=cfg_strength,
+                    sway_sampling_coef=sway_sampling_coef,
+                )
+                add_timing(timings, "tts_sampling", start, device)
 
-            # Overlapping parts
-            prev_overlap = prev_wave[-cross_fade_samples:]
-            next_overlap = next_wave[:cross_fade_samples]
+                start = time.perf_counter()
+                generated = generated.to(torch.float32)
+                generated = generated[:, ref_audio_len:, :]
+                generated_mel_spec = generated.permute(0, 2, 1)
+                if mel_spec_type == "vocos":
+                    generated_wave = vocoder.decode(generated_mel_spec)
+                elif mel_spec_type == "bigvgan":
+                    generated_wave = vocoder(generated_mel_spec)
+                if rms < target_rms:
+                    generated_wave = generated_wave * rms / target_rms
 
-            # Fade out and fade in
-            fade_out = np.linspace(1, 0, cross_fade_samples)
-            fade_in = np.linspace(0, 1, cross_fade_samples)
+                # wav -> numpy
+                generated_wave = generated_wave.squeeze().cpu().numpy()
 
-            # Cross-faded overlap
-            cross_faded_overlap = prev_overlap * fade_out + next_overlap * fade_in
+                spectrogram = generated_mel_spec[0].cpu().numpy()
+                add_timing(timings, "tts_vocoder", start)
+            yield i, generated_wave, spectrogram
 
-            # Combine
-            new_wave = np.concatenate(
-                [prev_wave[:-cross_fade_samples], cross_faded_overlap, next_wave[cross_fade_samples:]]
-            )
 
-            final_wave = new_wave
+def infer_batch_process(
+    ref_audio,
+    ref_text,
+    gen_text_batches,
+    model_obj,
+    vocoder,
+    prediction_model=None,
+    mel_spec_type="vocos",
+    progress=tqdm,
+    target_rms=0.1,
+    cross_fade_duration=0.15,
+    nfe_step=32,
+    cfg_strength=2.0,
+    sway_sampling_coef=-1,
+    speed=0.8,
+    fix_duration=None,
+    device=None,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
+):
+    # Combine all generated waves with cross-fading, in text order
+    fader = CrossFader(int(cross_fade_duration * target_sample_rate))
+    blocks = []
+    spectrograms = []
+    for wave, spectrogram in in_text_order(
+        generate_chunks(
+            ref_audio,
+            ref_text,
+            gen_text_batches,
+            model_obj,
+            vocoder,
+            prediction_model=prediction_model,
+            mel_spec_type=mel_spec_type,
+            progress=progress,
+            target_rms=target_rms,
+            nfe_step=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            speed=speed,
+            fix_duration=fix_duration,
+            device=device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+        )
+    ):
+        blocks.append(fader.push(wave))
+        spectrograms.append(spectrogram)
+    blocks.append(fader.flush())
+    final_wave = np.concatenate(blocks)
 
     # Create a combined spectrogram
     combined_spectrogram = np.concatenate(spectrograms, axis=1)
@@ -590,17 +890,136 @@ def infer_batch_process(
     return final_wave, target_sample_rate, combined_spectrogram
 
 
+def in_text_order(chunks):
+    """Reorder generate_chunks' `(index, wave, spectrogram)` into `(wave, spectrogram)` in text order.
+
+    Only chunks that finished before an earlier one are held back.
+    """
+    finished = {}
+    next_index = 0
+    for i, wave, spectrogram in chunks:
+        finished[i] = (wave, spectrogram)
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
+
+
+class CrossFader:
+    """Cross-fades the chunks' waves into one, incrementally.
+
+    push() takes the waves in text order and returns the part of the
+    combined wave that can no longer change. It holds back only the last
+    `cross_fade_samples` samples, which the next chunk fades into, linearly
+    over at most the length of either side. flush() returns that tail.
+    Everything returned, concatenated, is the combined wave.
+    """
+
+    def __init__(self, cross_fade_samples):
+        self.cross_fade_samples = max(0, int(cross_fade_samples))
+        self.tail = None
+        self.total = 0
+
+    def push(self, wave):
+        # `total` is the length of the combined wave so far (what was returned plus the tail)
+        overlap = 0
+        if self.tail is None:
+            combined = wave
+        else:
+            # the overlap never exceeds either wave
+            overlap = min(self.cross_fade_samples, self.total, len(wave))
+            if overlap <= 0:
+                overlap = 0
+                combined = np.concatenate([self.tail, wave])
+            else:
+                fade_out = np.linspace(1, 0, overlap)
+                fade_in = np.linspace(0, 1, overlap)
+                cross_faded_overlap = self.tail[-overlap:] * fade_out + wave[:overlap] * fade_in
+                combined = np.concatenate([self.tail[:-overlap], cross_faded_overlap, wave[overlap:]])
+        self.total += len(wave) - overlap
+        keep = min(self.cross_fade_samples, len(combined))
+        self.tail = combined[len(combined) - keep :]
+        return combined[: len(combined) - keep]
+
+    def flush(self):
+        tail, self.tail = self.tail, None
+        return tail if tail is not None else np.zeros(0, dtype=np.float32)
+
+
+def infer_batch_process_stream(
+    ref_audio,
+    ref_text,
+    gen_text_batches,
+    model_obj,
+    vocoder,
+    prediction_model=None,
+    mel_spec_type="vocos",
+    progress=tqdm,
+    target_rms=0.1,
+    cross_fade_duration=0.15,
+    nfe_step=32,
+    cfg_strength=2.0,
+    sway_sampling_coef=-1,
+    speed=0.8,
+    fix_duration=None,
+    device=None,
+    timings=None,
+    batch_chunks=False,
+    max_batch_frames=None,
+    in_order_batches=False,
+):
+    """Generator form of infer_batch_process: yields the cross-faded wave in blocks as chunks finish.
+
+    A block is yielded as soon as a chunk's vocoder pass completes (in text
+    order; with `batch_chunks`, once every earlier chunk is done too). Only
+    the cross-fade tail is held back for the next chunk. Concatenated, the
+    blocks equal infer_batch_process's `final_wave`. With `batch_chunks`,
+    `in_order_batches` bounds what is held back to one batch (see
+    group_chunks).
+    """
+    fader = CrossFader(int(cross_fade_duration * target_sample_rate))
+    for wave, _ in in_text_order(
+        generate_chunks(
+            ref_audio,
+            ref_text,
+            gen_text_batches,
+            model_obj,
+            vocoder,
+            prediction_model=prediction_model,
+            mel_spec_type=mel_spec_type,
+            progress=progress,
+            target_rms=target_rms,
+            nfe_step=nfe_step,
+            cfg_strength=cfg_strength,
+            sway_sampling_coef=sway_sampling_coef,
+            speed=speed,
+            fix_duration=fix_duration,
+            device=device,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+            in_order_batches=in_order_batches,
+        )
+    ):
+        block = fader.push(wave)
+        if len(block):
+            yield block
+    block = fader.flush()
+    if len(block):
+        yield block
+
+
 # remove silence from generated wav
 
 
+def remove_silence_from_wave(wave, sample_rate):
+    """Cut silences of a second or more out of generated speech, keeping half a second at each cut."""
+    segments = silence.split_on_silence(wave, sample_rate, min_silence_len=1000, silence_thresh=-50, keep_silence=500)
+    return silence.concatenate(segments, wave)
+
+
 def remove_silence_for_generated_wav(filename):
-    aseg = AudioSegment.from_file(filename)
-    non_silent_segs = silence.split_on_silence(aseg, min_silence_len=1000, silence_thresh=-50, keep_silence=500)
-    non_silent_wave = AudioSegment.silent(duration=0)
-    for non_silent_seg in non_silent_segs:
-        non_silent_wave += non_silent_seg
-    aseg = non_silent_wave
-    aseg.export(filename, format="wav")
+    wave, sr = sf.read(filename, dtype="float32")
+    sf.write(filename, remove_silence_from_wave(wave.T, sr).T, sr)
 
 
 # save spectrogram
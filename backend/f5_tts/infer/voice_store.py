@@ -0,0 +1,170 @@
+"""On-disk store of preprocessed reference voices.
+
+Turning a reference recording into model input is the slow part of a short
+generation: it decodes the audio, clips it at silences, may transcribe it
+with Whisper, then downmixes, resamples and computes the cond mel. A
+VoiceProfile keeps the results of all of these steps:
+
+* the clipped waveform (mono, at the model's sample rate, not loudness-normalized)
+* its RMS before resampling, used to normalize it like infer_batch_process does
+* the transcript, punctuated like preprocess_ref_audio_text returns it
+* the cond mel, per mel type and target RMS, computed the first time it is needed
+
+Profiles are keyed by a voice id, which is the MD5 of the reference file's
+bytes and the given transcript (see voice_id()). Every profile is saved as
+`<voice_id>.pt` under the store's root, so it is still there after a
+restart. Without a root the store keeps profiles in memory only.
+
+Every reference passed by path gets a profile, so the root is bounded: a
+file's mtime is its last use (get() touches it), and each save() deletes
+the files unused for longer than `ttl` seconds and then the least recently
+used ones until the root holds at most `max_bytes`. None disables either
+limit.
+
+Building a profile is the job of utils_infer.build_voice_profile(). This
+module only stores profiles, and F5TTS (api.py) connects the two.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import torch
+
+
+class VoiceProfile:
+    def __init__(self, voice_id, audio, sample_rate, rms, ref_text, conds=None):
+        self.voice_id = voice_id
+        self.audio = audio  # float["1 n"] on the cpu
+        self.sample_rate = sample_rate
+        self.rms = rms
+        self.ref_text = ref_text
+        self.conds = conds or {}  # cond_key() -> float["1 n d"] on the cpu
+
+    @staticmethod
+    def cond_key(mel_spec_type, target_rms):
+        return f"{mel_spec_type}@{target_rms:g}"
+
+    def cond(self, mel_spec_type, target_rms):
+        """The stored cond mel for this mel type and loudness, or None."""
+        return self.conds.get(self.cond_key(mel_spec_type, target_rms))
+
+    def set_cond(self, mel_spec_type, target_rms, mel):
+        self.conds[self.cond_key(mel_spec_type, target_rms)] = mel.detach().to("cpu", torch.float32)
+
+    def state_dict(self):
+        return {
+            "voice_id": self.voice_id,
+            "audio": self.audio,
+            "sample_rate": self.sample_rate,
+            "rms": self.rms,
+            "ref_text": self.ref_text,
+            "conds": self.conds,
+        }
+
+    @classmethod
+    def from_state_dict(cls, state):
+        return cls(
+            state["voice_id"], state["audio"], state["sample_rate"], state["rms"], state["ref_text"], state["conds"]
+        )
+
+
+def voice_id(ref_file, ref_text=""):
+    """Content hash identifying a reference: its file bytes plus the given transcript ('' = transcribe)."""
+    digest = hashlib.md5()
+    with open(ref_file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(b"\0" + (ref_text or "").strip().encode("utf-8"))
+    return digest.hexdigest()
+
+
+class VoiceStore:
+    def __init__(self, root=None, max_loaded=32, max_bytes=None, ttl=None):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._loaded = OrderedDict()  # voice_id -> VoiceProfile, least recently used first
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+
+    def _path(self, voice_id):
+        return os.path.join(self.root, f"{voice_id}.pt")
+
+    def _remember(self, profile):
+        self._loaded[profile.voice_id] = profile
+        self._loaded.move_to_end(profile.voice_id)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+    def _touch(self, voice_id):
+        try:
+            os.utime(self._path(voice_id))
+        except FileNotFoundError:
+            pass
+
+    def get(self, voice_id):
+        """The profile stored under `voice_id`, or None."""
+        if voice_id in self._loaded:
+            self._loaded.move_to_end(voice_id)
+            if self.root is not None:
+                self._touch(voice_id)
+            return self._loaded[voice_id]
+        if self.root is None or not os.path.exists(self._path(voice_id)):
+            return None
+        self._touch(voice_id)
+        profile = VoiceProfile.from_state_dict(torch.load(self._path(voice_id), map_location="cpu", weights_only=True))
+        self._remember(profile)
+        return profile
+
+    def save(self, profile):
+        """Store (or update) `profile`; on disk the file is replaced atomically."""
+        self._remember(profile)
+        if self.root is None:
+            return
+        partial = self._path(profile.voice_id) + ".partial"
+        torch.save(profile.state_dict(), partial)
+        os.replace(partial, self._path(profile.voice_id))
+        self.evict(keep=profile.voice_id)
+
+    def evict(self, keep=None):
+        """Delete profiles past the TTL, then the least recently used over max_bytes (never `keep`)."""
+        if self.root is None or (self.max_bytes is None and self.ttl is None):
+            return
+        files = []  # (mtime, size, voice_id)
+        for name in os.listdir(self.root):
+            if not name.endswith(".pt"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name[: -len(".pt")]))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        now = time.time()
+        for mtime, size, voice_id in files:
+            expired = self.ttl is not None and now - mtime > self.ttl
+            over = self.max_bytes is not None and total > self.max_bytes
+            if voice_id == keep or not (expired or over):
+                continue
+            self.remove(voice_id)
+            total -= size
+
+    def remove(self, voice_id):
+        self._loaded.pop(voice_id, None)
+        if self.root is not None:
+            try:
+                os.remove(self._path(voice_id))
+            except FileNotFoundError:
+                pass
+
+    def voice_ids(self):
+        ids = set(self._loaded)
+        if self.root is not None:
+            ids.update(name[: -len(".pt")] for name in os.listdir(self.root) if name.endswith(".pt"))
+        return sorted(ids)
+
+    def __contains__(self, voice_id):
+        return self.get(voice_id) is not None
@@ -22,6 +22,7 @@ from f5_tts.model.modules import (
     precompute_freqs_cis,
     get_pos_embed_indices,
 )
+from f5_tts.model.utils import drop_rows
 
 
 # text embedding
@@ -37,8 +38,7 @@ class TextEmbedding(nn.Module):
 
     def forward(self, text: int["b nt"], drop_text=False) -> int["b nt d"]:  # noqa: F722
         text = text + 1
-        if drop_text:
-            text = torch.zeros_like(text)
+        text = drop_rows(text, drop_text)
         text = self.text_embed(text)
 
         # sinus pos emb
@@ -62,8 +62,7 @@ class AudioEmbedding(nn.Module):
         self.conv_pos_embed = ConvPositionEmbedding(out_dim)
 
     def forward(self, x: float["b n d"], cond: float["b n d"], drop_audio_cond=False):  # noqa: F722
-        if drop_audio_cond:
-            cond = torch.zeros_like(cond)
+        cond = drop_rows(cond, drop_audio_cond)
         x = torch.cat((x, cond), dim=-1)
         x = self.linear(x)
         x = self.conv_pos_embed(x) + x
@@ -119,8 +118,8 @@ class MMDiT(nn.Module):
         cond: float["b n d"],  # masked cond audio  # noqa: F722
         text: int["b nt"],  # text  # noqa: F722
         time: float["b"] | float[""],  # time step  # noqa: F821 F722
-        drop_audio_cond,  # cfg for cond audio
-        drop_text,  # cfg for text
+        drop_audio_cond,  # cfg for cond audio; bool, or bool["b"] per sample
+        drop_text,  # cfg for text; bool, or bool["b"] per sample
         mask: bool["b n"] | None = None,  # noqa: F722
     ):
         batch = x.shape[0]
@@ -27,6 +27,7 @@ from f5_tts.model.modules import (
     precompute_freqs_cis,
     get_pos_embed_indices,
 )
+from f5_tts.model.utils import drop_rows
 
 
 # Text embedding
@@ -53,8 +54,7 @@ class TextEmbedding(nn.Module):
         batch, text_len = text.shape[0], text.shape[1]
         text = F.pad(text, (0, seq_len - text_len), value=0)
 
-        if drop_text:  # cfg for text
-            text = torch.zeros_like(text)
+        text = drop_rows(text, drop_text)  # cfg for text
 
         text = self.text_embed(text)  # b n -> b n d
 
@@ -81,14 +81,29 @@ class InputEmbedding(nn.Module):
         self.proj = nn.Linear(mel_dim * 2 + text_dim, out_dim)
         self.conv_pos_embed = ConvPositionEmbedding(dim=out_dim)
 
-    def forward(self, x: float["b n d"], cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
-        if drop_audio_cond:  # cfg for cond audio
-            cond = torch.zeros_like(cond)
-
-        x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
-        x = self.conv_pos_embed(x) + x
+    def forward(
+        self,
+        x: float["b n d"],  # noqa: F722
+        cond: float["b n d"],  # noqa: F722
+        text_embed: float["b n d"],  # noqa: F722
+        drop_audio_cond=False,
+        context: float["b n d"] | None = None,  # noqa: F722
+        mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        if context is None:
+            cond = drop_rows(cond, drop_audio_cond)  # cfg for cond audio
+            x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
+        else:  # cond and text part of the projection already applied, see project_context()
+            x = F.linear(x, self.proj.weight[:, : x.shape[-1]]) + context
+        x = self.conv_pos_embed(x, mask=mask) + x  # padded frames (mask) do not leak into the real ones
         return x
 
+    def project_context(self, cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
+        """The part of proj() that does not depend on x: cond and text columns plus bias."""
+        cond = drop_rows(cond, drop_audio_cond)
+        context = torch.cat((cond, text_embed), dim=-1)
+        return F.linear(context, self.proj.weight[:, -context.shape[-1] :], self.proj.bias)
+
 
 # Flat UNet Transformer backbone
 
@@ -161,31 +176,59 @@ class UNetT(nn.Module):
         self.norm_out = RMSNorm(dim)
         self.proj_out = nn.Linear(dim, mel_dim)
 
+    def precompute(
+        self,
+        cond: float["b n d"],  # masked cond audio  # noqa: F722
+        text: int["b nt"],  # text  # noqa: F722
+        drop_audio_cond=False,
+        drop_text=False,
+        text_len: int | None = None,
+    ):
+        """The parts of forward() that stay the same across the ODE steps of one sampling call
+        (text embedding, cond/text half of the input projection, rotary embedding).
+        Pass the result to forward() as `cache`.
+
+        With `text_len`, the text is embedded as for a sequence of that many frames and
+        zero-padded to the rest, so frames padded on afterwards (see compiled.py) do not
+        change the text embedding of the real ones."""
+        seq_len = cond.shape[1]
+        text_embed = self.text_embed(text, text_len or seq_len, drop_text=drop_text)
+        text_embed = F.pad(text_embed, (0, 0, 0, seq_len - text_embed.shape[1]), value=0.0)
+        return {
+            "context": self.input_embed.project_context(cond, text_embed, drop_audio_cond=drop_audio_cond),
+            "rope": self.rotary_embed.forward_from_seq_len(seq_len + 1),
+        }
+
     def forward(
         self,
         x: float["b n d"],  # nosied input audio  # noqa: F722
         cond: float["b n d"],  # masked cond audio  # noqa: F722
         text: int["b nt"],  # text  # noqa: F722
         time: float["b"] | float[""],  # time step  # noqa: F821 F722
-        drop_audio_cond,  # cfg for cond audio
-        drop_text,  # cfg for text
+        drop_audio_cond,  # cfg for cond audio; bool, or bool["b"] per sample
+        drop_text,  # cfg for text; bool, or bool["b"] per sample
         mask: bool["b n"] | None = None,  # noqa: F722
+        cache: dict | None = None,  # from precompute(), for the same cond, text and drop flags
+        time_emb: float["b d"] | None = None,  # time_embed(time), if already computed  # noqa: F722
     ):
         batch, seq_len = x.shape[0], x.shape[1]
         if time.ndim == 0:
             time = time.repeat(batch)
 
         # t: conditioning time, c: context (text + masked cond audio), x: noised input audio
-        t = self.time_embed(time)
-        text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
-        x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond)
+        t = time_emb if time_emb is not None else self.time_embed(time)
+        if cache is None:
+            text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
+            x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond, mask=mask)
+        else:
+            x = self.input_embed(x, None, None, context=cache["context"], mask=mask)
 
         # postfix time t to input x, [b n d] -> [b n+1 d]
         x = torch.cat([t.unsqueeze(1), x], dim=1)  # pack t to x
         if mask is not None:
             mask = F.pad(mask, (1, 0), value=1)
 
-        rope = self.rotary_embed.forward_from_seq_len(seq_len + 1)
+        rope = self.rotary_embed.forward_from_seq_len(seq_len + 1) if cache is None else cache["rope"]
 
         # flat unet transformer
         skip_connect_type = self.skip_connect_type
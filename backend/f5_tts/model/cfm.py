@@ -12,12 +12,15 @@ from __future__ import annotations
 from random import random
 from typing import Callable
 
+import time
+
 import torch
 import torch.nn.functional as F
 from torch import nn
 from torch.nn.utils.rnn import pad_sequence
 from torchdiffeq import odeint
 
+from f5_tts.model.compiled import DEFAULT_BUCKETS, BucketedTransformer
 from f5_tts.model.modules import MelSpec
 from f5_tts.model.utils import (
     default,
@@ -29,6 +32,45 @@ from f5_tts.model.utils import (
 )
 
 
+class SamplingSession:
+    """Step-invariant transformer inputs for one CFM.sample call and one cfg branch.
+
+    The text, cond audio, drop flags and sequence length are fixed for all ODE
+    steps. The transformer's precompute() (DiT, UNetT) embeds them once; each
+    step then only runs the part of forward() that depends on x and the time.
+    With the time grid known up front (`times`, euler), the time embeddings of
+    all steps are computed in one call as well. `forward` runs those steps in
+    place of the transformer itself, e.g. its compiled version, and `text_len`
+    is the unpadded sequence length when cond is padded to a bucket (see compiled.py).
+    """
+
+    def __init__(self, transformer, cond, text, drop, times=None, forward=None, text_len=None):
+        self.transformer = transformer
+        self.forward = transformer if forward is None else forward
+        self.drop = drop
+        self.cache = transformer.precompute(cond, text, drop_audio_cond=drop, drop_text=drop, text_len=text_len)
+        self.times = times
+        self.time_embs = transformer.time_embed(times) if times is not None else None
+
+    def __call__(self, x, time, mask=None):
+        time_emb = None
+        if self.time_embs is not None:
+            # index of the grid point being evaluated, found on the device (no host sync)
+            step = torch.argmin((self.times - time).abs())
+            time_emb = self.time_embs[step].expand(x.shape[0], -1)
+        return self.forward(
+            x=x,
+            cond=None,
+            text=None,
+            time=time,
+            mask=mask,
+            drop_audio_cond=self.drop,
+            drop_text=self.drop,
+            cache=self.cache,
+            time_emb=time_emb,
+        )
+
+
 class CFM(nn.Module):
     def __init__(
         self,
@@ -74,10 +116,42 @@ class CFM(nn.Module):
         # vocab map for tokenization
         self.vocab_char_map = vocab_char_map
 
+        # shape-bucketed compiled transformer step, see compile_sampling()
+        self.compiled = None
+        # onnxruntime sessions run in place of the transformer, see f5_tts/infer/onnx_backend.py
+        self.onnx = None
+
     @property
     def device(self):
         return next(self.parameters()).device
 
+    def compile_sampling(self, buckets=DEFAULT_BUCKETS, cache_dir=None, batch_sizes=(1,), cfg_strength=2.0, **compile_kwargs):
+        """Let sample() run the transformer compiled, with durations padded to `buckets` (see compiled.py).
+
+        Compiles every bucket for every batch size in `batch_sizes` now, by sampling
+        two steps of silence (cfg_strength > 0: the fused cfg graph of a doubled batch).
+        Other batch sizes compile on first use. `compile_kwargs` go to torch.compile
+        (backend, mode). Returns the warm-up seconds per (bucket, batch size).
+        """
+        self.compiled = BucketedTransformer(self.transformer, buckets, cache_dir, **compile_kwargs)
+        dtype = next(self.parameters()).dtype
+        warmup = {}
+        for bucket in self.compiled.buckets:
+            for batch in batch_sizes:
+                start = time.perf_counter()
+                with torch.inference_mode():
+                    self.sample(
+                        cond=torch.zeros(batch, 1, self.num_channels, device=self.device, dtype=dtype),
+                        text=torch.zeros(batch, 1, dtype=torch.long, device=self.device),
+                        duration=bucket,
+                        steps=2,
+                        cfg_strength=cfg_strength,
+                        max_duration=bucket,
+                    )
+                warmup[bucket, batch] = time.perf_counter() - start
+        self.compiled.save_artifacts()
+        return warmup
+
     @torch.no_grad()
     def sample(
         self,
@@ -96,7 +170,12 @@ class CFM(nn.Module):
         duplicate_test=False,
         t_inter=0.1,
         edit_mask=None,
+        fused_cfg=True,
+        precompute=True,
     ):
+        # fused_cfg: run the conditional and the null (cfg) prediction of each step as one
+        # forward over a 2b batch, instead of two forwards of b
+        # precompute: compute what does not change across steps once (see SamplingSession)
         self.eval()
         # raw wave
 
@@ -137,19 +216,25 @@ class CFM(nn.Module):
         duration = duration.clamp(max=max_duration)
         max_duration = duration.amax()
 
+        # with compile_sampling(), pad to the next length bucket so the compiled graph of that length is reused
+        bucket = None
+        if exists(self.compiled) and precompute and not exists(self.onnx):
+            bucket = self.compiled.bucket(int(max_duration))
+        seq_len = default(bucket, max_duration)
+
         # duplicate test corner for inner time step oberservation
         if duplicate_test:
             test_cond = F.pad(cond, (0, 0, cond_seq_len, max_duration - 2 * cond_seq_len), value=0.0)
 
-        cond = F.pad(cond, (0, 0, 0, max_duration - cond_seq_len), value=0.0)
-        cond_mask = F.pad(cond_mask, (0, max_duration - cond_mask.shape[-1]), value=False)
+        cond = F.pad(cond, (0, 0, 0, seq_len - cond_seq_len), value=0.0)
+        cond_mask = F.pad(cond_mask, (0, seq_len - cond_mask.shape[-1]), value=False)
         cond_mask = cond_mask.unsqueeze(-1)
         step_cond = torch.where(
             cond_mask, cond, torch.zeros_like(cond)
         )  # allow direct control (cut cond audio) with lens passed in
 
-        if batch > 1:
-            mask = lens_to_mask(duration)
+        if batch > 1 or exists(bucket):
+            mask = lens_to_mask(duration, length=seq_len)
         else:  # save memory and speed up, as single inference need no mask currently
             mask = None
 
@@ -159,20 +244,41 @@ class CFM(nn.Module):
 
         # neural ode
 
+        use_cfg = cfg_strength >= 1e-5
+        fused_cfg = fused_cfg and use_cfg
+        # transformer inputs per branch: conditional, null (audio cond and text dropped),
+        # and both at once as the two halves of a 2b batch
+        branches = {"cond": (step_cond, text, False), "null": (step_cond, text, True)}
+        if fused_cfg:
+            cfg_mask = torch.cat((mask, mask)) if exists(mask) else None
+            cfg_drop = torch.arange(2 * batch, device=device) >= batch
+            branches = {"cfg": (torch.cat((step_cond, step_cond)), torch.cat((text, text)), cfg_drop)}
+        elif not use_cfg:
+            del branches["null"]
+        sessions = {}
+
+        def predict(branch, x, t, mask):
+            if branch in sessions:
+                return sessions[branch](x, t, mask)
+            branch_cond, branch_text, drop = branches[branch]
+            return self.transformer(
+                x=x, cond=branch_cond, text=branch_text, time=t, mask=mask, drop_audio_cond=drop, drop_text=drop
+            )
+
         def fn(t, x):
             # at each step, conditioning is fixed
             # step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
 
+            if fused_cfg:
+                pred, null_pred = predict("cfg", torch.cat((x, x)), t, cfg_mask).chunk(2)
+                return pred + (pred - null_pred) * cfg_strength
+
             # predict flow
-            pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=False, drop_text=False
-            )
-            if cfg_strength < 1e-5:
+            pred = predict("cond", x, t, mask)
+            if not use_cfg:
                 return pred
 
-            null_pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=True, drop_text=True
-            )
+            null_pred = predict("null", x, t, mask)
             return pred + (pred - null_pred) * cfg_strength
 
         # noise input
@@ -184,6 +290,8 @@ class CFM(nn.Module):
                 torch.manual_seed(seed)
             y0.append(torch.randn(dur, self.num_channels, device=self.device, dtype=step_cond.dtype))
         y0 = pad_sequence(y0, padding_value=0, batch_first=True)
+        if exists(bucket):
+            y0 = F.pad(y0, (0, 0, 0, bucket - y0.shape[1]), value=0.0)
 
         t_start = 0
 
@@ -197,7 +305,24 @@ class CFM(nn.Module):
         if sway_sampling_coef is not None:
             t = t + sway_sampling_coef * (torch.cos(torch.pi / 2 * t) - 1 + t)
 
+        if exists(self.onnx):
+            sessions = {
+                branch: self.onnx.session(branch_cond, branch_text, drop)
+                for branch, (branch_cond, branch_text, drop) in branches.items()
+            }
+        elif precompute and hasattr(self.transformer, "precompute"):
+            # euler evaluates the flow exactly at the grid points, so their time embeddings can be computed up front
+            times = t if self.odeint_kwargs.get("method", "euler") == "euler" else None
+            forward, text_len = (self.compiled.forward, int(max_duration)) if exists(bucket) else (None, None)
+            sessions = {
+                branch: SamplingSession(self.transformer, branch_cond, branch_text, drop, times, forward, text_len)
+                for branch, (branch_cond, branch_text, drop) in branches.items()
+            }
+
         trajectory = odeint(fn, y0, t, **self.odeint_kwargs)
+        if exists(bucket):  # drop the bucket padding
+            frames = int(max_duration)
+            trajectory, cond, cond_mask = trajectory[:, :, :frames], cond[:, :frames], cond_mask[:, :frames]
 
         sampled = trajectory[-1]
         out = sampled
@@ -0,0 +1,81 @@
+"""Shape-bucketed torch.compile of the transformer step in CFM.sample.
+
+torch.compile specializes each graph on its input shapes. CFM.sample's
+sequence length is the longest requested duration, which differs for nearly
+every request, so a compiled transformer would recompile on almost every
+call (minutes each for the full-size DiT). Instead CFM.sample pads the
+sequence up to the next of a few fixed lengths, the buckets. The padded
+frames are masked out of attention and of the convolutional position
+embedding. Only one graph per bucket and batch size is then ever compiled,
+and these can all be built at start-up (CFM.compile_sampling).
+
+Only the per-step part of the transformer is compiled. The text embedding
+and the other inputs that stay the same across ODE steps are computed
+eagerly, once per call (precompute(), see SamplingSession), so the text
+length never reaches the compiled graph. That needs a backbone with
+precompute() (DiT, UNetT).
+
+With a `cache_dir` the compiled artifacts are saved to disk after warm-up
+(torch.compiler.save_cache_artifacts) and loaded again by the next process
+before it compiles. That process still traces the model but skips inductor's
+code generation and C++/Triton builds. On CPU inductor emits C++, so a C++
+compiler must be on PATH.
+"""
+import hashlib
+import os
+
+import torch
+
+DEFAULT_BUCKETS = (512, 768, 1024, 1280, 1536, 2048, 3072, 4096)  # mel frames; 4096 is CFM.sample's max_duration
+
+
+class BucketedTransformer:
+    def __init__(self, transformer, buckets=DEFAULT_BUCKETS, cache_dir=None, backend="inductor", mode=None):
+        if not hasattr(transformer, "precompute"):
+            raise ValueError(f"{type(transformer).__name__} has no precompute(); bucketed compile needs DiT or UNetT")
+        self.transformer = transformer
+        self.buckets = tuple(sorted(set(buckets)))
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.mode = mode
+        # one graph per bucket, batch size and cfg branch; keep them all instead of falling back to eager
+        torch._dynamo.config.recompile_limit = max(torch._dynamo.config.recompile_limit, 4 * len(self.buckets))
+        self.forward = torch.compile(transformer, dynamic=False, backend=backend, mode=mode)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.load_artifacts()
+
+    def bucket(self, frames):
+        """The smallest bucket holding `frames`, or None when all are shorter (the call then runs eagerly)."""
+        for size in self.buckets:
+            if frames <= size:
+                return size
+        return None
+
+    def artifact_path(self):
+        """Cache file for this model architecture, dtype, device type, torch version and compile options."""
+        params = sorted((name, tuple(p.shape), str(p.dtype)) for name, p in self.transformer.state_dict().items())
+        device = next(self.transformer.parameters()).device.type
+        key = repr((torch.__version__, type(self.transformer).__name__, params, device, self.backend, self.mode))
+        return os.path.join(self.cache_dir, f"compiled-{hashlib.md5(key.encode('utf-8')).hexdigest()}.bin")
+
+    def load_artifacts(self):
+        """Load kernels compiled by an earlier process, if there are any. Returns whether a file was loaded."""
+        path = self.artifact_path()
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            torch.compiler.load_cache_artifacts(f.read())
+        return True
+
+    def save_artifacts(self):
+        """Write everything compiled in this process so far to the cache file (atomically)."""
+        if self.cache_dir is None:
+            return
+        artifacts = torch.compiler.save_cache_artifacts()
+        if artifacts is None:
+            return
+        path = self.artifact_path()
+        with open(path + ".partial", "wb") as f:
+            f.write(artifacts[0])
+        os.replace(path + ".partial", path)
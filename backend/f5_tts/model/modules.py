@@ -133,6 +133,7 @@ class MelSpec(nn.Module):
         self.win_length = win_length
         self.n_mel_channels = n_mel_channels
         self.target_sample_rate = target_sample_rate
+        self.mel_spec_type = mel_spec_type
 
         if mel_spec_type == "vocos":
             self.extractor = get_vocos_mel_spectrogram
@@ -195,7 +196,10 @@ class ConvPositionEmbedding(nn.Module):
             x = x.masked_fill(~mask, 0.0)
 
         x = x.permute(0, 2, 1)
-        x = self.conv1d(x)
+        x = self.conv1d[:2](x)
+        if mask is not None:  # keep the padding at zero for the second conv too, as if the input ended there
+            x = x.masked_fill(~mask.permute(0, 2, 1), 0.0)
+        x = self.conv1d[2:](x)
         out = x.permute(0, 2, 1)
 
         if mask is not None:
@@ -442,8 +446,7 @@ class AttnProcessor:
         # mask. e.g. inference got a batch with different target durations, mask out the padding
         if mask is not None:
             attn_mask = mask
-            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n'
-            attn_mask = attn_mask.expand(batch_size, attn.heads, query.shape[-2], key.shape[-2])
+            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n', broadcast (an expanded mask is much slower)
         else:
             attn_mask = None
 
@@ -520,8 +523,7 @@ class JointAttnProcessor:
         # mask. e.g. inference got a batch with different target durations, mask out the padding
         if mask is not None:
             attn_mask = F.pad(mask, (0, c.shape[1]), value=True)  # no mask for c (text)
-            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n'
-            attn_mask = attn_mask.expand(batch_size, attn.heads, query.shape[-2], key.shape[-2])
+            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n', broadcast (an expanded mask is much slower)
         else:
             attn_mask = None
 
@@ -689,8 +691,8 @@ class RotaryEmbedding(nn.Module):
         base *= base_rescale_factor ** (dim / (dim - 2))
 
         inv_freq = 1.0 / (base ** (torch.arange(0, dim, 2).float() / dim))
-        self.inv_freq = inv_freq
-        # self.register_buffer('inv_freq', inv_freq)
+        # a buffer so it follows the model to its device (not in the state dict, like before)
+        self.register_buffer("inv_freq", inv_freq, persistent=False)
 
         assert interpolation_factor >= 1.0
         self.interpolation_factor = interpolation_factor
@@ -705,7 +707,7 @@ class RotaryEmbedding(nn.Module):
         self.scale = scale
 
     def forward_from_seq_len(self, seq_len: int) -> tuple[torch.Tensor, float]:
-        t = torch.arange(seq_len)
+        t = torch.arange(seq_len, device=self.inv_freq.device)
         return self(t)
 
     def forward(self, t: torch.Tensor) -> tuple[torch.Tensor, float]:
@@ -713,7 +715,8 @@ class RotaryEmbedding(nn.Module):
 
         freqs = torch.einsum("i , j -> i j", t.to(self.inv_freq.dtype), self.inv_freq) / self.interpolation_factor
         freqs = torch.stack((freqs, freqs), axis=-1)
-        freqs = rearrange(freqs, "... d r -> ... (d r)")
+        # leading batch dim, as x_transformers' apply_rotary_pos_emb expects
+        freqs = rearrange(freqs, "n d r -> 1 n (d r)")
 
         if self.scale is None:
             return freqs, 1.0
@@ -721,7 +724,7 @@ class RotaryEmbedding(nn.Module):
         power = (t - (max_pos // 2)) / self.scale_base
         scale = self.scale ** rearrange(power, "n -> n 1")
         scale = torch.stack((scale, scale), axis=-1)
-        scale = rearrange(scale, "... d r -> ... (d r)")
+        scale = rearrange(scale, "n d r -> 1 n (d r)")
 
         return freqs, scale
 
@@ -745,9 +748,10 @@ class DurationInputEmbedding(nn.Module):
         self,
         x: float["b n d"],  # noqa: F722
         text_embed: float["b n d"],  # noqa: F722
+        mask: bool["b n"] | None = None,  # noqa: F722
     ):
         x = self.proj(torch.concatenate((x, text_embed), axis=-1))
-        x = self.conv_pos_embed(x) + x
+        x = self.conv_pos_embed(x, mask=mask) + x
         return x
 
 
@@ -810,8 +814,7 @@ class DurationTransformer(nn.Module):
         from f5_tts.model.backbones.dit import TextEmbedding
 
         self.text_embed = TextEmbedding(text_num_embeds, text_dim, conv_layers=conv_layers)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.input_embed = DurationInputEmbedding(mel_dim, text_dim, dim).to(self.device)
+        self.input_embed = DurationInputEmbedding(mel_dim, text_dim, dim)
 
         self.rotary_embed = RotaryEmbedding(dim_head)
 
@@ -840,9 +843,9 @@ class DurationTransformer(nn.Module):
         mask: bool["b n"] | None = None,  # noqa: F722
     ):
         seq_len = x.shape[1]
-        text_embed = self.text_embed(text, seq_len).to(self.device)
+        text_embed = self.text_embed(text, seq_len)
 
-        x = self.input_embed(x, text_embed).to("cpu")
+        x = self.input_embed(x, text_embed, mask=mask)
 
         rope = self.rotary_embed.forward_from_seq_len(seq_len)
         for block in self.transformer_blocks:
@@ -864,7 +867,6 @@ class DurationPredictor(nn.Module):
         super().__init__()
 
         # mel spec
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self._mel_spec = MelSpec(**mel_spec_kwargs)
         num_channels = default(num_channels, self._mel_spec.n_mel_channels)
         self.num_channels = num_channels
@@ -882,6 +884,53 @@ class DurationPredictor(nn.Module):
 
         self.to_pred = nn.Sequential(nn.Linear(dim, 1, bias=False), nn.Softplus(), Rearrange("... 1 -> ..."))
 
+    @property
+    def device(self):
+        return next(self.parameters()).device
+
+    def tokenize(self, text: list[str]) -> int["b nt"]:  # noqa: F722
+        if exists(self._vocab_char_map):
+            return list_str_to_idx(text, self._vocab_char_map)
+        return list_str_to_tensor(text)
+
+    @torch.inference_mode()
+    def predict_frames(
+        self,
+        cond: float["b n d"] | float["b nw"],  # reference mel or raw wave, batch of 1 # noqa: F722
+        texts: list[str],
+        *,
+        speed=1.0,
+        max_batch=32,
+    ) -> int["b"]:  # noqa: F821
+        """Durations in mel frames of several texts (reference + chunk text) spoken in the voice of `cond`.
+
+        The reference mel is computed (if a wave is given) and moved to the
+        model's device once. The texts run through the transformer as one
+        padded batch (of at most `max_batch`); attention, the position conv
+        and the mean are masked to each text's own length, so a text gets
+        what forward() predicts for it alone, up to the text convolutions
+        at the padding boundary.
+        """
+        if cond.ndim == 2:
+            cond = rearrange(self._mel_spec(cond), "b d n -> b n d")
+        cond = cond.to(self.device, next(self.parameters()).dtype)
+        ref_len = cond.shape[1]
+        frame_rate = self._mel_spec.target_sample_rate // self._mel_spec.hop_length
+
+        frames = []
+        for start in range(0, len(texts), max_batch):
+            text = self.tokenize(texts[start : start + max_batch]).to(self.device)
+            # as in forward(): a text longer than the reference lengthens the (zero padded) input
+            lens = (text != -1).sum(dim=-1).clamp(min=ref_len)
+            seq_len = int(lens.max())
+            mask = lens_to_mask(lens, length=seq_len)
+            inp = F.pad(cond, (0, 0, 0, seq_len - ref_len)).expand(text.shape[0], -1, -1)
+
+            x = self.transformer(inp, text=text, mask=mask)
+            pred = self.to_pred(maybe_masked_mean(x, mask))
+            frames.append((pred * frame_rate / speed).to(torch.long))
+        return torch.cat(frames)
+
     def forward(
         self,
         inp: torch.Tensor["b n d"] | torch.Tensor["b nw"],  # mel or raw wave # noqa: F722
@@ -900,15 +949,12 @@ class DurationPredictor(nn.Module):
 
         # handle text as string
         if isinstance(text, list):
-            if exists(self._vocab_char_map):
-                text = list_str_to_idx(text, self._vocab_char_map)
-            else:
-                text = list_str_to_tensor(text)
+            text = self.tokenize(text)
             assert text.shape[0] == batch
 
         if seq_len < text.shape[1]:
             seq_len = text.shape[1]
-            inp = F.pad(inp, [(0, 0), (0, seq_len - inp.shape[1]), (0, 0)])
+            inp = F.pad(inp, (0, 0, 0, seq_len - inp.shape[1]))
 
         # lens and mask
         if not exists(lens):
@@ -916,7 +962,7 @@ class DurationPredictor(nn.Module):
 
         if seq_len < text.shape[1]:
             seq_len = text.shape[1]
-            inp = F.pad(inp, [(0, 0), (0, seq_len - inp.shape[1]), (0, 0)])
+            inp = F.pad(inp, (0, 0, 0, seq_len - inp.shape[1]))
 
         mask = lens_to_mask(lens, length=seq_len)
 
@@ -931,10 +977,11 @@ class DurationPredictor(nn.Module):
 
         # attending
 
-        mask.to(self.device)
-        inp.to(self.device)
+        mask = mask.to(self.device)
+        inp = inp.to(self.device)
+        text = text.to(self.device)
 
-        inp = torch.where(repeat(mask, "b n -> b n d", d=self.num_channels).to(self.device), inp, torch.zeros_like(inp).to(self.device))
+        inp = torch.where(repeat(mask, "b n -> b n d", d=self.num_channels), inp, torch.zeros_like(inp))
 
         x = self.transformer(inp, text=text)
 
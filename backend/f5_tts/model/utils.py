@@ -39,6 +39,16 @@ def default(v, d):
 # tensor helpers
 
 
+def drop_rows(t: torch.Tensor, drop: bool | bool["b"]) -> torch.Tensor:  # noqa: F821
+    """Zero `t` for classifier-free guidance: all of it if `drop` is True, or only the batch rows
+    flagged in a bool tensor `drop` (how CFM.sample runs the conditional and null passes as one batch)."""
+    if torch.is_tensor(drop):
+        return t.masked_fill(drop.view(-1, *([1] * (t.ndim - 1))), 0)
+    if drop:
+        return torch.zeros_like(t)
+    return t
+
+
 def lens_to_mask(t: int["b"], length: int | None = None) -> bool["b n"]:  # noqa: F722 F821
     if not exists(length):
         length = t.amax()
@@ -72,7 +82,7 @@ def maybe_masked_mean(t: float["b n d"], mask: bool["b n"] = None) -> float["b d
 
     t = torch.where(mask[:, :, None], t, torch.tensor(0.0, device=t.device))
     num = t.sum(dim=1)
-    den = mask.float().sum(dim=1)
+    den = mask.float().sum(dim=1, keepdim=True)
 
     return num / den.clamp(min=1.0)
 
@@ -0,0 +1,91 @@
+"""Check CFM.sample with the shape-bucketed compiled transformer against eager mode.
+
+Compiles a small randomly initialised DiT / UNetT for a few length buckets
+(CFM.compile_sampling), then samples durations that fall inside each bucket
+twice with the same noise: once eagerly and once through the compiled step,
+padded to the bucket. Reports per bucket the warm-up (compile) time, the
+time per ODE step of both modes, the speedup and the largest difference;
+exits non-zero if a bucket differs by more than --atol. The speedup is also
+given against eager sampling of the full bucket length, which leaves out
+the cost of the padding (finer buckets pad less but compile more graphs).
+
+With --cache-dir, run it twice: the second run loads the kernels the first
+one saved and its warm-up times show the warm start.
+
+    python f5_tts/scripts/check_compile_buckets.py --device cpu --buckets 256,512,1024 --cache-dir /tmp/f5-compile
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+import torch
+
+from f5_tts.model import CFM, DiT, UNetT
+
+
+BACKBONES = {
+    "DiT": lambda: DiT(dim=256, depth=4, heads=4, ff_mult=2, text_dim=128, conv_layers=2),
+    "UNetT": lambda: UNetT(dim=256, depth=4, heads=4, ff_mult=4, text_dim=128, conv_layers=2),
+}
+
+
+def timed_sample(model, duration, steps, device, n_mel_channels=100):
+    """Sample one duration-long mel (a third of it reference) and return it with the seconds per step."""
+    cond = torch.randn(1, duration // 3, n_mel_channels, generator=torch.Generator().manual_seed(duration)).to(device)
+    text = torch.randint(0, 255, (1, duration // 4), generator=torch.Generator().manual_seed(duration)).to(device)
+    if cond.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    with torch.inference_mode():
+        out, _ = model.sample(
+            cond=cond, text=text, duration=duration, steps=steps, cfg_strength=2.0, sway_sampling_coef=-1.0, seed=0
+        )
+    if cond.is_cuda:
+        torch.cuda.synchronize()
+    return out, (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--backbones", default="DiT,UNetT")
+    parser.add_argument("--buckets", default="256,512,1024", help="comma-separated bucket lengths in mel frames")
+    parser.add_argument("--cache-dir", help="keep the compiled kernels here (warm start on the next run)")
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    buckets = sorted(int(b) for b in args.buckets.split(","))
+    torch.manual_seed(0)
+    failed = False
+    for name in args.backbones.split(","):
+        model = CFM(transformer=BACKBONES[name]()).to(args.device)
+        warmup = model.compile_sampling(buckets, cache_dir=args.cache_dir)
+        compiled = model.compiled
+        for previous, bucket in zip([0] + buckets, buckets):
+            # a length inside the bucket (not on it), so the padding is exercised
+            duration = max(previous + 1, bucket - (bucket - previous) // 3)
+            model.compiled = None
+            timed_sample(model, duration, 2, args.device)  # warm-up
+            eager, eager_step = timed_sample(model, duration, args.steps, args.device)
+            _, eager_bucket_step = timed_sample(model, bucket, args.steps, args.device)
+            model.compiled = compiled
+            bucketed, compiled_step = timed_sample(model, duration, args.steps, args.device)
+            diff = (eager - bucketed).abs().max().item()
+            ok = diff <= args.atol
+            failed |= not ok
+            print(
+                f"{name:6s} bucket {bucket:5d} (duration {duration:5d}) warm-up {warmup[bucket, 1]:6.1f} s  "
+                f"max|diff| {diff:.2e} {'ok' if ok else 'MISMATCH'}  per step: eager {eager_step * 1000:.1f} ms, "
+                f"compiled {compiled_step * 1000:.1f} ms ({eager_step / compiled_step:.2f}x; "
+                f"{eager_bucket_step / compiled_step:.2f}x against eager at the full bucket length)"
+            )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Check F5TTS's reduced-precision CPU modes (precision="bf16" / "int8") against fp32.
+
+Synthesizes the same text with the same seed on the CPU once per precision
+(see f5_tts/infer/precision.py) and reports:
+
+* the real-time factor (synthesis seconds per second of audio) and the speedup over fp32
+* the mel L1 distance of the output to the fp32 output (log mel, F5-TTS's own extractor)
+* with --sim-ckpt (the WavLM-large ECAPA-TDNN checkpoint eval/utils_eval.py uses), the
+  speaker similarity of the output to the reference and to the fp32 output
+
+Exits non-zero if a precision exceeds --max-mel-l1 or falls below --min-sim
+(similarity to the fp32 output), when these are given.
+
+    python f5_tts/scripts/check_cpu_precision.py --ref-audio ref.wav --ref-text "..." --gen-text "..." \\
+        --sim-ckpt wavlm_large_finetune.pth --min-sim 0.9
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+import soundfile as sf
+import torch
+import torch.nn.functional as F
+import torchaudio
+
+from f5_tts.api import F5TTS
+from f5_tts.eval.ecapa_tdnn import ECAPA_TDNN_SMALL
+from f5_tts.infer.precision import PRECISIONS
+
+
+def load_sim_model(ckpt):
+    model = ECAPA_TDNN_SMALL(feat_dim=1024, feat_type="wavlm_large", config_path=None)
+    state_dict = torch.load(ckpt, weights_only=True, map_location="cpu")
+    model.load_state_dict(state_dict["model"], strict=False)
+    return model.eval()
+
+
+@torch.inference_mode()
+def speaker_embedding(model, wav, sr):
+    wav = torch.as_tensor(wav, dtype=torch.float32).reshape(1, -1)
+    return model(torchaudio.functional.resample(wav, sr, 16000))
+
+
+@torch.inference_mode()
+def log_mel(tts, wav):
+    return tts.ema_model.mel_spec(torch.as_tensor(wav, dtype=torch.float32).reshape(1, -1))[0]
+
+
+def synthesize(args, precision):
+    """Load F5TTS in `precision`, warm it up, and return (tts, wave, sample rate, synthesis seconds)."""
+    tts = F5TTS(
+        model_type=args.model_type, ckpt_file=args.ckpt, vocab_file=args.vocab, device="cpu", precision=precision
+    )
+    settings = dict(nfe_step=args.nfe_step, seed=args.seed, show_info=lambda *_: None)
+    tts.infer(args.ref_audio, args.ref_text, "Warming up.", **settings)  # also stores the reference voice
+    start = time.perf_counter()
+    wav, sr, _ = tts.infer(args.ref_audio, args.ref_text, args.gen_text, **settings)
+    return tts, wav, sr, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--model-type", default="F5-TTS")
+    parser.add_argument("--ckpt", default="", help="model checkpoint (default: the F5-TTS base model from the hub)")
+    parser.add_argument("--vocab", default="")
+    parser.add_argument("--ref-audio", required=True)
+    parser.add_argument("--ref-text", default="")
+    parser.add_argument("--gen-text", required=True)
+    parser.add_argument("--precisions", default="bf16,int8", help=f"comma-separated, of {PRECISIONS}; fp32 always runs")
+    parser.add_argument("--nfe-step", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--sim-ckpt", help="ECAPA-TDNN (WavLM large) checkpoint for speaker similarity")
+    parser.add_argument("--max-mel-l1", type=float)
+    parser.add_argument("--min-sim", type=float)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    sim_model = load_sim_model(args.sim_ckpt) if args.sim_ckpt else None
+    if sim_model is not None:
+        ref_wav, ref_sr = sf.read(args.ref_audio, dtype="float32", always_2d=True)
+        ref_emb = speaker_embedding(sim_model, ref_wav.mean(axis=1), ref_sr)
+
+    base, base_wav, sr, base_seconds = synthesize(args, "fp32")
+    base_mel = log_mel(base, base_wav)
+    base_emb = speaker_embedding(sim_model, base_wav, sr) if sim_model is not None else None
+    del base
+
+    failed = False
+    for precision in ["fp32"] + [p for p in args.precisions.split(",") if p != "fp32"]:
+        if precision == "fp32":
+            tts, wav, seconds = None, base_wav, base_seconds
+        else:
+            tts, wav, sr, seconds = synthesize(args, precision)
+            if tts.precision != precision:
+                print(f"{precision:5s} not available here, ran as {tts.precision}")
+                continue
+        rtf = seconds / (len(wav) / sr)
+        line = f"{precision:5s} RTF {rtf:.3f} ({base_seconds / seconds:.2f}x fp32)"
+        if tts is not None:
+            mel = log_mel(tts, wav)
+            frames = min(mel.shape[-1], base_mel.shape[-1])
+            mel_l1 = (mel[:, :frames] - base_mel[:, :frames]).abs().mean().item()
+            line += f"  mel L1 to fp32 {mel_l1:.3f}"
+            failed |= args.max_mel_l1 is not None and mel_l1 > args.max_mel_l1
+        if sim_model is not None:
+            emb = speaker_embedding(sim_model, wav, sr)
+            sim_ref = F.cosine_similarity(emb, ref_emb)[0].item()
+            sim_base = F.cosine_similarity(emb, base_emb)[0].item()
+            line += f"  SIM to ref {sim_ref:.3f}, to fp32 {sim_base:.3f}"
+            failed |= args.min_sim is not None and sim_base < args.min_sim
+        print(line)
+        del tts
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Check DurationPredictor.predict_frames against one forward() per text.
+
+Builds a small randomly initialised duration model, predicts the duration of
+several reference + chunk texts with one batched predict_frames call and
+with one forward() call per text (as inference used to), and reports the
+frame counts and the time of both. Exits non-zero if a count differs by more
+than --max-diff frames.
+
+    python f5_tts/scripts/check_duration_batch.py --device cuda --chunks 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+import torch
+
+from f5_tts.model.modules import DurationPredictor, DurationTransformer, MelSpec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--ref-frames", type=int, default=300)
+    parser.add_argument("--max-diff", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = DurationPredictor(
+        transformer=DurationTransformer(dim=128, depth=2, heads=4, text_dim=64, ff_mult=2, conv_layers=2),
+    ).to(args.device).eval()
+    mel_spec = MelSpec()
+    frame_rate = mel_spec.target_sample_rate // mel_spec.hop_length
+
+    ref_text = "some call me nature, others call me mother nature. "
+    # chunk texts of similar, not equal, lengths (as chunk_text makes them);
+    # with a short --ref-frames some are longer than the reference and pad past it
+    texts = [ref_text + "word " * (30 + 4 * i) for i in range(args.chunks)]
+    cond = torch.randn(1, args.ref_frames, mel_spec.n_mel_channels, device=args.device)
+
+    with torch.inference_mode():
+        model.predict_frames(cond, texts[:1])  # warm-up
+        start = time.perf_counter()
+        single = [int((model(cond, [text]) * frame_rate).to(torch.long).item()) for text in texts]
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = model.predict_frames(cond, texts).tolist()
+        batched_time = time.perf_counter() - start
+
+    diffs = [abs(a - b) for a, b in zip(single, batched)]
+    for i, (a, b) in enumerate(zip(single, batched)):
+        print(f"chunk {i}: text {len(texts[i]):4d} chars, forward {a:5d} frames, predict_frames {b:5d} frames")
+    print(
+        f"max |diff| {max(diffs)} frames, one forward per text {single_time * 1000:.1f} ms, "
+        f"batched {batched_time * 1000:.1f} ms ({single_time / batched_time:.2f}x)"
+    )
+    sys.exit(1 if max(diffs) > args.max_diff else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Check CFM.sample's fused classifier-free guidance and step-invariant precomputation.
+
+Samples from small randomly initialised DiT / UNetT / MMDiT models twice with
+the same noise and compares the two runs:
+
+* by default fused_cfg=False (conditional and null forwards one after the
+  other) against fused_cfg=True (one forward over a doubled batch)
+* with --precompute, precompute=False (text embedding, input projection,
+  rotary and time embeddings recomputed at every ODE step) against
+  precompute=True (computed once per call, see SamplingSession), with fused
+  and with two-pass cfg, for the backbones that have precompute()
+
+Reports the largest difference and the time per ODE step; exits non-zero if
+any comparison differs by more than --atol.
+
+    python f5_tts/scripts/check_fused_cfg.py --device cuda --batch 1 --steps 16
+    python f5_tts/scripts/check_fused_cfg.py --precompute --steps 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+
+import torch
+
+from f5_tts.model import CFM, DiT, MMDiT, UNetT
+
+
+BACKBONES = {
+    "DiT": lambda: DiT(dim=256, depth=4, heads=4, ff_mult=2, text_dim=128, conv_layers=2),
+    "UNetT": lambda: UNetT(dim=256, depth=4, heads=4, ff_mult=4, text_dim=128, conv_layers=2),
+    "MMDiT": lambda: MMDiT(dim=256, depth=4, heads=4, ff_mult=2),
+}
+
+
+def make_inputs(batch, frames, device, n_mel_channels=100):
+    """Reference mels, padded text and durations of different lengths per sample (exercises the mask when batch > 1)."""
+    lens = torch.tensor([frames // 2 - 10 * i for i in range(batch)], device=device)
+    duration = torch.tensor([frames - 20 * i for i in range(batch)], device=device)
+    cond = torch.randn(batch, int(lens.max()), n_mel_channels, device=device)
+    text_lens = [60 - 5 * i for i in range(batch)]
+    text = torch.full((batch, max(text_lens)), -1, dtype=torch.long, device=device)
+    for i, length in enumerate(text_lens):
+        text[i, :length] = torch.randint(0, 255, (length,))
+    return cond, text, duration, lens
+
+
+def timed_sample(model, inputs, steps, fused_cfg, precompute=True):
+    cond, text, duration, lens = inputs
+    if cond.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    out, _ = model.sample(
+        cond=cond,
+        text=text,
+        duration=duration,
+        lens=lens,
+        steps=steps,
+        cfg_strength=2.0,
+        sway_sampling_coef=-1.0,
+        seed=0,
+        fused_cfg=fused_cfg,
+        precompute=precompute,
+    )
+    if cond.is_cuda:
+        torch.cuda.synchronize()
+    return out, (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--frames", type=int, default=400)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--precompute", action="store_true", help="compare precompute off/on instead of two-pass/fused cfg")
+    parser.add_argument("--atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    # (label, baseline, candidate), each a (name, timed_sample settings) pair
+    if args.precompute:
+        comparisons = [
+            (cfg, ("uncached", dict(fused_cfg=fused_cfg, precompute=False)), ("cached", dict(fused_cfg=fused_cfg)))
+            for cfg, fused_cfg in (("fused", True), ("two-pass", False))
+        ]
+    else:
+        comparisons = [("", ("two-pass", dict(fused_cfg=False)), ("fused", dict(fused_cfg=True)))]
+
+    torch.manual_seed(0)
+    failed = False
+    with torch.inference_mode():
+        for name, build in BACKBONES.items():
+            model = CFM(transformer=build()).to(args.device)
+            if args.precompute and not hasattr(model.transformer, "precompute"):
+                continue
+            inputs = make_inputs(args.batch, args.frames, args.device)
+            timed_sample(model, inputs, 2, True)  # warm-up
+            for label, (base_name, base_settings), (new_name, new_settings) in comparisons:
+                base, base_step = timed_sample(model, inputs, args.steps, **base_settings)
+                out, step = timed_sample(model, inputs, args.steps, **new_settings)
+                diff = (base - out).abs().max().item()
+                ok = diff <= args.atol
+                failed |= not ok
+                label = f"{label:8s} " if label else ""
+                print(
+                    f"{name:6s} {label}max|diff| {diff:.2e} {'ok' if ok else 'MISMATCH'}  "
+                    f"per step: {base_name} {base_step * 1000:.1f} ms, {new_name} {step * 1000:.1f} ms "
+                    f"({base_step / step:.2f}x)"
+                )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
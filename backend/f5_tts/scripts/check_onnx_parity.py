@@ -0,0 +1,118 @@
+"""Check the onnxruntime backend (f5_tts/infer/onnx_backend.py) against the PyTorch path.
+
+Exports a randomly initialised DiT and Vocos to ONNX, then samples the same
+inputs and noise with CFM.sample twice, once eagerly and once through
+onnxruntime (CFM.onnx), for Euler and midpoint and for a single sample and a
+masked batch. Also decodes the result with both vocoders. Reports the
+largest difference and the time of both paths; exits non-zero if any
+differs by more than --atol. The default model is small; pass --dim 1024
+--depth 22 --text-dim 512 --conv-layers 4 for the F5-TTS base size.
+
+    python f5_tts/scripts/check_onnx_parity.py --threads 8 --frames 800
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import torch
+from vocos import Vocos
+from vocos.feature_extractors import MelSpectrogramFeatures
+from vocos.heads import ISTFTHead
+from vocos.models import VocosBackbone
+
+from f5_tts.infer.onnx_backend import OnnxTransformer, OnnxVocos, export_onnx
+from f5_tts.model import CFM, DiT
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--text-dim", type=int, default=128)
+    parser.add_argument("--conv-layers", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=400)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--threads", type=int, help="torch and onnxruntime intra-op threads")
+    parser.add_argument("--onnx-dir", help="keep the exported graphs here (default: a temporary directory)")
+    parser.add_argument("--atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    heads = args.dim // 64
+    model = CFM(
+        transformer=DiT(
+            dim=args.dim, depth=args.depth, heads=heads, ff_mult=2, text_dim=args.text_dim, conv_layers=args.conv_layers
+        )
+    ).eval()
+    vocoder = Vocos(
+        MelSpectrogramFeatures(),
+        VocosBackbone(input_channels=100, dim=512, intermediate_dim=1536, num_layers=8),
+        ISTFTHead(dim=512, n_fft=1024, hop_length=256, padding="same"),
+    ).eval()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        onnx_dir = args.onnx_dir or tmp
+        _, export_seconds = timed(lambda: export_onnx(model, vocoder, onnx_dir))
+        print(f"exported in {export_seconds:.1f}s")
+        runtime = OnnxTransformer(onnx_dir, model.transformer.dim, args.threads)
+        onnx_vocoder = OnnxVocos(onnx_dir, vocoder, args.threads)
+
+        failed = False
+        for method, batch in (("euler", 1), ("euler", 2), ("midpoint", 1)):
+            model.odeint_kwargs = dict(method=method)
+            cond = torch.randn(batch, args.frames // 3, 100)
+            text = torch.randint(0, 255, (batch, args.frames // 4))
+            duration = torch.tensor([args.frames - 40 * i for i in range(batch)])
+
+            def sample():
+                with torch.inference_mode():
+                    return model.sample(
+                        cond=cond, text=text, duration=duration, steps=args.steps, cfg_strength=2.0,
+                        sway_sampling_coef=-1.0, seed=0,
+                    )[0]
+
+            model.onnx = None
+            sample()  # warm-up
+            eager, eager_seconds = timed(sample)
+            model.onnx = runtime
+            sample()
+            ort, ort_seconds = timed(sample)
+            diff = (eager - ort).abs().max().item()
+            ok = diff <= args.atol
+            failed |= not ok
+            print(
+                f"{method:8s} batch {batch}  max|diff| {diff:.2e} {'ok' if ok else 'MISMATCH'}  "
+                f"torch {eager_seconds:.2f}s, onnxruntime {ort_seconds:.2f}s ({eager_seconds / ort_seconds:.2f}x)"
+            )
+
+        mel = eager.permute(0, 2, 1)
+        with torch.inference_mode():
+            vocoder.decode(mel)
+            wave, eager_seconds = timed(lambda: vocoder.decode(mel))
+        onnx_vocoder.decode(mel)
+        onnx_wave, ort_seconds = timed(lambda: onnx_vocoder.decode(mel))
+        diff = (wave - onnx_wave).abs().max().item()
+        ok = diff <= args.atol
+        failed |= not ok
+        print(
+            f"vocos             max|diff| {diff:.2e} {'ok' if ok else 'MISMATCH'}  "
+            f"torch {eager_seconds:.2f}s, onnxruntime {ort_seconds:.2f}s ({eager_seconds / ort_seconds:.2f}x)"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Stand-in for worker.py that needs no models, no GPU and no network.
+
+It speaks the same line protocol as worker.py (and reuses its `serve()`), so
+a WorkerPool can run it in place of the real worker. That lets the
+orchestration in main.py (scheduler, admission, caches, events, downloads)
+be exercised on a CPU-only box. loadtest.py runs the pool on it through the
+pool's WORKER_SCRIPT environment variable:
+
+    WORKER_POOL=1 WORKER_SCRIPT=fake_worker.py uvicorn main:app
+
+Every task takes a time derived from the size of its input, like the real
+models do:
+
+* tts: FAKE_TTS_BASE_SECONDS plus FAKE_TTS_SECONDS_PER_CHAR per character of
+  the script. Writes a tone as the 24 kHz WAV (and the 16 kHz copy), one
+  second per FAKE_TTS_CHARS_PER_SECOND characters.
+* lipsync: FAKE_LIPSYNC_BASE_SECONDS plus FAKE_LIPSYNC_SECONDS_PER_WINDOW per
+  16-frame window of the audio at 25 fps, with one progress event per window.
+  The input video is copied to the output, so the result is a valid mp4.
+  Progressive output (`stream_dir`) is not faked.
+
+FAKE_WORKER_MODE=sleep (default) waits; `burn` spins the CPU for the same
+time, which shows how the API server copes with busy cores.
+"""
+import argparse
+import contextlib
+import math
+import os
+import shutil
+import sys
+import time
+import wave
+
+from worker import _open_protocol_stream, serve
+
+MODE = os.environ.get("FAKE_WORKER_MODE", "sleep")
+WARMUP_SECONDS = float(os.environ.get("FAKE_WARMUP_SECONDS", "0.5"))
+TTS_BASE_SECONDS = float(os.environ.get("FAKE_TTS_BASE_SECONDS", "0.5"))
+TTS_SECONDS_PER_CHAR = float(os.environ.get("FAKE_TTS_SECONDS_PER_CHAR", "0.01"))
+TTS_CHARS_PER_SECOND = float(os.environ.get("FAKE_TTS_CHARS_PER_SECOND", "15"))
+LIPSYNC_BASE_SECONDS = float(os.environ.get("FAKE_LIPSYNC_BASE_SECONDS", "1.0"))
+LIPSYNC_SECONDS_PER_WINDOW = float(os.environ.get("FAKE_LIPSYNC_SECONDS_PER_WINDOW", "0.2"))
+
+TTS_SAMPLE_RATE = 24000
+LIPSYNC_SAMPLE_RATE = 16000
+VIDEO_FPS = 25
+WINDOW_FRAMES = 16
+
+
+def spend(seconds):
+    """Take `seconds` of wall time, sleeping or keeping one core busy (FAKE_WORKER_MODE)."""
+    if MODE != "burn":
+        time.sleep(seconds)
+        return
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(i * i for i in range(10000))
+
+
+def write_tone(path, seconds, sample_rate, frequency=220.0):
+    """Mono 16-bit WAV holding a sine tone."""
+    samples = max(1, int(seconds * sample_rate))
+    frames = bytearray()
+    for n in range(samples):
+        value = int(8000 * math.sin(2 * math.pi * frequency * n / sample_rate))
+        frames += value.to_bytes(2, "little", signed=True)
+    with wave.open(path, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(bytes(frames))
+
+
+def wav_seconds(path):
+    """Duration of a WAV file, or 0 if it cannot be read as one."""
+    try:
+        with contextlib.closing(wave.open(path, "rb")) as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    except (OSError, EOFError, wave.Error):
+        return 0.0
+
+
+def resource_usage():
+    usage = {"peak_rss_bytes": None, "gpu_peak_bytes": None}
+    try:
+        import resource
+
+        usage["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    return usage
+
+
+class FakeTTSBackend:
+    def warmup(self):
+        spend(WARMUP_SECONDS)
+
+    def run(self, params, progress):
+        if params.get("task") == "prepare_ref":
+            spend(TTS_BASE_SECONDS)
+            shutil.copyfile(params["ref_audio"], params["out_wav"])
+            return {"out_wav": params["out_wav"], "ref_text": params.get("ref_text") or "fake reference text. "}
+        text = params.get("gen_text") or ""
+        start = time.time()
+        spend(TTS_BASE_SECONDS + TTS_SECONDS_PER_CHAR * len(text))
+        sampling = time.time() - start
+        seconds = max(1.0, len(text) / TTS_CHARS_PER_SECOND)
+        write_tone(params["out_wav"], seconds, TTS_SAMPLE_RATE)
+        if params.get("out_wav_16k"):
+            write_tone(params["out_wav_16k"], seconds, LIPSYNC_SAMPLE_RATE)
+        timings = {"tts_sampling": sampling, "tts_vocoder": time.time() - start - sampling}
+        return {"out_wav": params["out_wav"], "timings": timings, **resource_usage()}
+
+
+class FakeLipsyncBackend:
+    def warmup(self):
+        spend(WARMUP_SECONDS)
+
+    def run(self, params, progress):
+        frames = wav_seconds(params["audio_path"]) * VIDEO_FPS
+        windows = max(1, math.ceil(frames / WINDOW_FRAMES))
+        start = time.time()
+        spend(LIPSYNC_BASE_SECONDS)
+        for window in range(windows):
+            spend(LIPSYNC_SECONDS_PER_WINDOW)
+            progress(stage="lipsync", window=window + 1, windows=windows)
+        denoising = time.time() - start
+        shutil.copyfile(params["video_path"], params["video_out_path"])
+        timings = {"unet_denoising": denoising, "mux": time.time() - start - denoising}
+        return {"video_out_path": params["video_out_path"], "timings": timings, **resource_usage()}
+
+
+BACKENDS = {
+    "tts": FakeTTSBackend,
+    "lipsync": FakeLipsyncBackend,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model-free stand-in for worker.py (load tests)")
+    parser.add_argument("--kind", choices=sorted(BACKENDS), required=True)
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the simulated warm-up")
+    args = parser.parse_args()
+
+    proto = _open_protocol_stream()
+    backend = BACKENDS[args.kind]()
+    if not args.no_warmup:
+        backend.warmup()
+    print(f"[fake-worker] {args.kind} ready (pid={os.getpid()}, mode={MODE})", file=sys.stderr)
+    serve(backend, proto)
+
+
+if __name__ == "__main__":
+    main()
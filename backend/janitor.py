@@ -0,0 +1,229 @@
+"""Run-directory lifecycle manager for main.py.
+
+Every request leaves a `runs/<job_id>/` directory behind (uploads,
+reference_24k.wav, LatentSync scratch files, generated_out.wav,
+final_output.mp4). The janitor sweeps the runs root periodically and
+
+* deletes files of finished jobs once they are older than the TTL of their
+  artifact class: intermediates go first, uploaded inputs later, final
+  outputs last,
+* keeps files that a client is downloading right now (`pin()`),
+* enforces a global byte quota by evicting whole runs, least recently used
+  (finished or downloaded) first, and
+* removes run directories that end up empty, so the runs root stays small.
+
+Jobs that are still queued or running are never touched; neither is the
+shared directory of a batch group while any job of the group is. When an output is
+deleted the job row's audio_path/video_path is cleared so `/api/jobs/{id}`
+stops reporting it as ready.
+"""
+import collections
+import logging
+import os
+import shutil
+import threading
+import time
+
+import jobstore
+
+INTERMEDIATE = "intermediate"
+INPUT = "input"
+OUTPUT = "output"
+
+# output file name -> job column that points at it
+OUTPUT_COLUMNS = {"generated_out.wav": "audio_path", "final_output.mp4": "video_path"}
+
+# names under RUNS_ROOT that are not run directories
+SKIP_NAMES = {"cache"}
+
+# a run dir without a job row may be an upload still in progress; leave it alone this long
+ORPHAN_GRACE = 3600
+
+# a pin whose unpin never came (e.g. the client vanished mid-download) stops protecting the file after this long
+PIN_MAX_SECONDS = 3600
+
+
+def classify(name):
+    """Artifact class of a file/dir inside a run directory."""
+    if ".partial." in name:
+        return INTERMEDIATE
+    if name in OUTPUT_COLUMNS:
+        return OUTPUT
+    if name.startswith("input_"):
+        return INPUT
+    return INTERMEDIATE
+
+
+def _size_of(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+    return not os.path.exists(path)
+
+
+def _liveness(store, job):
+    """`(live, finished_at)` of a job row; a batch row also counts its group's jobs."""
+    jobs = [job]
+    if job["kind"] == "batch":
+        jobs += store.list_group(job["id"])
+    live = any(j["state"] not in jobstore.TERMINAL_STATES for j in jobs)
+    return live, max((j["finished_at"] or 0 for j in jobs), default=0) or None
+
+
+class Janitor:
+    def __init__(self, runs_root, store, ttls, max_bytes=0):
+        self.runs_root = runs_root
+        self.store = store
+        # artifact class -> seconds after the job finished; 0 keeps the class forever
+        self.ttls = dict(ttls)
+        # 0 disables the quota
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        # path -> [holders, time of the latest pin]
+        self._pins = {}
+        # run_id -> last download time (the LRU clock besides finished_at)
+        self._last_used = {}
+        self.last_sweep = None
+        self.freed_bytes = collections.Counter()
+        self.removed_files = collections.Counter()
+        self.evicted_runs = 0
+
+    # -- pinning ------------------------------------------------------------
+
+    def pin(self, path):
+        """Protect `path` from deletion until `unpin(path)`; also marks its run as recently used."""
+        run_id = os.path.basename(os.path.dirname(path))
+        now = time.time()
+        with self._lock:
+            pin = self._pins.setdefault(path, [0, now])
+            pin[0] += 1
+            pin[1] = now
+            self._last_used[run_id] = now
+
+    def unpin(self, path):
+        with self._lock:
+            pin = self._pins.get(path)
+            if pin is not None:
+                pin[0] -= 1
+                if pin[0] <= 0:
+                    del self._pins[path]
+
+    def _is_pinned(self, path):
+        with self._lock:
+            pin = self._pins.get(path)
+            return pin is not None and time.time() - pin[1] < PIN_MAX_SECONDS
+
+    # -- sweeping -----------------------------------------------------------
+
+    def _delete(self, run_id, path, name):
+        """Delete one artifact unless pinned. Returns the bytes freed, or None if it was kept."""
+        if self._is_pinned(path):
+            return None
+        size = _size_of(path)
+        if not _remove(path):
+            return None
+        kind = classify(name)
+        self.freed_bytes[kind] += size
+        self.removed_files[kind] += 1
+        column = OUTPUT_COLUMNS.get(name)
+        if column is not None and self.store.get(run_id) is not None:
+            self.store.update(run_id, **{column: None})
+        return size
+
+    def sweep(self):
+        """One pass over the runs root. Blocking; run it off the event loop."""
+        start = time.time()
+        now = start
+        runs = []  # (last_used, run_id, run_dir, remaining bytes)
+        usage = collections.Counter()
+        active_bytes = 0
+        try:
+            entries = list(os.scandir(self.runs_root))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.is_dir() or entry.name in SKIP_NAMES:
+                continue
+            run_id, run_dir = entry.name, entry.path
+            job = self.store.get(run_id)
+            live, finished = _liveness(self.store, job) if job is not None else (False, None)
+            if live or (job is None and now - entry.stat().st_mtime < ORPHAN_GRACE):
+                active_bytes += _size_of(run_dir)
+                continue
+            finished = finished or entry.stat().st_mtime
+            remaining = 0
+            for name in os.listdir(run_dir):
+                path = os.path.join(run_dir, name)
+                ttl = self.ttls.get(classify(name))
+                if ttl and now - finished > ttl and self._delete(run_id, path, name) is not None:
+                    continue
+                size = _size_of(path)
+                usage[classify(name)] += size
+                remaining += size
+            if not os.listdir(run_dir):
+                os.rmdir(run_dir)
+                with self._lock:
+                    self._last_used.pop(run_id, None)
+                continue
+            with self._lock:
+                last_used = max(finished, self._last_used.get(run_id, 0))
+            runs.append((last_used, run_id, run_dir, remaining))
+
+        total = active_bytes + sum(run[3] for run in runs)
+        if self.max_bytes and total > self.max_bytes:
+            for _, run_id, run_dir, _ in sorted(runs):
+                if total <= self.max_bytes:
+                    break
+                freed = 0
+                for name in os.listdir(run_dir):
+                    size = self._delete(run_id, os.path.join(run_dir, name), name) or 0
+                    usage[classify(name)] -= size
+                    freed += size
+                total -= freed
+                if freed:
+                    self.evicted_runs += 1
+                    logging.info("[janitor] evicted run %s (%d bytes) to stay under the quota", run_id, freed)
+                if not os.listdir(run_dir):
+                    os.rmdir(run_dir)
+
+        self.last_sweep = {
+            "at": start,
+            "duration": time.time() - start,
+            "runs": len(runs),
+            "active_bytes": active_bytes,
+            "bytes": dict(usage),
+            "total_bytes": total,
+        }
+
+    def stats(self):
+        with self._lock:
+            pinned = len(self._pins)
+        return {
+            "ttls": self.ttls,
+            "max_bytes": self.max_bytes,
+            "pinned_files": pinned,
+            "freed_bytes": dict(self.freed_bytes),
+            "removed_files": dict(self.removed_files),
+            "evicted_runs": self.evicted_runs,
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,157 @@
+"""SQLite-backed job table for main.py.
+
+One row per generation request (the row id is the run_id / job_id handed to
+the client). The scheduler records state and stage transitions (and how
+long each stage took) here so job status survives a server restart and `/api/debug/runs` can page through jobs
+without listing the runs directory. Jobs created together by a batch request
+share a `group_id` (the id of the batch's own row). `first_frame_at` is when
+a video job first had something to play (its first stream segment, or the
+finished file).
+"""
+import json
+import sqlite3
+import threading
+import time
+
+# Job states. `queued` and `running` are live; the rest are terminal.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    client      TEXT NOT NULL DEFAULT '',
+    priority    INTEGER NOT NULL DEFAULT 0,
+    state       TEXT NOT NULL,
+    stage       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL,
+    error       TEXT,
+    audio_path  TEXT,
+    video_path  TEXT,
+    params      TEXT,
+    timings     TEXT,
+    group_id    TEXT,
+    first_frame_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+_COLUMNS = (
+    "id", "kind", "client", "priority", "state", "stage", "created_at", "started_at",
+    "updated_at", "finished_at", "error", "audio_path", "video_path", "params", "timings", "group_id",
+    "first_frame_at",
+)
+
+# columns stored as JSON text
+_JSON_COLUMNS = ("params", "timings")
+
+# columns added after the first release: name -> type, added to existing databases on open
+_ADDED_COLUMNS = {"timings": "TEXT", "group_id": "TEXT", "first_frame_at": "REAL"}
+
+
+class JobStore:
+    """Thread-safe wrapper around a single SQLite connection.
+
+    `on_update(job_id, fields)` is called after every `update()` (outside the
+    lock) so main.py can push state changes to subscribed clients.
+    """
+
+    def __init__(self, path, on_update=None):
+        self.path = path
+        self.on_update = on_update
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for name, kind in _ADDED_COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_group_id ON jobs (group_id)")
+
+    def _row_to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for name in _JSON_COLUMNS:
+            job[name] = json.loads(job[name]) if job.get(name) else {}
+        return job
+
+    def create(self, job_id, kind, client="", priority=0, params=None, group_id=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, client, priority, state, created_at, updated_at, params, group_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, client or "", int(priority), QUEUED, now, now, json.dumps(params or {}), group_id),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id, **fields):
+        """Set the given columns (plus updated_at) on one job."""
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"unknown job columns: {sorted(unknown)}")
+        changed = dict(fields)
+        for name in _JSON_COLUMNS:
+            if name in fields:
+                fields[name] = json.dumps(fields[name] or {})
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        if self.on_update is not None:
+            self.on_update(job_id, changed)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def list(self, offset=0, limit=50, state=None):
+        """Return `(jobs, total)` newest first."""
+        where, args = ("WHERE state = ?", (state,)) if state else ("", ())
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM jobs {where}", args).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?", (*args, int(limit), int(offset))
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows], total
+
+    def list_group(self, group_id):
+        """Jobs of one batch group, in creation order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE group_id = ? ORDER BY created_at, rowid", (group_id,)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def count_by_state(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def fail_interrupted(self, reason="interrupted by server restart"):
+        """Mark jobs left queued/running by a previous process as failed. Returns how many."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished_at = ?, updated_at = ? WHERE state IN (?, ?)",
+                (FAILED, reason, now, now, QUEUED, RUNNING),
+            )
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -4,6 +4,7 @@ import inspect
 import math
 import os
 import shutil
+import tempfile
 from typing import Callable, List, Optional, Union
 import subprocess
 
@@ -34,7 +35,9 @@ import time
 from ..models.unet import UNet3DConditionModel
 from ..utils.util import read_video, read_audio, write_video, check_ffmpeg_installed
 from ..utils.image_processor import ImageProcessor, load_fixed_mask
+from ..utils.hls_writer import HLSWriter
 from ..whisper.audio2feature import Audio2Feature
+from ..whisper.whisper.audio import SAMPLE_RATE as WHISPER_SAMPLE_RATE
 import tqdm
 import soundfile as sf
 
@@ -250,10 +253,23 @@ class LipsyncPipeline(DiffusionPipeline):
         images = images.cpu().numpy()
         return images
 
+    def prepare_image_processor(self, height: int, mask_image_path: str):
+        # The face detector (insightface) is expensive to build, so keep it across
+        # calls when the pipeline is reused by a long-lived worker.
+        key = (height, mask_image_path)
+        if getattr(self, "_image_processor_key", None) != key:
+            mask_image = load_fixed_mask(height, mask_image_path)
+            self.image_processor = ImageProcessor(height, device="cuda", mask_image=mask_image)
+            self._image_processor_key = key
+        return self.image_processor
+
     def affine_transform_video(self, video_frames: np.ndarray):
         faces = []
         boxes = []
         affine_matrices = []
+        # AlignRestore smooths each frame's alignment with the previous one; start every video
+        # fresh so a reused image processor doesn't carry the last job's bias into this one.
+        self.image_processor.restorer.p_bias = None
         print(f"Affine transforming {len(video_frames)} faces...")
         for frame in tqdm.tqdm(video_frames):
             face, box, affine_matrix = self.image_processor.affine_transform(frame)
@@ -279,10 +295,43 @@ class LipsyncPipeline(DiffusionPipeline):
             out_frames.append(out_frame)
         return np.stack(out_frames, axis=0)
 
-    def loop_video(self, whisper_chunks: list, video_frames: np.ndarray):
+    def load_or_align_video(self, video_frames: np.ndarray, alignment_cache: str):
+        """affine_transform_video() of the whole video, saved to / loaded from `alignment_cache`.
+
+        Lets several generations on the same video (e.g. a batch of scripts)
+        run face detection and alignment once. The cache is used only if it
+        was made for as many frames with the same image processor (height and
+        mask, see prepare_image_processor).
+        """
+        key = [len(video_frames), *self._image_processor_key]
+        if os.path.exists(alignment_cache):
+            cached = torch.load(alignment_cache)
+            if cached.get("key") == key:
+                print(f"Using cached face alignment from {alignment_cache}")
+                return cached["faces"], cached["boxes"], cached["affine_matrices"]
+        faces, boxes, affine_matrices = self.affine_transform_video(video_frames)
+        # a temporary name of its own: jobs of the same batch may align the video at the same time
+        root, ext = os.path.splitext(alignment_cache)
+        fd, partial = tempfile.mkstemp(
+            dir=os.path.dirname(alignment_cache), prefix=os.path.basename(root) + ".", suffix=".partial" + ext
+        )
+        os.close(fd)
+        try:
+            torch.save({"key": key, "faces": faces, "boxes": boxes, "affine_matrices": affine_matrices}, partial)
+            os.replace(partial, alignment_cache)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return faces, boxes, affine_matrices
+
+    def loop_video(self, whisper_chunks: list, video_frames: np.ndarray, alignment_cache: Optional[str] = None):
+        aligned = None
+        if alignment_cache is not None:
+            aligned = self.load_or_align_video(video_frames, alignment_cache)
         # If the audio is longer than the video, we need to loop the video
         if len(whisper_chunks) > len(video_frames):
-            faces, boxes, affine_matrices = self.affine_transform_video(video_frames)
+            faces, boxes, affine_matrices = aligned or self.affine_transform_video(video_frames)
             num_loops = math.ceil(len(whisper_chunks) / len(video_frames))
             loop_video_frames = []
             loop_faces = []
@@ -304,6 +353,11 @@ class LipsyncPipeline(DiffusionPipeline):
             faces = torch.cat(loop_faces, dim=0)[: len(whisper_chunks)]
             boxes = loop_boxes[: len(whisper_chunks)]
             affine_matrices = loop_affine_matrices[: len(whisper_chunks)]
+        elif aligned is not None:
+            video_frames = video_frames[: len(whisper_chunks)]
+            faces = aligned[0][: len(whisper_chunks)]
+            boxes = aligned[1][: len(whisper_chunks)]
+            affine_matrices = aligned[2][: len(whisper_chunks)]
         else:
             video_frames = video_frames[: len(whisper_chunks)]
             faces, boxes, affine_matrices = self.affine_transform_video(video_frames)
@@ -330,6 +384,11 @@ class LipsyncPipeline(DiffusionPipeline):
         generator: Optional[Union[torch.Generator, List[torch.Generator]]] = None,
         callback: Optional[Callable[[int, int, torch.FloatTensor], None]] = None,
         callback_steps: Optional[int] = 1,
+        window_callback: Optional[Callable[[int, int], None]] = None,
+        timings: Optional[dict] = None,
+        alignment_cache: Optional[str] = None,
+        stream_dir: Optional[str] = None,
+        stream_segment_seconds: float = 2.0,
         **kwargs,
     ):
         is_train = self.unet.training
@@ -339,8 +398,7 @@ class LipsyncPipeline(DiffusionPipeline):
 
         # 0. Define call parameters
         device = self._execution_device
-        mask_image = load_fixed_mask(height, mask_image_path)
-        self.image_processor = ImageProcessor(height, device="cuda", mask_image=mask_image)
+        self.prepare_image_processor(height, mask_image_path)
         self.set_progress_bar_config(desc=f"Sample frames: {num_frames}")
 
         # 1. Default height and width to unet
@@ -362,123 +420,192 @@ class LipsyncPipeline(DiffusionPipeline):
         # 4. Prepare extra step kwargs.
         extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
 
-        whisper_feature = self.audio_encoder.audio2feat(audio_path)
-        whisper_chunks = self.audio_encoder.feature2chunks(feature_array=whisper_feature, fps=video_fps)
-
-        audio_samples = read_audio(audio_path)
-        video_frames = read_video(video_path, use_decord=False)
+        # per-stage wall time in seconds, reported to the caller through `timings`
+        if timings is None:
+            timings = {}
 
-        video_frames, faces, boxes, affine_matrices = self.loop_video(whisper_chunks, video_frames)
+        def add_timing(name, start):
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            timings[name] = timings.get(name, 0.0) + time.time() - start
 
-        synced_video_frames = []
+        t_stage = time.time()
+        # decode the audio once; Whisper takes the same 16 kHz mono samples that are muxed into the output
+        audio_samples = read_audio(audio_path, audio_sample_rate)
+        whisper_input = audio_samples.numpy() if audio_sample_rate == WHISPER_SAMPLE_RATE else None
+        whisper_feature = self.audio_encoder.audio2feat(audio_path, audio_samples=whisper_input)
+        whisper_chunks = self.audio_encoder.feature2chunks(feature_array=whisper_feature, fps=video_fps)
+        add_timing("audio_features", t_stage)
 
-        num_channels_latents = self.vae.config.latent_channels
+        t_stage = time.time()
+        video_frames = read_video(video_path, use_decord=False, temp_dir=temp_dir)
+        add_timing("video_decode", t_stage)
 
-        # Prepare latent variables
-        all_latents = self.prepare_latents(
-            len(whisper_chunks),
-            num_channels_latents,
-            height,
-            width,
-            weight_dtype,
-            device,
-            generator,
-        )
+        t_stage = time.time()
+        video_frames, faces, boxes, affine_matrices = self.loop_video(whisper_chunks, video_frames, alignment_cache)
+        add_timing("face_alignment", t_stage)
 
-        num_inferences = math.ceil(len(whisper_chunks) / num_frames)
-        for i in tqdm.tqdm(range(num_inferences), desc="Doing inference..."):
-            if self.unet.add_audio_layer:
-                audio_embeds = torch.stack(whisper_chunks[i * num_frames : (i + 1) * num_frames])
-                audio_embeds = audio_embeds.to(device, dtype=weight_dtype)
-                if do_classifier_free_guidance:
-                    null_audio_embeds = torch.zeros_like(audio_embeds)
-                    audio_embeds = torch.cat([null_audio_embeds, audio_embeds])
-            else:
-                audio_embeds = None
-            inference_faces = faces[i * num_frames : (i + 1) * num_frames]
-            latents = all_latents[:, :, i * num_frames : (i + 1) * num_frames]
-            ref_pixel_values, masked_pixel_values, masks = self.image_processor.prepare_masks_and_masked_images(
-                inference_faces, affine_transform=False
-            )
+        synced_video_frames = []
 
-            # 7. Prepare mask latent variables
-            mask_latents, masked_image_latents = self.prepare_mask_latents(
-                masks,
-                masked_pixel_values,
+        # Progressive output: restore each window as soon as it is decoded and
+        # feed it to an HLS encoder, so playback can start before the last window
+        stream = None
+        # the encoder is a child process: stop it on any failure before the playlist is finished, or
+        # it would end the stream with #EXT-X-ENDLIST once garbage collection closes its stdin
+        try:
+            if stream_dir is not None:
+                stream_audio = audio_samples[: int(len(video_frames) / video_fps * audio_sample_rate)].cpu().numpy()
+                stream = HLSWriter(
+                    stream_dir,
+                    (video_frames.shape[2], video_frames.shape[1]),
+                    video_fps,
+                    stream_audio,
+                    audio_sample_rate,
+                    segment_seconds=stream_segment_seconds,
+                )
+
+            num_channels_latents = self.vae.config.latent_channels
+
+            # Prepare latent variables
+            all_latents = self.prepare_latents(
+                len(whisper_chunks),
+                num_channels_latents,
                 height,
                 width,
                 weight_dtype,
                 device,
                 generator,
-                do_classifier_free_guidance,
-            )
-
-            # 8. Prepare image latents
-            ref_latents = self.prepare_image_latents(
-                ref_pixel_values,
-                device,
-                weight_dtype,
-                generator,
-                do_classifier_free_guidance,
             )
 
-            # 9. Denoising loop
-            # Compute warmup steps safely. Some schedulers (e.g. DPMSolverMultistep) may
-            # arrange internal timesteps differently; use a robust calculation.
-            num_warmup_steps = len(timesteps) - num_inference_steps
-            if num_warmup_steps < 0:
-                num_warmup_steps = 0
-            with self.progress_bar(total=num_inference_steps) as progress_bar:
-                # timing accumulators (UNet forward and scheduler.step)
-                unet_time_total = 0.0
-                scheduler_time_total = 0.0
-
-                for j, t in enumerate(timesteps):
-                    # expand the latents if we are doing classifier free guidance
-                    unet_input = torch.cat([latents] * 2) if do_classifier_free_guidance else latents
-
-                    unet_input = self.scheduler.scale_model_input(unet_input, t)
-
-                    # concat latents, mask, masked_image_latents in the channel dimension
-                    unet_input = torch.cat([unet_input, mask_latents, masked_image_latents, ref_latents], dim=1)
-
-                    # predict the noise residual (time the UNet forward pass)
-                    if device.type == "cuda":
-                        torch.cuda.synchronize()
-                    t0 = time.time()
-                    noise_pred = self.unet(unet_input, t, encoder_hidden_states=audio_embeds).sample
-                    if device.type == "cuda":
-                        torch.cuda.synchronize()
-                    unet_time_total += time.time() - t0
-
-                    # perform guidance
+            num_inferences = math.ceil(len(whisper_chunks) / num_frames)
+            for i in tqdm.tqdm(range(num_inferences), desc="Doing inference..."):
+                if self.unet.add_audio_layer:
+                    audio_embeds = torch.stack(whisper_chunks[i * num_frames : (i + 1) * num_frames])
+                    audio_embeds = audio_embeds.to(device, dtype=weight_dtype)
                     if do_classifier_free_guidance:
-                        noise_pred_uncond, noise_pred_audio = noise_pred.chunk(2)
-                        noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_audio - noise_pred_uncond)
-
-                    # compute the previous noisy sample x_t -> x_t-1 (time the scheduler)
-                    if device.type == "cuda":
-                        torch.cuda.synchronize()
-                    t1 = time.time()
-                    latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs).prev_sample
-                    if device.type == "cuda":
-                        torch.cuda.synchronize()
-                    scheduler_time_total += time.time() - t1
-
-                    # call the callback, if provided
-                    if j == len(timesteps) - 1 or ((j + 1) > num_warmup_steps and (j + 1) % self.scheduler.order == 0):
-                        progress_bar.update()
-                        if callback is not None and callback_steps is not None and j % callback_steps == 0:
-                            callback(j, t, latents)
-
-            # Recover the pixel values
-            decoded_latents = self.decode_latents(latents)
-            decoded_latents = self.paste_surrounding_pixels_back(
-                decoded_latents, ref_pixel_values, 1 - masks, device, weight_dtype
-            )
-            synced_video_frames.append(decoded_latents)
-
+                        null_audio_embeds = torch.zeros_like(audio_embeds)
+                        audio_embeds = torch.cat([null_audio_embeds, audio_embeds])
+                else:
+                    audio_embeds = None
+                inference_faces = faces[i * num_frames : (i + 1) * num_frames]
+                latents = all_latents[:, :, i * num_frames : (i + 1) * num_frames]
+                ref_pixel_values, masked_pixel_values, masks = self.image_processor.prepare_masks_and_masked_images(
+                    inference_faces, affine_transform=False
+                )
+
+                # 7. Prepare mask latent variables
+                mask_latents, masked_image_latents = self.prepare_mask_latents(
+                    masks,
+                    masked_pixel_values,
+                    height,
+                    width,
+                    weight_dtype,
+                    device,
+                    generator,
+                    do_classifier_free_guidance,
+                )
+
+                # 8. Prepare image latents
+                ref_latents = self.prepare_image_latents(
+                    ref_pixel_values,
+                    device,
+                    weight_dtype,
+                    generator,
+                    do_classifier_free_guidance,
+                )
+
+                # 9. Denoising loop
+                # Compute warmup steps safely. Some schedulers (e.g. DPMSolverMultistep) may
+                # arrange internal timesteps differently; use a robust calculation.
+                num_warmup_steps = len(timesteps) - num_inference_steps
+                if num_warmup_steps < 0:
+                    num_warmup_steps = 0
+                with self.progress_bar(total=num_inference_steps) as progress_bar:
+                    # timing accumulators (UNet forward and scheduler.step)
+                    unet_time_total = 0.0
+                    scheduler_time_total = 0.0
+
+                    for j, t in enumerate(timesteps):
+                        # expand the latents if we are doing classifier free guidance
+                        unet_input = torch.cat([latents] * 2) if do_classifier_free_guidance else latents
+
+                        unet_input = self.scheduler.scale_model_input(unet_input, t)
+
+                        # concat latents, mask, masked_image_latents in the channel dimension
+                        unet_input = torch.cat([unet_input, mask_latents, masked_image_latents, ref_latents], dim=1)
+
+                        # predict the noise residual (time the UNet forward pass)
+                        if device.type == "cuda":
+                            torch.cuda.synchronize()
+                        t0 = time.time()
+                        noise_pred = self.unet(unet_input, t, encoder_hidden_states=audio_embeds).sample
+                        if device.type == "cuda":
+                            torch.cuda.synchronize()
+                        unet_time_total += time.time() - t0
+
+                        # perform guidance
+                        if do_classifier_free_guidance:
+                            noise_pred_uncond, noise_pred_audio = noise_pred.chunk(2)
+                            noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_audio - noise_pred_uncond)
+
+                        # compute the previous noisy sample x_t -> x_t-1 (time the scheduler)
+                        if device.type == "cuda":
+                            torch.cuda.synchronize()
+                        t1 = time.time()
+                        latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs).prev_sample
+                        if device.type == "cuda":
+                            torch.cuda.synchronize()
+                        scheduler_time_total += time.time() - t1
+
+                        # call the callback, if provided
+                        if j == len(timesteps) - 1 or ((j + 1) > num_warmup_steps and (j + 1) % self.scheduler.order == 0):
+                            progress_bar.update()
+                            if callback is not None and callback_steps is not None and j % callback_steps == 0:
+                                callback(j, t, latents)
+
+                timings["unet_denoising"] = timings.get("unet_denoising", 0.0) + unet_time_total + scheduler_time_total
+
+                # Recover the pixel values
+                t_stage = time.time()
+                decoded_latents = self.decode_latents(latents)
+                decoded_latents = self.paste_surrounding_pixels_back(
+                    decoded_latents, ref_pixel_values, 1 - masks, device, weight_dtype
+                )
+                add_timing("vae_decode", t_stage)
+                if stream is not None:
+                    t_stage = time.time()
+                    window = slice(i * num_frames, i * num_frames + len(decoded_latents))
+                    stream.write(
+                        self.restore_video(decoded_latents, video_frames[window], boxes[window], affine_matrices[window])
+                    )
+                    add_timing("restore", t_stage)
+                else:
+                    synced_video_frames.append(decoded_latents)
+
+                # report per-window progress (windows done, total windows)
+                if window_callback is not None:
+                    window_callback(i + 1, num_inferences)
+
+            if stream is not None:
+                # the encoder already has every frame: finish the playlist and remux the segments into video_out_path
+                t_stage = time.time()
+                stream.close(video_out_path)
+                add_timing("mux", t_stage)
+        except BaseException:
+            if stream is not None:
+                stream.abort()
+            raise
+
+        if stream is not None:
+            if is_train:
+                self.unet.train()
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+            return
+
+        t_stage = time.time()
         synced_video_frames = self.restore_video(torch.cat(synced_video_frames), video_frames, boxes, affine_matrices)
+        add_timing("restore", t_stage)
 
         # Print timing summary for profiling/optimization
         try:
@@ -500,9 +627,11 @@ class LipsyncPipeline(DiffusionPipeline):
             shutil.rmtree(temp_dir)
         os.makedirs(temp_dir, exist_ok=True)
 
+        t_stage = time.time()
         write_video(os.path.join(temp_dir, "video.mp4"), synced_video_frames, fps=video_fps)
 
         sf.write(os.path.join(temp_dir, "audio.wav"), audio_samples, audio_sample_rate)
 
         command = f"ffmpeg -y -loglevel error -nostdin -i {os.path.join(temp_dir, 'video.mp4')} -i {os.path.join(temp_dir, 'audio.wav')} -c:v libx264 -crf 18 -c:a aac -q:v 0 -q:a 0 {video_out_path}"
         subprocess.run(command, shell=True)
+        add_timing("mux", t_stage)
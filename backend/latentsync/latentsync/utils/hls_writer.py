@@ -0,0 +1,123 @@
+"""Progressive output for LipsyncPipeline: an HLS (fMP4) stream written while windows render.
+
+One ffmpeg process reads restored RGB frames from a pipe and the matching
+audio from a WAV file, and writes a growing HLS event playlist:
+
+    stream_dir/index.m3u8   playlist, rewritten (atomically) after every segment
+    stream_dir/init.mp4     fMP4 initialisation segment
+    stream_dir/seg_00000.m4s ...
+
+ffmpeg interleaves by timestamp, so it only reads the audio as far as the
+video frames received so far, and it cuts a segment at every keyframe.
+Keyframes are forced every `segment_seconds`. Segments are renamed into place
+once complete, so a player polling the playlist can start while later windows
+are still on the GPU.
+
+`close()` finishes the playlist (#EXT-X-ENDLIST). It then builds the regular
+mp4 by concatenating the init and media segments, which together form a valid
+fragmented mp4, and stream-copying the result with the moov atom up front. The
+frames are encoded once rather than twice as in the non-progressive path.
+"""
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+PLAYLIST_NAME = "index.m3u8"
+INIT_NAME = "init.mp4"
+SEGMENT_PATTERN = "seg_%05d.m4s"
+
+
+class HLSWriter:
+    def __init__(
+        self,
+        stream_dir: str,
+        frame_size: tuple,
+        fps: int,
+        audio_samples: np.ndarray,
+        audio_sample_rate: int,
+        segment_seconds: float = 2.0,
+        crf: int = 18,
+    ):
+        """`frame_size` is (width, height) of the frames passed to write(); `audio_samples` covers the whole output."""
+        self.stream_dir = stream_dir
+        self.frame_size = tuple(int(v) for v in frame_size)
+        self.frames_written = 0
+        if os.path.exists(stream_dir):
+            shutil.rmtree(stream_dir)
+        os.makedirs(stream_dir)
+        # ffmpeg's second input; not one of the files served to players
+        self.audio_path = os.path.join(stream_dir, "audio.partial.wav")
+        sf.write(self.audio_path, audio_samples, audio_sample_rate)
+
+        gop = max(1, round(segment_seconds * fps))
+        width, height = self.frame_size
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error", "-nostdin",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-framerate", str(fps), "-i", "pipe:0",
+            "-i", self.audio_path,
+            "-map", "0:v", "-map", "1:a",
+            # libx264 with yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf), "-pix_fmt", "yuv420p",
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", "128k",
+            "-f", "hls",
+            "-hls_time", str(segment_seconds),
+            "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", INIT_NAME,
+            "-hls_segment_filename", os.path.join(stream_dir, SEGMENT_PATTERN),
+            "-hls_flags", "independent_segments+temp_file",
+            os.path.join(stream_dir, PLAYLIST_NAME),
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frames: np.ndarray):
+        """Append RGB uint8 frames of shape (n, height, width, 3)."""
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        width, height = self.frame_size
+        if frames.shape[1:] != (height, width, 3):
+            raise ValueError(f"expected frames of shape (n, {height}, {width}, 3), got {frames.shape}")
+        self.process.stdin.write(frames.tobytes())
+        self.process.stdin.flush()
+        self.frames_written += len(frames)
+
+    def segments(self):
+        """Media segments published so far, in order."""
+        names = [name for name in os.listdir(self.stream_dir) if name.startswith("seg_") and name.endswith(".m4s")]
+        return [os.path.join(self.stream_dir, name) for name in sorted(names)]
+
+    def close(self, video_out_path: str = None):
+        """Finish the stream; with `video_out_path` also write the whole video there as a regular mp4."""
+        self.process.stdin.close()
+        returncode = self.process.wait()
+        if os.path.exists(self.audio_path):
+            os.remove(self.audio_path)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg HLS encoder exited with code {returncode}")
+        if video_out_path is None:
+            return
+        fragmented = os.path.join(self.stream_dir, "full.partial.mp4")
+        with open(fragmented, "wb") as out:
+            for path in [os.path.join(self.stream_dir, INIT_NAME)] + self.segments():
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, out)
+        try:
+            subprocess.run(
+                ["ffmpeg", "-y", "-loglevel", "error", "-nostdin", "-i", fragmented,
+                 "-c", "copy", "-movflags", "+faststart", video_out_path],
+                check=True,
+            )
+        finally:
+            os.remove(fragmented)
+
+    def abort(self):
+        """Stop the encoder without finishing the stream (e.g. the pipeline raised)."""
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        if os.path.exists(self.audio_path):
+            os.remove(self.audio_path)
@@ -19,6 +19,7 @@ from typing import Union
 from pathlib import Path
 import matplotlib.pyplot as plt
 import imageio
+import soundfile as sf
 
 import torch
 import torch.nn as nn
@@ -43,9 +44,8 @@ def read_json(filepath: str):
     return json_dict
 
 
-def read_video(video_path: str, change_fps=True, use_decord=True):
+def read_video(video_path: str, change_fps=True, use_decord=True, temp_dir="temp"):
     if change_fps:
-        temp_dir = "temp"
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         os.makedirs(temp_dir, exist_ok=True)
@@ -103,6 +103,13 @@ def read_video_cv2(video_path: str):
 def read_audio(audio_path: str, audio_sample_rate: int = 16000):
     if audio_path is None:
         raise ValueError("Audio path is required.")
+    try:
+        info = sf.info(audio_path)
+    except RuntimeError:
+        info = None
+    if info is not None and info.samplerate == audio_sample_rate and info.channels == 1:
+        # already mono at the target rate (e.g. the backend's 16 kHz copy of the TTS output): no decode/resample
+        return torch.from_numpy(sf.read(audio_path, dtype="float32")[0])
     ar = AudioReader(audio_path, sample_rate=audio_sample_rate, mono=True)
 
     # To access the audio samples
@@ -102,9 +102,9 @@ class Audio2Feature:
 
         return whisper_chunks
 
-    def _audio2feat(self, audio_path: str):
-        # get the sample rate of the audio
-        result = self.model.transcribe(audio_path)
+    def _audio2feat(self, audio):
+        # `audio` is a file path or 16 kHz mono float32 samples
+        result = self.model.transcribe(audio)
         embed_list = []
         for emb in result["segments"]:
             encoder_embeddings = emb["encoder_embeddings"]
@@ -117,9 +117,11 @@ class Audio2Feature:
         concatenated_array = torch.from_numpy(np.concatenate(embed_list, axis=0))
         return concatenated_array
 
-    def audio2feat(self, audio_path):
+    def audio2feat(self, audio_path, audio_samples=None):
+        """Whisper features of `audio_path`; pass its already decoded 16 kHz mono `audio_samples` to skip decoding it again."""
+        audio = audio_path if audio_samples is None else audio_samples
         if self.audio_embeds_cache_dir == "" or self.audio_embeds_cache_dir is None:
-            return self._audio2feat(audio_path)
+            return self._audio2feat(audio)
 
         audio_embeds_cache_path = os.path.join(
             self.audio_embeds_cache_dir, os.path.basename(audio_path).replace(".mp4", "_embeds.pt")
@@ -131,10 +133,10 @@ class Audio2Feature:
             except Exception as e:
                 print(f"{type(e).__name__} - {e} - {audio_embeds_cache_path}")
                 os.remove(audio_embeds_cache_path)
-                audio_feat = self._audio2feat(audio_path)
+                audio_feat = self._audio2feat(audio)
                 torch.save(audio_feat, audio_embeds_cache_path)
         else:
-            audio_feat = self._audio2feat(audio_path)
+            audio_feat = self._audio2feat(audio)
             torch.save(audio_feat, audio_embeds_cache_path)
 
         return audio_feat
@@ -12,6 +12,7 @@ keeps behavior consistent with the project's CLI.
 
 import os
 import sys
+import json
 import argparse
 from types import SimpleNamespace
 from omegaconf import OmegaConf
@@ -43,7 +44,9 @@ print(f"[run_inference_hardcoded] listing {_repo_root} -> {os.listdir(_repo_root
 
 # Import the project's main inference entry (re-uses existing pipeline wiring)
 try:
-    from scripts.inference import main as inference_main
+    from scripts import inference as inference_module
+
+    inference_main = inference_module.main
 except Exception as e:
     # Provide an informative error including whether the scripts folder exists
     scripts_path = os.path.join(_repo_root, "scripts")
@@ -64,6 +67,7 @@ except Exception as e:
                 spec.loader.exec_module(module)
                 # register in sys.modules so relative imports inside inference.py work
                 sys.modules["scripts.inference"] = module
+                inference_module = module
                 inference_main = getattr(module, "main")
                 print(f"[run_inference_hardcoded] successfully loaded {inference_py} via importlib")
             except Exception as e2:
@@ -99,7 +103,7 @@ ENABLE_DEEPCACHE = True
 # -------------------------------------------------------------------------------------------
 
 
-def parse_cli_args():
+def parse_cli_args(argv=None):
     parser = argparse.ArgumentParser(description="Run LatentSync inference with optional overrides for input/output paths and params.")
     parser.add_argument("--unet-config", dest="unet_config", default=UNET_CONFIG)
     parser.add_argument("--ckpt-path", dest="ckpt_path", default=CKPT_PATH)
@@ -110,9 +114,13 @@ def parse_cli_args():
     parser.add_argument("--guidance-scale", dest="guidance_scale", type=float, default=GUIDANCE_SCALE)
     parser.add_argument("--seed", dest="seed", type=int, default=SEED)
     parser.add_argument("--temp-dir", dest="temp_dir", default=TEMP_DIR)
+    parser.add_argument("--alignment-cache", dest="alignment_cache", default=None,
+                        help="file to reuse (or save) the face alignment of --video-path across runs")
+    parser.add_argument("--stream-dir", dest="stream_dir", default=None,
+                        help="also publish the video progressively as HLS (fMP4 segments) in this directory")
     parser.add_argument("--enable-deepcache", dest="enable_deepcache", type=lambda v: v.lower() in ("1", "true", "yes"), default=ENABLE_DEEPCACHE)
     # slicing/compile flags left as constants but can be added if needed
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def build_args(parsed):
@@ -128,6 +136,8 @@ def build_args(parsed):
         inference_steps=parsed.inference_steps,
         guidance_scale=parsed.guidance_scale,
         temp_dir=parsed.temp_dir,
+        alignment_cache=parsed.alignment_cache,
+        stream_dir=parsed.stream_dir,
         seed=parsed.seed,
         enable_deepcache=parsed.enable_deepcache,
         enable_attention_slicing=True,
@@ -137,14 +147,12 @@ def build_args(parsed):
     )
 
 
-def main():
-    # Parse CLI overrides (if any)
-    parsed = parse_cli_args()
-
-    # Ensure output folder exists
-    out_dir = os.path.dirname(parsed.video_out_path) or "."
-    os.makedirs(out_dir, exist_ok=True)
+def resolve_config(parsed):
+    """Resolve relative paths in `parsed` against the repo root and load the UNet config.
 
+    Returns `(config, args)` where `args` is the namespace expected by
+    scripts.inference.
+    """
     # Resolve any relative paths against the discovered repo root so the script
     # works correctly even when launched with a different current working dir.
     unet_config_path = parsed.unet_config
@@ -155,12 +163,84 @@ def main():
     if not os.path.isabs(ckpt_path):
         ckpt_path = os.path.join(_repo_root, ckpt_path)
 
-    # Load config and run the project's main() -- this will set up models and pipeline
     config = OmegaConf.load(unet_config_path)
     # Replace parsed values with resolved absolute paths so downstream code sees them
     parsed.ckpt_path = ckpt_path
     parsed.unet_config = unet_config_path
-    args = build_args(parsed)
+    return config, build_args(parsed)
+
+
+def load_pipeline(parsed=None):
+    """Load the LipsyncPipeline once using the defaults above (or `parsed` overrides).
+
+    Returns `(pipeline, config)`; used by the backend's resident worker so the
+    models stay in memory between requests.
+    """
+    if parsed is None:
+        parsed = parse_cli_args([])
+    config, args = resolve_config(parsed)
+    return inference_module.load_pipeline(config, args), config
+
+
+def print_window_progress(done, total):
+    """Per-window progress in a line format the backend parses from our stdout."""
+    print(f"[progress] window {done}/{total}", flush=True)
+
+
+def reset_gpu_peak():
+    """Start a new peak-GPU-memory window (see resource_usage)."""
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+
+def resource_usage():
+    """Peak RSS of this process and peak CUDA memory since reset_gpu_peak(), in bytes (None if unknown)."""
+    import torch
+
+    usage = {"peak_rss_bytes": None, "gpu_peak_bytes": None}
+    try:
+        import resource
+
+        # ru_maxrss is in KiB on Linux (not available on Windows)
+        usage["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    if torch.cuda.is_available():
+        usage["gpu_peak_bytes"] = torch.cuda.max_memory_allocated()
+    return usage
+
+
+def run(pipeline, config, window_callback=None, timings=None, **overrides):
+    """Run one generation on a loaded pipeline.
+
+    `overrides` are the same names as the CLI destinations (video_path,
+    audio_path, video_out_path, inference_steps, guidance_scale, seed, temp_dir,
+    alignment_cache, stream_dir).
+    If `timings` is a dict it receives seconds spent per pipeline stage.
+    """
+    parsed = parse_cli_args([])
+    for key, value in overrides.items():
+        if value is not None:
+            setattr(parsed, key, value)
+    out_dir = os.path.dirname(parsed.video_out_path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+    _, args = resolve_config(parsed)
+    inference_module.run_pipeline(pipeline, config, args, window_callback=window_callback, timings=timings)
+    return args.video_out_path
+
+
+def main():
+    # Parse CLI overrides (if any)
+    parsed = parse_cli_args()
+
+    # Ensure output folder exists
+    out_dir = os.path.dirname(parsed.video_out_path) or "."
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Load config and run the project's main() -- this will set up models and pipeline
+    config, args = resolve_config(parsed)
 
     print("Running LatentSync with the following settings:")
     print(f"  video: {args.video_path}")
@@ -170,7 +250,11 @@ def main():
     print(f"  inference_steps: {args.inference_steps}")
     print(f"  guidance_scale: {args.guidance_scale}")
 
-    inference_main(config=config, args=args)
+    timings = {}
+    reset_gpu_peak()
+    inference_main(config=config, args=args, window_callback=print_window_progress, timings=timings)
+    # one machine-readable line for the backend's /metrics
+    print("[timings] " + json.dumps({"timings": timings, **resource_usage()}), flush=True)
 
     print(f"Finished. Output saved to: {args.video_out_path}")
 
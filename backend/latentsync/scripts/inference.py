@@ -31,20 +31,18 @@ from latentsync.whisper.audio2feature import Audio2Feature
 from DeepCache import DeepCacheSDHelper
 
 
-def main(config, args):
-    if not os.path.exists(args.video_path):
-        raise RuntimeError(f"Video path '{args.video_path}' not found")
-    if not os.path.exists(args.audio_path):
-        raise RuntimeError(f"Audio path '{args.audio_path}' not found")
+def load_pipeline(config, args):
+    """Build the LipsyncPipeline (Whisper, VAE, UNet3D, scheduler) described by `config`.
 
+    Split out of `main` so a long-lived worker can load the models once and
+    call `run_pipeline` for every request.
+    """
     # Check if the GPU supports float16
     # is_fp16_supported = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] > 7
     # dtype = torch.float16 if is_fp16_supported else torch.float32
 
     dtype = torch.float16
 
-    print(f"Input video path: {args.video_path}")
-    print(f"Input audio path: {args.audio_path}")
     print(f"Loaded checkpoint path: {args.inference_ckpt_path}")
 
     # Allow choosing a faster/more accurate scheduler at runtime
@@ -127,6 +125,25 @@ def main(config, args):
         helper.set_params(cache_interval=3, cache_branch_id=0)
         helper.enable()
 
+    return pipeline
+
+
+def run_pipeline(pipeline, config, args, window_callback=None, timings=None):
+    """Run one lip-sync generation with a pipeline returned by `load_pipeline`.
+
+    `window_callback(done, total)` is called after each window of frames is denoised.
+    If `timings` is a dict it receives seconds spent per pipeline stage.
+    """
+    if not os.path.exists(args.video_path):
+        raise RuntimeError(f"Video path '{args.video_path}' not found")
+    if not os.path.exists(args.audio_path):
+        raise RuntimeError(f"Audio path '{args.audio_path}' not found")
+
+    print(f"Input video path: {args.video_path}")
+    print(f"Input audio path: {args.audio_path}")
+
+    dtype = torch.float16
+
     if args.seed != -1:
         set_seed(args.seed)
     else:
@@ -146,9 +163,23 @@ def main(config, args):
         height=config.data.resolution,
         mask_image_path=config.data.mask_image_path,
         temp_dir=args.temp_dir,
+        window_callback=window_callback,
+        timings=timings,
+        alignment_cache=getattr(args, "alignment_cache", None),
+        stream_dir=getattr(args, "stream_dir", None),
     )
 
 
+def main(config, args, window_callback=None, timings=None):
+    if not os.path.exists(args.video_path):
+        raise RuntimeError(f"Video path '{args.video_path}' not found")
+    if not os.path.exists(args.audio_path):
+        raise RuntimeError(f"Audio path '{args.audio_path}' not found")
+
+    pipeline = load_pipeline(config, args)
+    run_pipeline(pipeline, config, args, window_callback=window_callback, timings=timings)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--unet_config_path", type=str, default="configs/unet.yaml")
@@ -159,6 +190,8 @@ if __name__ == "__main__":
     parser.add_argument("--inference_steps", type=int, default=20)
     parser.add_argument("--guidance_scale", type=float, default=1.0)
     parser.add_argument("--temp_dir", type=str, default="temp")
+    parser.add_argument("--alignment_cache", type=str, default=None, help="Reuse/save face alignment of the video here")
+    parser.add_argument("--stream_dir", type=str, default=None, help="Also write a progressive HLS stream here")
     parser.add_argument("--seed", type=int, default=1247)
     parser.add_argument("--enable_deepcache", action="store_true")
     # Optimization flags
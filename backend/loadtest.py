@@ -0,0 +1,496 @@
+"""Load test for the API server, with fake inference workers (no GPU, no network).
+
+Starts `uvicorn main:app` on localhost in worker-pool mode with the pool
+running fake_worker.py instead of the models. Then several clients replay the
+frontend's traffic concurrently: upload a job, poll /api/jobs/{id} until it
+finishes, download the result. At the end it prints:
+
+* latency percentiles (p50/p95/p99/max) of uploads, polls, downloads, whole
+  jobs, and the queue wait recorded by the server (started_at - created_at);
+* throughput (finished jobs per second) and the outcome of every job,
+  including 429/413 answers from admission control;
+* queue behaviour sampled from /api/scheduler (queued and active jobs);
+* memory of the server process and of its whole process tree (start, peak,
+  end) and the server's open file descriptors, read from /proc (Linux).
+
+    python loadtest.py --jobs 40 --concurrency 8 --mix audio=1,video=1
+    python loadtest.py --jobs 200 --concurrency 32 --env FAKE_WORKER_MODE=burn \\
+        --env TTS_WORKERS=2 --json loadtest.json
+
+Inputs are a generated tone (the reference voice) and a generated test video,
+which need ffmpeg. The server needs it too. `--video` / `--audio` use your
+own files instead. The fake workers' speed is set through their environment
+variables (see fake_worker.py), like any other server setting, with --env.
+`--url` targets a server that is already running; memory is then not sampled.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_WORKER = os.path.join(BACKEND_DIR, "fake_worker.py")
+
+# upload endpoint and result download per job kind
+KINDS = {
+    "audio": ("/api/audio-gen", "/api/jobs/{job_id}/audio"),
+    "video": ("/api/video-gen", "/api/jobs/{job_id}/video"),
+}
+FINISHED = ("done", "failed", "cancelled")
+WORDS = "the quick brown fox jumps over a lazy dog while seven bright birds sing softly in tall green trees".split()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (None when empty)."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def encode_multipart(fields, files):
+    """multipart/form-data body for `fields` {name: str} and `files` {name: (filename, bytes)}."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        header = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        )
+        parts.append(header.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def request(url, data=None, headers=None, method=None, timeout=60):
+    """(status, headers, body) of an HTTP request; HTTP errors are returned, not raised."""
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+# ----------------------------------------------------------------------------
+# inputs and server
+
+
+def make_inputs(work_dir, seconds):
+    """A reference voice (tone) and a test video with an audio track, generated with ffmpeg."""
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg not found on PATH; it is needed to generate inputs (or pass --audio and --video)")
+    audio = os.path.join(work_dir, "reference.wav")
+    video = os.path.join(work_dir, "avatar.mp4")
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+         "-ar", "44100", audio],
+        check=True,
+    )
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error",
+         "-f", "lavfi", "-i", f"testsrc=size=256x256:rate=25:duration={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=330:duration={seconds}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", video],
+        check=True,
+    )
+    return audio, video
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(work_dir, port, extra_env):
+    env = dict(os.environ)
+    env.update(
+        RUNS_ROOT=os.path.join(work_dir, "runs"),
+        WORKER_POOL="1",
+        WORKER_SCRIPT=FAKE_WORKER,
+        INFER_PYTHON=sys.executable,
+        # the machine running the test is not the one admission control is tuned for
+        ADMISSION_MEMORY_RESERVE="0",
+        ADMISSION_LIPSYNC_BASE_BYTES="0",  # fake workers load no models
+    )
+    env.update(extra_env)
+    log_path = os.path.join(work_dir, "server.log")
+    log = open(log_path, "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    log.close()
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server exited with code {proc.returncode}; see {log_path}")
+        try:
+            if request(url + "/api/scheduler", timeout=2)[0] == 200:
+                return proc, url, log_path
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"server did not come up within 60s; see {log_path}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ----------------------------------------------------------------------------
+# process sampling (Linux /proc)
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid):
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def tree_rss_bytes(pid):
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_bytes(current) or 0
+        stack.extend(child_pids(current))
+    return total
+
+
+def open_fds(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+
+
+class Sampler(threading.Thread):
+    """Samples the scheduler's queue and the server's memory every `interval` seconds."""
+
+    def __init__(self, url, pid, interval):
+        super().__init__(daemon=True)
+        self.url = url
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def sample(self):
+        entry = {"t": time.time()}
+        try:
+            status, _, body = request(self.url + "/api/scheduler", timeout=5)
+            if status == 200:
+                scheduler = json.loads(body)
+                entry["queued"] = sum(scheduler["queued"].values())
+                entry["active"] = scheduler["active_jobs"]
+                entry["stage_waiting"] = {name: stage["waiting"] for name, stage in scheduler["stages"].items()}
+        except OSError:
+            pass
+        if self.pid is not None:
+            entry["server_rss"] = rss_bytes(self.pid)
+            entry["tree_rss"] = tree_rss_bytes(self.pid)
+            entry["fds"] = open_fds(self.pid)
+        self.samples.append(entry)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+# ----------------------------------------------------------------------------
+# traffic
+
+
+class LoadTest:
+    def __init__(self, args, url, audio, video):
+        self.args = args
+        self.url = url
+        with open(audio, "rb") as f:
+            self.audio = f.read()
+        with open(video, "rb") as f:
+            self.video = f.read()
+        self.rng = random.Random(args.seed)
+        kinds = []
+        for item in args.mix.split(","):
+            name, _, weight = item.partition("=")
+            if name not in KINDS:
+                sys.exit(f"unknown job kind {name!r} in --mix (choose from {', '.join(KINDS)})")
+            kinds += [name] * int(weight or 1)
+        self.plan = [self.rng.choice(kinds) for _ in range(args.jobs)]
+        self.scripts = []
+        self.next_job = 0
+        self.lock = threading.Lock()
+        self.latency = {"upload": [], "poll": [], "download": [], "job": [], "queue_wait": []}
+        self.outcomes = {}
+        self.results = []
+
+    def script(self):
+        """A fresh script, or (with probability --repeat) one sent before, which the result cache can answer."""
+        with self.lock:
+            if self.scripts and self.rng.random() < self.args.repeat:
+                return self.rng.choice(self.scripts)
+            words = self.rng.randint(*self.args.script_words)
+            script = " ".join(self.rng.choice(WORDS) for _ in range(words)) + f" number {len(self.scripts)}."
+            self.scripts.append(script)
+            return script
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.latency[name].append(seconds)
+
+    def outcome(self, kind, result):
+        with self.lock:
+            key = f"{kind}:{result}"
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def run_job(self, client, kind):
+        endpoint, download = KINDS[kind]
+        fields = {"script": self.script()}
+        files = {"audio": ("reference.wav", self.audio)}
+        if kind == "video":
+            files["video"] = ("avatar.mp4", self.video)
+        body, content_type = encode_multipart(fields, files)
+        start = time.time()
+        status, headers, reply = request(
+            self.url + endpoint, data=body, headers={"Content-Type": content_type, "X-Client-Id": client}
+        )
+        self.record("upload", time.time() - start)
+        if status != 200:
+            self.outcome(kind, f"http_{status}")
+            retry_after = headers.get("Retry-After") if headers else None
+            if retry_after:
+                time.sleep(min(float(retry_after), self.args.max_backoff))
+            return
+        job_id = json.loads(reply)["job_id"]
+
+        while True:
+            time.sleep(self.args.poll_interval)
+            poll_start = time.time()
+            status, _, reply = request(f"{self.url}/api/jobs/{job_id}")
+            self.record("poll", time.time() - poll_start)
+            if status != 200:
+                self.outcome(kind, f"poll_http_{status}")
+                return
+            job = json.loads(reply)
+            if job["state"] in FINISHED:
+                break
+            if time.time() - start > self.args.job_timeout:
+                self.outcome(kind, "timeout")
+                return
+        if job.get("started_at") and job.get("created_at"):
+            self.record("queue_wait", job["started_at"] - job["created_at"])
+        if job["state"] != "done":
+            self.outcome(kind, job["state"])
+            return
+
+        download_start = time.time()
+        status, _, data = request(self.url + download.format(job_id=job_id))
+        self.record("download", time.time() - download_start)
+        if status != 200 or not data:
+            self.outcome(kind, f"download_http_{status}")
+            return
+        self.record("job", time.time() - start)
+        self.outcome(kind, "done")
+        with self.lock:
+            self.results.append(time.time())
+
+    def client(self, index):
+        client = f"loadtest-{index}"
+        while True:
+            with self.lock:
+                if self.next_job >= len(self.plan):
+                    return
+                kind = self.plan[self.next_job]
+                self.next_job += 1
+            try:
+                self.run_job(client, kind)
+            except Exception as e:
+                self.outcome(kind, f"error_{type(e).__name__}")
+
+    def run(self):
+        threads = [threading.Thread(target=self.client, args=(i,), daemon=True) for i in range(self.args.concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+
+# ----------------------------------------------------------------------------
+# report
+
+
+def build_report(test, elapsed, samples):
+    report = {
+        "jobs": len(test.plan),
+        "concurrency": test.args.concurrency,
+        "elapsed_seconds": elapsed,
+        "throughput_jobs_per_second": len(test.results) / elapsed if elapsed else None,
+        "outcomes": dict(sorted(test.outcomes.items())),
+        "latency_seconds": {name: summarize(values) for name, values in test.latency.items()},
+    }
+    queued = [s["queued"] for s in samples if "queued" in s]
+    active = [s["active"] for s in samples if "active" in s]
+    report["queue"] = {
+        "samples": len(queued),
+        "queued_max": max(queued) if queued else None,
+        "queued_mean": sum(queued) / len(queued) if queued else None,
+        "active_max": max(active) if active else None,
+        "active_mean": sum(active) / len(active) if active else None,
+    }
+    memory = {}
+    for key in ("server_rss", "tree_rss", "fds"):
+        values = [s[key] for s in samples if s.get(key) is not None]
+        if values:
+            memory[key] = {"start": values[0], "peak": max(values), "end": values[-1], "growth": values[-1] - values[0]}
+    report["process"] = memory
+    return report
+
+
+def print_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    print()
+    print(f"jobs {report['jobs']} with {report['concurrency']} clients in {report['elapsed_seconds']:.1f}s: "
+          f"{report['throughput_jobs_per_second']:.3f} jobs/s")
+    print("outcomes: " + ", ".join(f"{name}={count}" for name, count in report["outcomes"].items()))
+    print(f"{'latency':<12}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, stats in report["latency_seconds"].items():
+        print(f"{name:<12}{stats['count']:>7}{ms(stats['p50']):>10}{ms(stats['p95']):>10}"
+              f"{ms(stats['p99']):>10}{ms(stats['max']):>10}")
+    queue = report["queue"]
+    if queue["samples"]:
+        print(f"queue: queued max {queue['queued_max']} mean {queue['queued_mean']:.1f}, "
+              f"active max {queue['active_max']} mean {queue['active_mean']:.1f} ({queue['samples']} samples)")
+    for key, label, scale, unit in (("server_rss", "server rss", 2 ** 20, "MiB"),
+                                    ("tree_rss", "tree rss", 2 ** 20, "MiB"),
+                                    ("fds", "server fds", 1, "")):
+        stats = report["process"].get(key)
+        if stats:
+            print(f"{label}: start {stats['start'] / scale:.0f}{unit} peak {stats['peak'] / scale:.0f}{unit} "
+                  f"end {stats['end'] / scale:.0f}{unit} growth {stats['growth'] / scale:+.0f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test main.py with fake inference workers")
+    parser.add_argument("--jobs", type=int, default=40, help="jobs to submit in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients (each runs one job at a time)")
+    parser.add_argument("--mix", default="audio=1,video=1", help="job kinds and weights, e.g. audio=3,video=1")
+    parser.add_argument("--script-words", type=int, nargs=2, default=(8, 40), metavar=("MIN", "MAX"))
+    parser.add_argument("--repeat", type=float, default=0.0, help="fraction of jobs reusing an earlier script")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--job-timeout", type=float, default=600.0, help="give up on a job after this many seconds")
+    parser.add_argument("--max-backoff", type=float, default=5.0, help="cap on waiting for Retry-After after a 429")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between queue/memory samples")
+    parser.add_argument("--input-seconds", type=float, default=5.0, help="length of the generated reference and video")
+    parser.add_argument("--audio", help="reference voice to upload instead of the generated tone")
+    parser.add_argument("--video", help="video to upload instead of the generated test video")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="server (and fake worker) setting, e.g. FAKE_WORKER_MODE=burn or MAX_ACTIVE_JOBS=4")
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (runs, server log)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    extra_env = {}
+    for item in args.env:
+        key, sep, value = item.partition("=")
+        if not sep:
+            parser.error(f"--env expects KEY=VALUE, got {item!r}")
+        extra_env[key] = value
+
+    work_dir = tempfile.mkdtemp(prefix="capstone-loadtest-")
+    server = None
+    try:
+        audio, video = args.audio, args.video
+        if not (audio and video):
+            generated_audio, generated_video = make_inputs(work_dir, args.input_seconds)
+            audio, video = audio or generated_audio, video or generated_video
+        if args.url:
+            url, pid = args.url.rstrip("/"), None
+        else:
+            server, url, log_path = start_server(work_dir, free_port(), extra_env)
+            pid = server.pid
+            print(f"server pid {pid} at {url} (log: {log_path})")
+
+        test = LoadTest(args, url, audio, video)
+        sampler = Sampler(url, pid, args.sample_interval)
+        sampler.start()
+        elapsed = test.run()
+        sampler.stop()
+
+        report = build_report(test, elapsed, sampler.samples)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if server is not None:
+            stop_server(server)
+        if args.keep:
+            print(f"work directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
-from fastapi import FastAPI, Request, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+import asyncio
+import collections
+import functools
+import json
 import logging
-import subprocess
+import re
+import shutil
 import sys
 import os
 import uuid
 import time
 
+import jobstore
+from admission import LIPSYNC_BASE_BYTES, AdmissionController, CostModel, Rejected, job_features, job_memory_bytes
+from artifacts import partial_path, publish, publish_copy
+from audio_ingest import TTS_RATE, WHISPER_RATE, ingest
+from broker import InProcessBroker, broker_description, open_broker, to_storage
+from broker_worker import BrokerWorker
+from events import EventHub, format_sse
+from janitor import INPUT, INTERMEDIATE, OUTPUT, Janitor
+from jobstore import JobStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, peak_rss_bytes
+from procs import run_process
+from result_cache import ResultCache, make_key
+from scheduler import JobFailed, Scheduler
+from uploads import MAX_UPLOAD_BYTES, UploadTooLarge, spool_upload
+from worker_pool import WorkerPool
+
 # Configure basic logging to ensure messages appear on the server terminal
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
@@ -16,7 +39,251 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(mess
 DEFAULT_INFER_PYTHON = r"D:/Danush/Capstone_central/backend/capstone2/Scripts/python.exe"
 INFER_PYTHON = os.environ.get("INFER_PYTHON", DEFAULT_INFER_PYTHON if os.path.exists(DEFAULT_INFER_PYTHON) else sys.executable)
 
-app = FastAPI()
+BACKEND_DIR = os.path.dirname(__file__)
+LATENTSYNC_DIR = os.path.join(BACKEND_DIR, "latentsync")
+# LatentSync may live in its own venv; fall back to the F5-TTS interpreter.
+LATENTSYNC_VENV_PYTHON = os.path.join(LATENTSYNC_DIR, "latentsync-venv", "Scripts", "python.exe")
+LATENTSYNC_PYTHON = LATENTSYNC_VENV_PYTHON if os.path.exists(LATENTSYNC_VENV_PYTHON) else (INFER_PYTHON if INFER_PYTHON else sys.executable)
+
+# Worker-pool mode: keep F5TTS and LatentSync loaded in resident processes
+# (worker.py) instead of spawning run_infer.py / run_inference_hardcoded.py for
+# every request. Enable with WORKER_POOL=1; pool sizes via TTS_WORKERS / LIPSYNC_WORKERS.
+USE_WORKER_POOL = os.environ.get("WORKER_POOL", "0").lower() in ("1", "true", "yes")
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "1"))
+LIPSYNC_WORKERS = int(os.environ.get("LIPSYNC_WORKERS", "1"))
+
+# kind ("tts" / "lipsync") -> WorkerPool; empty in subprocess mode
+worker_pools = {}
+
+# Job broker (see broker.py): with BROKER_URL set, the TTS and lipsync stages
+# are queued as tasks that broker_worker.py nodes, possibly on other hosts,
+# claim and run; RUNS_ROOT must then live on storage those nodes share. With
+# BROKER_URL=memory:// the local worker pools (WORKER_POOL=1) consume them.
+BROKER_URL = os.environ.get("BROKER_URL", "")
+BROKER_REQUEUE_INTERVAL = float(os.environ.get("BROKER_REQUEUE_INTERVAL", "5"))
+
+RUNS_ROOT = os.environ.get("RUNS_ROOT", os.path.join(BACKEND_DIR, "runs"))
+JOB_DB_PATH = os.environ.get("JOB_DB", os.path.join(RUNS_ROOT, "jobs.sqlite3"))
+
+# Scheduler limits: how many jobs may run at once, and how many may be inside
+# each pipeline stage at once (the GPU stages default to one at a time).
+MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", "2"))
+STAGE_LIMITS = {
+    "tts": int(os.environ.get("STAGE_LIMIT_TTS", "1")),
+    "lipsync": int(os.environ.get("STAGE_LIMIT_LIPSYNC", "1")),
+    "ffmpeg": int(os.environ.get("STAGE_LIMIT_FFMPEG", "2")),
+}
+# Seconds a stage may run before its job is failed and the stage killed (0 = no limit)
+STAGE_TIMEOUTS = {
+    "tts": float(os.environ.get("STAGE_TIMEOUT_TTS", "900")),
+    "lipsync": float(os.environ.get("STAGE_TIMEOUT_LIPSYNC", "3600")),
+    "ffmpeg": float(os.environ.get("STAGE_TIMEOUT_FFMPEG", "300")),
+}
+
+# Generation settings. They are passed explicitly to run_infer.py / LatentSync
+# and are part of the result-cache key, so bump TTS_MODEL_ID / LIPSYNC_MODEL_ID
+# whenever a checkpoint is swapped.
+TTS_SETTINGS = {
+    "model": os.environ.get("TTS_MODEL_ID", "F5-TTS/capstone_final"),
+    "nfe_steps": int(os.environ.get("TTS_NFE_STEPS", "64")),
+    "seed": int(os.environ.get("TTS_SEED", "42")),
+    # sample a long script's text chunks in padded batches (0 = no frame budget per batch)
+    "batch_chunks": os.environ.get("TTS_BATCH_CHUNKS", "0").lower() in ("1", "true", "yes"),
+    "max_batch_frames": int(os.environ.get("TTS_MAX_BATCH_FRAMES", "0")),
+}
+LIPSYNC_SETTINGS = {
+    "model": os.environ.get("LIPSYNC_MODEL_ID", "latentsync/stage2_512"),
+    "inference_steps": int(os.environ.get("LIPSYNC_INFERENCE_STEPS", "20")),
+    "guidance_scale": float(os.environ.get("LIPSYNC_GUIDANCE_SCALE", "1.5")),
+    "seed": int(os.environ.get("LIPSYNC_SEED", "1247")),
+}
+
+# Finished results are cached by content hash (see result_cache.py); 0 disables the cache.
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(RUNS_ROOT, "cache"))
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(20 * 1024 ** 3)))
+
+# Run-directory janitor: per-artifact TTLs (seconds after the job finished,
+# 0 = keep), a byte quota over all runs (0 = none) and the sweep interval.
+JANITOR_TTLS = {
+    INTERMEDIATE: float(os.environ.get("JANITOR_TTL_INTERMEDIATE", str(60 * 60))),
+    INPUT: float(os.environ.get("JANITOR_TTL_INPUT", str(6 * 60 * 60))),
+    OUTPUT: float(os.environ.get("JANITOR_TTL_OUTPUT", str(7 * 24 * 60 * 60))),
+}
+RUNS_MAX_BYTES = int(os.environ.get("RUNS_MAX_BYTES", str(50 * 1024 ** 3)))
+JANITOR_INTERVAL = float(os.environ.get("JANITOR_INTERVAL", "300"))
+
+# Admission control (see admission.py): new jobs get 429 + Retry-After when
+# they would wait longer than ADMISSION_MAX_WAIT seconds behind admitted work
+# (0 = never), or when their lipsync stage would not fit in free host memory
+# minus ADMISSION_MEMORY_RESERVE bytes. A lipsync stage is estimated at
+# ADMISSION_LIPSYNC_BASE_BYTES (models and libraries) plus its decoded frames;
+# lower both on small hosts, where their sum alone may exceed the memory.
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "1800"))
+ADMISSION_MEMORY_RESERVE = int(os.environ.get("ADMISSION_MEMORY_RESERVE", str(2 * 1024 ** 3)))
+ADMISSION_LIPSYNC_BASE_BYTES = int(os.environ.get("ADMISSION_LIPSYNC_BASE_BYTES", str(LIPSYNC_BASE_BYTES)))
+
+# Progressive output (the `progressive` form field of the video endpoints):
+# LatentSync writes an HLS stream to runs/<job_id>/stream/ while it renders;
+# how often main.py checks it for the first segment
+STREAM_POLL_SECONDS = float(os.environ.get("STREAM_POLL_SECONDS", "0.25"))
+
+# Batch endpoint (/api/batch/video-gen): most scripts accepted in one request
+BATCH_MAX_SCRIPTS = int(os.environ.get("BATCH_MAX_SCRIPTS", "20"))
+
+# Created in lifespan()
+jobs = None
+scheduler = None
+result_cache = None
+janitor = None
+admission = None
+broker = None
+# BrokerWorkers feeding the local pools from an in-process broker
+local_broker_workers = []
+
+# Job events pushed to /api/jobs/{job_id}/events subscribers
+events = EventHub()
+
+# Per-window progress line printed by run_inference_hardcoded.py in subprocess mode
+LIPSYNC_PROGRESS_RE = re.compile(r"\[progress\] window (\d+)/(\d+)")
+# Per-stage timings + peak memory printed by run_infer.py / run_inference_hardcoded.py at exit
+TIMINGS_RE = re.compile(r"^\[timings\] (\{.*\})$")
+# Transcript printed by `run_infer.py --prepare-ref`
+REFERENCE_RE = re.compile(r"^\[reference\] (\{.*\})$")
+
+# Served at /metrics in Prometheus text format
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram(
+    "capstone_stage_seconds",
+    "Wall time of a pipeline stage: upload, queue_wait, audio_ingest, tts, lipsync and their inner stages",
+    ["stage"],
+)
+QUEUE_DEPTH = metrics.gauge("capstone_queue_depth", "Jobs waiting for a scheduler slot")
+ACTIVE_JOBS = metrics.gauge("capstone_active_jobs", "Jobs currently running")
+STAGE_WAITING = metrics.gauge("capstone_stage_waiting", "Running jobs waiting for a slot of a stage", ["stage"])
+JOBS_BY_STATE = metrics.gauge("capstone_jobs", "Jobs in the job store by state", ["state"])
+SERVER_PEAK_RSS = metrics.gauge("capstone_server_peak_rss_bytes", "Peak resident memory of the API server process")
+STAGE_PEAK_RSS = metrics.gauge(
+    "capstone_stage_peak_rss_bytes", "Largest peak resident memory reported by a stage's inference process", ["stage"]
+)
+STAGE_GPU_PEAK = metrics.gauge(
+    "capstone_stage_gpu_peak_bytes", "Largest peak CUDA memory allocated during one run of a stage", ["stage"]
+)
+TIME_TO_FIRST_FRAME = metrics.histogram(
+    "capstone_time_to_first_frame_seconds",
+    "Seconds from accepting a video job to its first playable frame: the first HLS segment (mode=stream) "
+    "or the finished mp4 (mode=file)",
+    ["mode"],
+)
+
+ARTIFACT_URLS = {
+    "audio_path": ("audio", "/api/jobs/{job_id}/audio"),
+    "video_path": ("video", "/api/jobs/{job_id}/video"),
+}
+STREAM_PLAYLIST_URL = "/api/jobs/{job_id}/stream/index.m3u8"
+
+# files LatentSync's HLS writer publishes in a stream directory -> media type
+STREAM_FILE_RE = re.compile(r"^(index\.m3u8|init\.mp4|seg_\d+\.m4s)$")
+STREAM_MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".mp4": "video/mp4", ".m4s": "video/iso.segment"}
+
+
+def _publish_event(job_id, event, data, group_id=None):
+    """Publish a job event, and a copy tagged with the job id to its batch group's subscribers."""
+    events.publish(job_id, event, data)
+    if group_id:
+        events.publish(group_id, event, dict(data, job_id=job_id))
+
+
+def _publish_job_update(job_id, fields):
+    """JobStore hook: turn state/stage changes and newly published outputs into job events."""
+    job = None
+    if "state" in fields or "stage" in fields or "timings" in fields:
+        job = jobs.get(job_id)
+        admission.on_job_update(job_id, fields, job)
+        if job is not None and ("state" in fields or "stage" in fields):
+            state = {"state": job["state"], "stage": job["stage"], "error": job["error"]}
+            _publish_event(job_id, "state", state, job["group_id"])
+            if fields.get("state") == jobstore.RUNNING and job["started_at"]:
+                STAGE_SECONDS.observe(job["started_at"] - job["created_at"], stage="queue_wait")
+    for column, (name, url) in ARTIFACT_URLS.items():
+        if fields.get(column):
+            job = job or jobs.get(job_id)
+            _publish_event(job_id, "artifact", {"name": name, "url": url.format(job_id=job_id)}, job and job["group_id"])
+
+
+async def _broker_loop():
+    """Hand tasks of workers that stopped heartbeating back to the queue."""
+    while True:
+        try:
+            expired = await asyncio.to_thread(broker.requeue_expired)
+            if expired:
+                logging.warning("[broker] leases expired for %d task(s) of lost workers: %s", len(expired), expired)
+        except Exception:
+            logging.exception("[broker] requeue sweep failed")
+        await asyncio.sleep(BROKER_REQUEUE_INTERVAL)
+
+
+async def _janitor_loop():
+    while True:
+        try:
+            await asyncio.to_thread(janitor.sweep)
+        except Exception:
+            logging.exception("[janitor] sweep failed")
+        await asyncio.sleep(JANITOR_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global jobs, scheduler, result_cache, janitor, admission, broker
+    os.makedirs(RUNS_ROOT, exist_ok=True)
+    cost_model = CostModel()
+    admission = AdmissionController(
+        cost_model, STAGE_LIMITS, max_wait=ADMISSION_MAX_WAIT, memory_reserve=ADMISSION_MEMORY_RESERVE
+    )
+    jobs = JobStore(JOB_DB_PATH, on_update=_publish_job_update)
+    interrupted = jobs.fail_interrupted()
+    if interrupted:
+        logging.warning("Marked %d job(s) left over from a previous server process as failed.", interrupted)
+    logging.info("Cost model learned from %d finished job(s).", cost_model.bootstrap(jobs))
+    scheduler = Scheduler(jobs, max_active_jobs=MAX_ACTIVE_JOBS, stage_limits=STAGE_LIMITS, stage_timeouts=STAGE_TIMEOUTS)
+    result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_BYTES)
+    janitor = Janitor(RUNS_ROOT, jobs, JANITOR_TTLS, max_bytes=RUNS_MAX_BYTES)
+    janitor_task = asyncio.create_task(_janitor_loop())
+
+    if USE_WORKER_POOL:
+        worker_pools["tts"] = WorkerPool("tts", INFER_PYTHON, BACKEND_DIR, size=TTS_WORKERS)
+        worker_pools["lipsync"] = WorkerPool("lipsync", LATENTSYNC_PYTHON, LATENTSYNC_DIR, size=LIPSYNC_WORKERS)
+        for pool in worker_pools.values():
+            pool.start()
+        logging.info("Worker-pool mode enabled (tts=%d, lipsync=%d); warming up in the background.", TTS_WORKERS, LIPSYNC_WORKERS)
+
+    broker_task = None
+    if BROKER_URL:
+        broker = open_broker(BROKER_URL)
+        broker_task = asyncio.create_task(_broker_loop())
+        if isinstance(broker, InProcessBroker):
+            if not worker_pools:
+                logging.warning("BROKER_URL=%s without WORKER_POOL=1: nothing will run the queued tasks.", BROKER_URL)
+            for pool in worker_pools.values():
+                local_broker_workers.append(BrokerWorker(broker, pool, RUNS_ROOT, worker_id=f"local-{pool.kind}").start())
+        logging.info("Running TTS/lipsync stages through the job broker at %s.", broker_description(BROKER_URL))
+    yield
+    janitor_task.cancel()
+    if broker_task is not None:
+        broker_task.cancel()
+    await scheduler.shutdown()
+    for node in local_broker_workers:
+        node.stop()
+    local_broker_workers.clear()
+    if broker is not None:
+        broker.close()
+    for pool in worker_pools.values():
+        pool.shutdown()
+    worker_pools.clear()
+    result_cache.close()
+    jobs.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend (React) to talk to backend (FastAPI)
 # app.add_middleware(
@@ -34,7 +301,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # allow all methods (GET, POST, etc.)
     allow_headers=["*"], 
-    expose_headers=["Content-Disposition", "Content-Length"],
+    expose_headers=["Content-Disposition", "Content-Length", "Retry-After"],
 )
 
 
@@ -42,82 +309,556 @@ app.add_middleware(
 def root():
     return {"message": "FastAPI is running 🚀"}
 
+
+@app.get("/api/ready")
+def ready():
+    """Readiness probe. In worker-pool mode returns 503 until every worker has
+    finished loading its models and the warm-up inference; in broker mode
+    until a warm worker of each kind is connected to the broker."""
+    if broker is not None:
+        nodes = broker.workers()
+        kinds = {kind for node in nodes.values() if node.get("ready") for kind in node.get("kinds", [])}
+        is_ready = {"tts", "lipsync"} <= kinds
+        return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, "mode": "broker", "workers": nodes})
+    if not worker_pools:
+        return {"ready": True, "mode": "subprocess"}
+    pools = {kind: pool.status() for kind, pool in worker_pools.items()}
+    is_ready = all(pool["ready"] for pool in pools.values())
+    return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, "mode": "worker-pool", "pools": pools})
+
+
+def _client_id(request):
+    """Fair-share key for the scheduler: an explicit X-Client-Id header, else the peer address."""
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "")
+
+
+def _new_run_dir():
+    run_id = uuid.uuid4().hex
+    run_dir = os.path.join(RUNS_ROOT, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    return run_id, run_dir
+
+
+def _record_report(stage, report):
+    """Feed an inference process's report ({"timings", "peak_rss_bytes", "gpu_peak_bytes"}) into the metrics."""
+    if not isinstance(report, dict):
+        return
+    for name, seconds in (report.get("timings") or {}).items():
+        STAGE_SECONDS.observe(seconds, stage=name)
+    if report.get("peak_rss_bytes") is not None:
+        STAGE_PEAK_RSS.set_max(report["peak_rss_bytes"], stage=stage)
+    if report.get("gpu_peak_bytes") is not None:
+        STAGE_GPU_PEAK.set_max(report["gpu_peak_bytes"], stage=stage)
+
+
+def _timings_line_parser(stage, on_line=None):
+    """run_process() line callback that records the `[timings]` report line, then calls `on_line`."""
+
+    def parse(line):
+        match = TIMINGS_RE.search(line)
+        if match:
+            try:
+                _record_report(stage, json.loads(match.group(1)))
+            except ValueError:
+                logging.warning("Unparseable %s timings line: %s", stage, line)
+        elif on_line is not None:
+            on_line(line)
+
+    return parse
+
+
+def _timed(stage):
+    """Observe the wall time of each completed (not cancelled) call of an async function as `stage`."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def run(*args, **kwargs):
+            start = time.time()
+            result = await fn(*args, **kwargs)
+            STAGE_SECONDS.observe(time.time() - start, stage=stage)
+            return result
+
+        return run
+
+    return decorate
+
+
+async def _run_in_pool(pool, params, tag, on_progress=None):
+    """Run one job on a worker pool. Cancelling the caller cancels the job,
+    killing the worker if it already started (which frees its GPU memory)."""
+    future = pool.submit(params, on_progress=on_progress)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        logging.info("%s cancelling %s pool job", tag, pool.kind)
+        pool.cancel(future)
+        raise
+
+
+async def _run_resident(kind, params, tag, on_progress=None):
+    """Run a stage on a resident model: as a job-broker task when BROKER_URL is
+    set, else on the local worker pool of `kind`. Returns the worker's result."""
+    if broker is None:
+        return await _run_in_pool(worker_pools[kind], params, tag, on_progress=on_progress)
+    task_id = await asyncio.to_thread(broker.submit, kind, to_storage(params, RUNS_ROOT))
+    logging.info("%s submitted %s task %s to the broker", tag, kind, task_id)
+    return await broker.wait(task_id, on_progress=on_progress)
+
+
+@_timed("tts")
+async def _generate_audio(ref_audio, script, out_wav, tag, ref_text=None, out_wav_16k=None):
+    """Synthesize `script` in the voice of `ref_audio` into `out_wav`.
+
+    Uses the job broker or the resident TTS pool when enabled, otherwise
+    spawns run_infer.py. `ref_text` is the reference transcript when already
+    known (see _prepare_reference); without it F5-TTS transcribes the
+    reference itself. With `out_wav_16k` the speech is also written there at
+    WHISPER_RATE for LatentSync. Returns True when the outputs were produced.
+    """
+    outputs = [out_wav] + ([out_wav_16k] if out_wav_16k else [])
+    if broker is not None or "tts" in worker_pools:
+        params = {
+            "ref_audio": ref_audio,
+            "ref_text": ref_text,
+            "gen_text": script or "",
+            "out_wav": out_wav,
+            "out_wav_16k": out_wav_16k,
+            "nfe_steps": TTS_SETTINGS["nfe_steps"],
+            "seed": TTS_SETTINGS["seed"],
+            "batch_chunks": TTS_SETTINGS["batch_chunks"],
+            "max_batch_frames": TTS_SETTINGS["max_batch_frames"] or None,
+        }
+        logging.info("%s submitting audio gen to a resident tts worker: %s", tag, params)
+        try:
+            _record_report("tts", await _run_resident("tts", params, tag))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("%s audio generation failed on a resident tts worker", tag)
+            return False
+        return all(os.path.exists(path) for path in outputs)
+
+    script_path = os.path.join(BACKEND_DIR, "run_infer.py")
+    # Build the command line to forward the saved audio and script to run_infer
+    cmd = [INFER_PYTHON, script_path]
+    # include ref-audio only if present
+    if ref_audio:
+        cmd += ['--ref-audio', ref_audio]
+    if ref_text:
+        cmd += ['--ref-text', ref_text]
+    # Always pass --gen-text (may be empty) to ensure the inference
+    # script receives the intended generation text instead of falling
+    # back to internal defaults.
+    cmd += ['--gen-text', script or ""]
+    cmd += ['--out-wav', out_wav]
+    if out_wav_16k:
+        cmd += ['--out-wav-16k', out_wav_16k]
+    cmd += ['--nfe-steps', str(TTS_SETTINGS["nfe_steps"]), '--seed', str(TTS_SETTINGS["seed"])]
+    if TTS_SETTINGS["batch_chunks"]:
+        cmd += ['--batch-chunks']
+        if TTS_SETTINGS["max_batch_frames"]:
+            cmd += ['--max-batch-frames', str(TTS_SETTINGS["max_batch_frames"])]
+
+    try:
+        returncode, _ = await run_process(cmd, "%s run_infer:" % tag, cwd=BACKEND_DIR, on_line=_timings_line_parser("tts"))
+    except OSError as e:
+        logging.exception("%s failed to run inference subprocess: %s", tag, e)
+        return False
+    return returncode == 0 and all(os.path.exists(path) for path in outputs)
+
+
+@_timed("reference_prep")
+async def _prepare_reference(ref_audio, out_wav, tag):
+    """Clip and transcribe a reference voice once for several TTS runs
+    (run_infer.prepare_reference), writing the clip to `out_wav`.
+
+    Returns the transcript to pass as `ref_text` to _generate_audio. Raises
+    JobFailed on error.
+    """
+    if broker is not None or "tts" in worker_pools:
+        params = {"task": "prepare_ref", "ref_audio": ref_audio, "out_wav": out_wav}
+        try:
+            result = await _run_resident("tts", params, tag)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("%s reference preprocessing failed on a resident tts worker", tag)
+            raise JobFailed(f"reference preprocessing failed: {e}")
+        return result["ref_text"]
+
+    cmd = [INFER_PYTHON, os.path.join(BACKEND_DIR, "run_infer.py"), "--prepare-ref", "--ref-audio", ref_audio, "--out-wav", out_wav]
+    transcripts = []
+
+    def on_line(line):
+        match = REFERENCE_RE.search(line)
+        if match:
+            transcripts.append(json.loads(match.group(1))["ref_text"])
+
+    try:
+        returncode, tail = await run_process(cmd, "%s run_infer:" % tag, cwd=BACKEND_DIR, on_line=on_line)
+    except OSError as e:
+        raise JobFailed(f"failed to run reference preprocessing: {e}")
+    if returncode != 0 or not transcripts or not os.path.exists(out_wav):
+        raise JobFailed("reference preprocessing failed: %s" % " ".join(tail[-3:]))
+    return transcripts[-1]
+
+
+@_timed("lipsync")
+async def _run_lipsync(video_path, audio_path, out_mp4, tag, on_progress=None, alignment_cache=None, stream_dir=None):
+    """Run LatentSync on `video_path` + `audio_path` into `out_mp4`.
+
+    Uses the job broker or the resident lipsync pool when enabled, otherwise
+    spawns run_inference_hardcoded.py. `on_progress(window, windows)` is
+    called as windows of frames finish. With `alignment_cache` the face
+    alignment of the video is loaded from (or saved to) that file, so jobs
+    sharing a video detect and align faces once. With `stream_dir` the video
+    is also published there progressively as HLS. Returns True on success.
+    """
+    if broker is not None or "lipsync" in worker_pools:
+        params = {
+            "video_path": os.path.abspath(video_path),
+            "audio_path": os.path.abspath(audio_path),
+            "video_out_path": os.path.abspath(out_mp4),
+            # per-run scratch dir so concurrent lipsync workers never share LatentSync's temp folder
+            "temp_dir": os.path.join(os.path.dirname(os.path.abspath(out_mp4)), "latentsync_tmp"),
+            "inference_steps": LIPSYNC_SETTINGS["inference_steps"],
+            "guidance_scale": LIPSYNC_SETTINGS["guidance_scale"],
+            "seed": LIPSYNC_SETTINGS["seed"],
+            "alignment_cache": os.path.abspath(alignment_cache) if alignment_cache else None,
+            "stream_dir": os.path.abspath(stream_dir) if stream_dir else None,
+        }
+        logging.info("%s submitting lipsync to a resident lipsync worker: %s", tag, params)
+        forward = None
+        if on_progress is not None:
+            forward = lambda message: on_progress(message["window"], message["windows"])  # noqa: E731
+        try:
+            _record_report("lipsync", await _run_resident("lipsync", params, tag, on_progress=forward))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("%s latentsync failed on a resident lipsync worker", tag)
+            return False
+        return os.path.exists(out_mp4)
+
+    latentsync_script = os.path.join(LATENTSYNC_DIR, "run_inference_hardcoded.py")
+    latentsync_cmd = [LATENTSYNC_PYTHON, latentsync_script, "--video-path", video_path, "--audio-path", audio_path, "--video-out-path", out_mp4]
+    latentsync_cmd += [
+        "--inference-steps", str(LIPSYNC_SETTINGS["inference_steps"]),
+        "--guidance-scale", str(LIPSYNC_SETTINGS["guidance_scale"]),
+        "--seed", str(LIPSYNC_SETTINGS["seed"]),
+        # per-run scratch dir, removed with the run's other intermediates
+        "--temp-dir", os.path.join(os.path.dirname(os.path.abspath(out_mp4)), "latentsync_tmp"),
+    ]
+    if alignment_cache:
+        latentsync_cmd += ["--alignment-cache", os.path.abspath(alignment_cache)]
+    if stream_dir:
+        latentsync_cmd += ["--stream-dir", os.path.abspath(stream_dir)]
+
+    def on_line(line):
+        match = LIPSYNC_PROGRESS_RE.search(line)
+        if match and on_progress is not None:
+            on_progress(int(match.group(1)), int(match.group(2)))
+
+    try:
+        # Stream latentsync stdout/stderr to the server terminal in real-time
+        returncode, _ = await run_process(
+            latentsync_cmd, "%s latentsync:" % tag, cwd=LATENTSYNC_DIR, on_line=_timings_line_parser("lipsync", on_line)
+        )
+    except OSError:
+        logging.exception("%s latentsync subprocess failed", tag)
+        return False
+    return returncode == 0
+
+
+@_timed("audio_ingest")
+async def _ingest_audio(src, outputs, tag):
+    """Decode the audio of `src` once into `{sample_rate: wav_path}` (see audio_ingest.py). Raises JobFailed on error."""
+    return await ingest(src, outputs, tag)
+
+
+def _cleanup_partials(run_dir):
+    """Remove half-written outputs (*.partial.*) and LatentSync scratch files of a failed/cancelled job."""
+    try:
+        names = os.listdir(run_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(run_dir, name)
+        if ".partial." in name:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        elif name in ("latentsync_tmp", "stream"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+async def _save_upload(upload, dest_path, what):
+    """Stream an upload into the run directory (see uploads.py); 413 when it is over MAX_UPLOAD_BYTES."""
+    start = time.time()
+    try:
+        saved = await spool_upload(upload, dest_path, max_bytes=MAX_UPLOAD_BYTES)
+        STAGE_SECONDS.observe(time.time() - start, stage="upload")
+        return saved
+    except UploadTooLarge as e:
+        logging.warning("Rejected uploaded %s: %s", what, e)
+        raise HTTPException(status_code=413, detail=f"{what} {e}")
+
+
+def _upload_params(saved):
+    """The part of a spool_upload() result recorded in the job's params."""
+    return {"size": saved["size"], "sha256": saved["sha256"], "probe": saved["probe"]}
+
+
+def _audio_cache_key(ref_audio_id, script):
+    """Cache key of a TTS result: reference audio content, script and TTS settings."""
+    return make_key(kind="audio", ref_audio=ref_audio_id, script=script or "", tts=TTS_SETTINGS)
+
+
+def _serve_from_cache(key, run_id, run_dir, kind, request, priority, params, message):
+    """Answer a request from the result cache when possible.
+
+    Returns the endpoint's response for a cache hit (a new job that is
+    already done) or for an identical job still running (that job's id), or
+    None after registering `run_id` as the job that will produce `key`.
+    """
+    outcome, value = result_cache.lookup(key, run_id)
+    if outcome == "inflight":
+        logging.info("Identical %s job %s already running; coalescing request onto it.", kind, value)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        return {"message": message, "run_id": value, "job_id": value, "coalesced": True}
+    if outcome == "hit":
+        logging.info("Serving %s job %s from the result cache.", kind, run_id)
+        outputs = {name: publish_copy(path, os.path.join(run_dir, name)) for name, path in value.items()}
+        jobs.create(run_id, kind, client=_client_id(request), priority=priority, params=dict(params, cache="hit"))
+        now = time.time()
+        jobs.update(
+            run_id,
+            state=jobstore.DONE,
+            started_at=now,
+            finished_at=now,
+            audio_path=outputs.get("generated_out.wav"),
+            video_path=outputs.get("final_output.mp4"),
+        )
+        return {"message": message, "run_id": run_id, "job_id": run_id, "cached": True}
+    return None
+
+
+def _admit(key, run_id, run_dir, params, stages):
+    """Admission control: estimate the job's cost per stage and register it,
+    or release its cache slot, drop its run dir and answer 429 (with
+    Retry-After) / 413 when the server cannot take it."""
+    features = params["features"]
+    estimate = admission.estimate(features, stages)
+    memory = job_memory_bytes(features, ADMISSION_LIPSYNC_BASE_BYTES) if "lipsync" in stages else 0
+    try:
+        admission.try_admit(run_id, estimate, memory)
+    except Rejected as e:
+        logging.warning("Rejected job %s (estimate %s): %s", run_id, estimate, e)
+        result_cache.release(key, run_id)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+    params["estimate"] = estimate
+
+
+def _managed_job(key, kind, fn, outputs):
+    """Wrap a job coroutine: cache its outputs on success, remove half-written
+    files when it fails or is cancelled, and always release the singleflight slot."""
+
+    async def run(job_id):
+        try:
+            await fn(job_id)
+        except BaseException:
+            _cleanup_partials(os.path.join(RUNS_ROOT, job_id))
+            raise
+        else:
+            try:
+                result_cache.put(key, kind, {os.path.basename(path): path for path in outputs})
+            except Exception:
+                logging.exception("Failed to cache the result of job %s", job_id)
+        finally:
+            result_cache.release(key, job_id)
+
+    return run
+
+
+def _lipsync_wav(out_wav):
+    """Path of the 16 kHz copy of a run's generated speech, LatentSync's audio input."""
+    return os.path.join(os.path.dirname(out_wav), "generated_16k.wav")
+
+
+async def _ingest_reference(job_id, src, run_dir, tag):
+    """Decode the reference voice (uploaded audio, or the video's track) once at TTS_RATE for F5-TTS."""
+    reference = os.path.join(run_dir, "reference_24k.wav")
+    await scheduler.run_stage(job_id, "ffmpeg", _ingest_audio(src, {TTS_RATE: reference}, tag))
+    return reference
+
+
+async def _tts_stage(job_id, ref_audio, script, audio_key, out_wav, tag, ref_text=None):
+    """Run a video job's tts stage into `out_wav` (plus its 16 kHz copy), publish and cache both.
+
+    Returns the 16 kHz path, LatentSync's audio input.
+    """
+    out_16k = _lipsync_wav(out_wav)
+    generated = _generate_audio(
+        ref_audio, script, partial_path(out_wav), tag, ref_text=ref_text, out_wav_16k=partial_path(out_16k)
+    )
+    if not await scheduler.run_stage(job_id, "tts", generated):
+        raise JobFailed("audio generation failed")
+    publish(partial_path(out_16k), out_16k)
+    publish(partial_path(out_wav), out_wav)
+    try:
+        result_cache.put(audio_key, "audio", {"generated_out.wav": out_wav, "generated_16k.wav": out_16k})
+    except Exception:
+        logging.exception("%s failed to cache TTS output", tag)
+    return out_16k
+
+
+async def _reuse_tts_output(job_id, cached_audio, out_wav, tag):
+    """Publish a cached TTS result into the run dir. Returns the 16 kHz path for LatentSync."""
+    logging.info("%s reusing cached TTS output", tag)
+    publish_copy(cached_audio["generated_out.wav"], out_wav)
+    out_16k = _lipsync_wav(out_wav)
+    if "generated_16k.wav" in cached_audio:
+        publish_copy(cached_audio["generated_16k.wav"], out_16k)
+    else:
+        # cached before the 16 kHz copy was produced alongside the speech
+        await scheduler.run_stage(job_id, "ffmpeg", _ingest_audio(out_wav, {WHISPER_RATE: out_16k}, tag))
+    return out_16k
+
+
+def _record_first_frame(job_id, mode):
+    """Record a video job's time to first frame (once): the job's `first_frame_at` and the metric."""
+    job = jobs.get(job_id)
+    if job is None or job["first_frame_at"] is not None:
+        return
+    now = time.time()
+    jobs.update(job_id, first_frame_at=now)
+    TIME_TO_FIRST_FRAME.observe(now - job["created_at"], mode=mode)
+
+
+async def _watch_stream(job_id, stream_dir, group_id=None):
+    """Announce a progressive stream once its playlist lists a first segment."""
+    playlist = os.path.join(stream_dir, "index.m3u8")
+    while True:
+        try:
+            with open(playlist) as f:
+                if "#EXTINF" in f.read():
+                    break
+        except OSError:
+            pass
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+    _record_first_frame(job_id, "stream")
+    _publish_event(job_id, "artifact", {"name": "stream", "url": STREAM_PLAYLIST_URL.format(job_id=job_id)}, group_id)
+
+
+async def _lipsync_stage(job_id, video_path, audio_path, out_mp4, tag, group_id=None, alignment_cache=None, progressive=False):
+    """Run a video job's lipsync stage into `out_mp4` (with per-window progress events) and publish it.
+
+    With `progressive` LatentSync also writes an HLS stream to the run's
+    `stream/` directory, announced as a `stream` artifact once its first
+    segment exists.
+    """
+
+    def on_window(window, windows):
+        _publish_event(job_id, "progress", {"stage": "lipsync", "window": window, "windows": windows}, group_id)
+
+    stream_dir = os.path.join(os.path.dirname(out_mp4), "stream") if progressive else None
+    lipsync = _run_lipsync(
+        video_path,
+        audio_path,
+        partial_path(out_mp4),
+        tag,
+        on_progress=on_window,
+        alignment_cache=alignment_cache,
+        stream_dir=stream_dir,
+    )
+    watcher = asyncio.create_task(_watch_stream(job_id, stream_dir, group_id)) if progressive else None
+    try:
+        if not await scheduler.run_stage(job_id, "lipsync", lipsync):
+            raise JobFailed("latentsync failed")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+    if not os.path.exists(partial_path(out_mp4)):
+        raise JobFailed("latentsync finished without writing a video")
+    jobs.update(job_id, video_path=publish(partial_path(out_mp4), out_mp4))
+    _record_first_frame(job_id, "file")
+
+
 # API endpoint for audio generation
 @app.post("/api/audio-gen")
-async def audio_gen(background_tasks: BackgroundTasks, audio: UploadFile = File(...), script: str = Form("")):
+async def audio_gen(request: Request, audio: UploadFile = File(...), script: str = Form(""), priority: int = Form(0)):
     """Accept an uploaded audio file and a script, save them to a per-run
-    temp directory, spawn `run_infer.py` with CLI args pointing to the
-    saved audio and requested output path, and return immediately.
+    temp directory, queue a TTS job on the scheduler and return immediately.
+    Poll `/api/jobs/{job_id}` for its state.
     """
-    logging.info("Audio generation API called; saving uploaded assets and launching inference.")
-
-
-    script_path = os.path.join(os.path.dirname(__file__), "run_infer.py")
+    logging.info("Audio generation API called; saving uploaded assets and queueing inference.")
 
     # create a unique run directory to hold uploaded file and output
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    os.makedirs(runs_root, exist_ok=True)
-    run_id = uuid.uuid4().hex
-    run_dir = os.path.join(runs_root, run_id)
-    os.makedirs(run_dir, exist_ok=True)
+    run_id, run_dir = _new_run_dir()
 
     saved_audio = None
+    params = {"script": script}
     try:
         if audio:
             # sanitize filename minimally by using a fixed name inside run dir
             saved_audio = os.path.join(run_dir, 'input_audio' + os.path.splitext(audio.filename)[1])
-            with open(saved_audio, 'wb') as f:
-                f.write(await audio.read())
+            params["audio"] = _upload_params(await _save_upload(audio, saved_audio, "audio"))
+    except HTTPException:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise
     except Exception as e:
         logging.exception("Failed to save uploaded audio: %s", e)
+        shutil.rmtree(run_dir, ignore_errors=True)
         return {"error": "failed to save uploaded audio"}
 
     out_wav = os.path.join(run_dir, 'generated_out.wav')
+    out_16k = _lipsync_wav(out_wav)
 
-    def _run_infer_subprocess():
-        # Build the command line to forward the saved audio and script to run_infer
-        cmd = [INFER_PYTHON, script_path]
-        # include ref-audio only if present
-        if saved_audio:
-            cmd += ['--ref-audio', saved_audio]
-        # Always pass --gen-text (may be empty) to ensure the inference
-        # script receives the intended generation text instead of falling
-        # back to internal defaults.
-        cmd += ['--gen-text', script or ""]
-        cmd += ['--out-wav', out_wav]
-
-        logging.info("Invoking run_infer (audio-gen): %s", " ".join(cmd))
+    async def _run_audio_job(job_id):
+        tag = "(audio-gen %s)" % job_id
+        reference = await _ingest_reference(job_id, saved_audio, run_dir, tag) if saved_audio else None
+        # the 16 kHz copy is cached with the speech so a video job on the same voice and script can reuse both
+        generated = _generate_audio(reference, script, partial_path(out_wav), tag, out_wav_16k=partial_path(out_16k))
+        if not await scheduler.run_stage(job_id, "tts", generated):
+            raise JobFailed("audio generation failed")
+        publish(partial_path(out_16k), out_16k)
+        jobs.update(job_id, audio_path=publish(partial_path(out_wav), out_wav))
 
-        try:
-            proc = subprocess.run(cmd, cwd=os.path.dirname(__file__), capture_output=True, text=True)
-            logging.info("run_infer finished with returncode=%s", proc.returncode)
-            if proc.stdout:
-                logging.info("run_infer stdout: %s", proc.stdout)
-            if proc.stderr:
-                logging.error("run_infer stderr: %s", proc.stderr)
-        except Exception as e:
-            logging.exception("Failed to run inference subprocess: %s", e)
+    params["features"] = job_features(script, ref_probe=params["audio"]["probe"] if saved_audio else None)
+    key = _audio_cache_key(params["audio"]["sha256"] if saved_audio else None, script)
+    cached = _serve_from_cache(key, run_id, run_dir, "audio", request, priority, params, "Audio generation started.")
+    if cached is not None:
+        return cached
+    _admit(key, run_id, run_dir, params, ["ffmpeg", "tts"] if saved_audio else ["tts"])
 
-    # start the background task and return immediately
-    background_tasks.add_task(_run_infer_subprocess)
+    # queue the job and return immediately
+    jobs.create(run_id, "audio", client=_client_id(request), priority=priority, params=params)
+    scheduler.submit(
+        run_id, _managed_job(key, "audio", _run_audio_job, [out_wav, out_16k]), client=_client_id(request), priority=priority
+    )
 
     # Return both run_id and job_id for compatibility with clients that expect either name.
     # Both values are identical (the UUID used for the run directory).
     return {"message": "Audio generation started.", "run_id": run_id, "job_id": run_id}
 
 
-# Note: status polling endpoint removed in simple mode.
-
 # API endpoint for video generation
 @app.post("/api/video-gen")
-async def video_gen(background_tasks: BackgroundTasks, video: UploadFile = File(...), audio: UploadFile | str | None = File(None), script: str = Form("")):
+async def video_gen(request: Request, video: UploadFile = File(...), audio: UploadFile | str | None = File(None), script: str = Form(""), priority: int = Form(0), progressive: bool = Form(False)):
     """Accept a video plus either (audio + script) or (script only).
 
     Cases:
     1) video + audio + script: send audio+script to the audio-gen flow (run_infer.py) to produce a generated audio, then run LatentSync with the provided video and generated audio.
     2) video + script (no audio): extract audio from the uploaded video (ffmpeg), send that extracted audio + script to audio-gen flow, then run LatentSync with the video + generated audio.
 
-    The endpoint waits for both audio generation and latent-sync inference to finish and then returns the final MP4 as a streamed file.
+    The work is queued on the scheduler and the endpoint returns a job id
+    at once; `/api/jobs/{job_id}` reports the job's state and stage. With
+    `progressive=true` the video can be watched while it renders: a `stream`
+    artifact event points at `/api/jobs/{job_id}/stream/index.m3u8` once the
+    first segment is ready.
     """
     logging.info("Video generation API called.")
 
@@ -128,22 +869,29 @@ async def video_gen(background_tasks: BackgroundTasks, video: UploadFile = File(
         logging.info("Received audio field as string; treating as no file (audio=None)")
         audio = None
 
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    os.makedirs(runs_root, exist_ok=True)
-    run_id = uuid.uuid4().hex
-    run_dir = os.path.join(runs_root, run_id)
-    os.makedirs(run_dir, exist_ok=True)
+    run_id, run_dir = _new_run_dir()
+
+    params = {"script": script, "has_audio": audio is not None, "progressive": progressive}
 
-    # Save uploaded video
+    # Save uploaded video (streamed in chunks, hashed and probed while it is written)
     try:
         video_ext = os.path.splitext(video.filename)[1] or ".mp4"
         saved_video = os.path.join(run_dir, "input_video" + video_ext)
-        with open(saved_video, "wb") as vf:
-            vf.write(await video.read())
+        params["video"] = _upload_params(await _save_upload(video, saved_video, "video"))
+    except HTTPException:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise
     except Exception as e:
         logging.exception("Failed to save uploaded video: %s", e)
+        shutil.rmtree(run_dir, ignore_errors=True)
         return {"error": "failed to save uploaded video"}
 
+    # The probe lets us refuse unusable uploads now instead of minutes later in LatentSync
+    video_probe = params["video"]["probe"]
+    if video_probe is not None and not video_probe["has_video"]:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="uploaded video has no video stream")
+
     # If audio uploaded, save it; otherwise we'll extract from video
     saved_input_audio = None
     if audio:
@@ -151,157 +899,325 @@ async def video_gen(background_tasks: BackgroundTasks, video: UploadFile = File(
             audio_ext = os.path.splitext(audio.filename)[1] or ".wav"
             saved_input_audio = os.path.join(run_dir, "input_audio" + audio_ext)
             logging.info("Saving uploaded audio to %s", saved_input_audio)
-            with open(saved_input_audio, "wb") as af:
-                data = await audio.read()
-                af.write(data)
-            logging.info("Saved uploaded audio (%d bytes)", os.path.getsize(saved_input_audio))
+            params["audio"] = _upload_params(await _save_upload(audio, saved_input_audio, "audio"))
+            logging.info("Saved uploaded audio (%d bytes)", params["audio"]["size"])
+        except HTTPException:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            raise
         except Exception as e:
             logging.exception("Failed to save uploaded audio: %s", e)
+            shutil.rmtree(run_dir, ignore_errors=True)
             return {"error": "failed to save uploaded audio"}
+    elif video_probe is not None and not video_probe["has_audio"]:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="no audio uploaded and the video has no audio track to use as reference")
 
-    # If no input audio, extract from video using ffmpeg
-    extracted_audio = os.path.join(run_dir, "extracted_audio.wav")
-    if saved_input_audio is None:
-        # Call ffmpeg to extract audio. Requires ffmpeg to be installed and in PATH.
-        ffmpeg_cmd = [
-            "ffmpeg",
-            "-y",
-            "-i",
-            saved_video,
-            "-vn",
-            "-acodec",
-            "pcm_s16le",
-            "-ar",
-            "44100",
-            "-ac",
-            "2",
-            extracted_audio,
-        ]
-        try:
-            logging.info("Extracting audio from video using ffmpeg: %s", " ".join(ffmpeg_cmd))
-            proc = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-            logging.info("ffmpeg returncode=%s", proc.returncode)
-            if proc.stdout:
-                logging.info("ffmpeg stdout: %s", proc.stdout)
-            if proc.stderr:
-                logging.info("ffmpeg stderr: %s", proc.stderr)
-            if proc.returncode != 0:
-                logging.error("ffmpeg audio extraction failed (returncode %s)", proc.returncode)
-                return {"error": "failed to extract audio from video (ffmpeg error)", "details": proc.stderr}
-            saved_input_audio = extracted_audio
-            logging.info("Extracted audio saved to %s (size=%d bytes)", saved_input_audio, os.path.getsize(saved_input_audio))
-        except FileNotFoundError:
-            logging.exception("ffmpeg not found; required to extract audio from video.")
-            return {"error": "ffmpeg not found on server; cannot extract audio"}
-        except Exception as e:
-            logging.exception("Audio extraction failed: %s", e)
-            return {"error": "audio extraction failed", "details": str(e)}
+    # An uploaded reference voice is identified by its bytes; one extracted
+    # from the video is fully determined by the video's bytes.
+    ref_audio_id = params["audio"]["sha256"] if audio else "video:" + params["video"]["sha256"]
+    audio_key = _audio_cache_key(ref_audio_id, script)
+    key = make_key(
+        kind="video",
+        video=params["video"]["sha256"],
+        ref_audio=ref_audio_id,
+        script=script or "",
+        tts=TTS_SETTINGS,
+        lipsync=LIPSYNC_SETTINGS,
+    )
+    params["features"] = job_features(
+        script, ref_probe=params["audio"]["probe"] if audio else video_probe, video_probe=video_probe
+    )
+    cached = _serve_from_cache(key, run_id, run_dir, "video", request, priority, params, "Video generation started.")
+    if cached is not None:
+        return cached
+    # stages this job will run: reference ingest and TTS only when its audio is not cached yet
+    stages = ["lipsync"]
+    if result_cache.get(audio_key) is None:
+        stages = ["ffmpeg", "tts"] + stages
+    _admit(key, run_id, run_dir, params, stages)
 
-    # Start a background job to do any needed extraction/audio generation and
-    # then run LatentSync. Return immediately with a run_id so the frontend
-    # can poll /api/jobs/{run_id}/video for the final MP4.
-    script_path = os.path.join(os.path.dirname(__file__), "run_infer.py")
+    # Queue a job to do any needed extraction/audio generation and then run
+    # LatentSync. Return immediately with a run_id so the frontend can follow
+    # /api/jobs/{run_id}/events and then fetch /api/jobs/{run_id}/video.
     out_wav = os.path.join(run_dir, "generated_out.wav")
     out_mp4 = os.path.join(run_dir, "final_output.mp4")
 
-    def _run_video_job():
-        logging.info("Background video job started: %s", run_id)
+    async def _run_video_job(job_id):
+        logging.info("Background video job started: %s", job_id)
 
-        # If we don't have an input audio (client didn't send), extract it
-        local_input_audio = saved_input_audio
-        if local_input_audio is None:
-            # extract audio using ffmpeg
-            try:
-                logging.info("(bg) extracting audio from %s", saved_video)
-                proc = subprocess.run([
-                    "ffmpeg", "-y", "-i", saved_video, "-vn", "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2", extracted_audio
-                ], capture_output=True, text=True)
-                logging.info("(bg) ffmpeg rc=%s stdout=%s stderr=%s", proc.returncode, proc.stdout, proc.stderr)
-                if proc.returncode != 0:
-                    logging.error("(bg) ffmpeg failed for run %s", run_id)
-                    return
-                local_input_audio = extracted_audio
-            except Exception:
-                logging.exception("(bg) audio extraction failed for run %s", run_id)
-                return
+        # Call run_infer.py (or the tts pool) to generate the final audio
+        # from the reference audio and the script, unless the same voice and
+        # script were already synthesized (by an audio-gen or another video job).
+        tag = "(bg %s)" % job_id
+        cached_audio = result_cache.get(audio_key)
+        if cached_audio is not None:
+            lipsync_audio = await _reuse_tts_output(job_id, cached_audio, out_wav, tag)
+        else:
+            # Decode the reference once: the uploaded audio, or the video's own track when none was sent
+            reference = await _ingest_reference(job_id, saved_input_audio or saved_video, run_dir, tag)
+            lipsync_audio = await _tts_stage(job_id, reference, script, audio_key, out_wav, tag)
+        jobs.update(job_id, audio_path=out_wav)
 
-        # Call run_infer.py to generate the final audio if needed (if the
-        # provided audio is not already the final generated file). In our
-        # integration the client normally uploads a generated audio blob so
-        # this step is a no-op when audio was provided.
-        try:
-            audio_cmd = [INFER_PYTHON, script_path, "--ref-audio", local_input_audio, "--out-wav", out_wav]
-            if script:
-                audio_cmd += ["--gen-text", script]
-            logging.info("(bg) running audio gen: %s", " ".join(audio_cmd))
-            proc = subprocess.run(audio_cmd, cwd=os.path.dirname(__file__), capture_output=True, text=True)
-            logging.info("(bg) run_infer rc=%s stdout=%s stderr=%s", proc.returncode, proc.stdout, proc.stderr)
-            if proc.returncode != 0:
-                logging.error("(bg) audio generation failed for run %s", run_id)
-                return
-            if not os.path.exists(out_wav):
-                logging.error("(bg) expected out_wav not found for run %s", run_id)
-                return
-        except Exception:
-            logging.exception("(bg) audio generation subprocess failed for run %s", run_id)
-            return
-
-        # Run LatentSync
-        latentsync_script = os.path.join(os.path.dirname(__file__), "latentsync", "run_inference_hardcoded.py")
-        latentsync_venv_py = os.path.join(os.path.dirname(__file__), "latentsync", "latentsync-venv", "Scripts", "python.exe")
-        latentsync_python = latentsync_venv_py if os.path.exists(latentsync_venv_py) else (INFER_PYTHON if INFER_PYTHON else sys.executable)
-        latentsync_cwd = os.path.join(os.path.dirname(__file__), "latentsync")
-        latentsync_cmd = [latentsync_python, latentsync_script, "--video-path", saved_video, "--audio-path", out_wav, "--video-out-path", out_mp4]
+        # Run LatentSync on the 16 kHz copy of the speech
+        await _lipsync_stage(job_id, saved_video, lipsync_audio, out_mp4, tag, progressive=progressive)
+
+        logging.info("(bg) latentsync finished for run %s, output=%s", job_id, out_mp4)
+
+    # queue the job and return immediately
+    jobs.create(run_id, "video", client=_client_id(request), priority=priority, params=params)
+    scheduler.submit(
+        run_id, _managed_job(key, "video", _run_video_job, [out_wav, out_mp4]), client=_client_id(request), priority=priority
+    )
+
+    return {"message": "Video generation started.", "run_id": run_id, "job_id": run_id}
+
+
+def _parse_scripts(scripts):
+    """Scripts of a batch request: repeated `scripts` form fields, or one field holding a JSON list."""
+    if len(scripts) == 1 and scripts[0].lstrip().startswith("["):
         try:
-            logging.info("(bg) running latentsync: %s (cwd=%s)", " ".join(latentsync_cmd), latentsync_cwd)
-            # Stream latentsync stdout/stderr to the server terminal in real-time
-            proc2 = subprocess.Popen(latentsync_cmd, cwd=latentsync_cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            try:
-                if proc2.stdout is not None:
-                    for line in proc2.stdout:
-                        logging.info("(bg) latentsync: %s", line.rstrip())
-                proc2.wait()
-            except Exception:
-                logging.exception("(bg) error while streaming latentsync output for run %s", run_id)
-                try:
-                    proc2.kill()
-                except Exception:
-                    pass
+            scripts = json.loads(scripts[0])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="scripts is not a valid JSON list")
+        if not isinstance(scripts, list) or not all(isinstance(script, str) for script in scripts):
+            raise HTTPException(status_code=400, detail="scripts must be a list of strings")
+    scripts = [script for script in scripts if script.strip()]
+    if not scripts:
+        raise HTTPException(status_code=400, detail="no scripts given")
+    if len(scripts) > BATCH_MAX_SCRIPTS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_MAX_SCRIPTS} scripts per batch")
+    return scripts
 
-            logging.info("(bg) latentsync rc=%s", proc2.returncode)
-            if proc2.returncode != 0:
-                logging.error("(bg) latentsync failed for run %s", run_id)
-                return
 
-            logging.info("(bg) latentsync finished for run %s, output=%s", run_id, out_mp4)
-        except Exception:
-            logging.exception("(bg) latentsync subprocess failed for run %s", run_id)
-            return
+# API endpoint for generating several scripts on one avatar
+@app.post("/api/batch/video-gen")
+async def batch_video_gen(
+    request: Request,
+    video: UploadFile = File(...),
+    audio: UploadFile | str | None = File(None),
+    scripts: list[str] = Form(...),
+    priority: int = Form(0),
+    progressive: bool = Form(False),
+):
+    """Like /api/video-gen for several scripts on the same video (and voice).
 
-    # start the background task and return immediately
-    background_tasks.add_task(_run_video_job)
+    The work shared by all scripts runs once in a `batch` job: decoding the
+    reference voice (the uploaded audio, else the video's track) and clipping
+    and transcribing it. It then queues one video job per
+    script on the scheduler; the first lipsync run saves the video's face
+    alignment and the others reuse it. Scripts whose video is already in the
+    result cache are answered at once. `progressive` streams every script's
+    video as it renders, as for /api/video-gen.
 
-    return {"message": "Video generation started.", "run_id": run_id, "job_id": run_id}
+    Returns the group id (the batch job's id) and the job id of every script;
+    follow the whole group at `/api/groups/{group_id}` or
+    `/api/groups/{group_id}/events`.
+    """
+    logging.info("Batch video generation API called.")
+    if isinstance(audio, str):
+        audio = None
+    scripts = _parse_scripts(scripts)
+    client = _client_id(request)
+
+    group_id, group_dir = _new_run_dir()
+    params = {"scripts": len(scripts), "has_audio": audio is not None, "progressive": progressive}
+    try:
+        saved_video = os.path.join(group_dir, "input_video" + (os.path.splitext(video.filename)[1] or ".mp4"))
+        params["video"] = _upload_params(await _save_upload(video, saved_video, "video"))
+        saved_input_audio = None
+        if audio:
+            saved_input_audio = os.path.join(group_dir, "input_audio" + (os.path.splitext(audio.filename)[1] or ".wav"))
+            params["audio"] = _upload_params(await _save_upload(audio, saved_input_audio, "audio"))
+    except HTTPException:
+        shutil.rmtree(group_dir, ignore_errors=True)
+        raise
+    except Exception:
+        logging.exception("Failed to save uploads of batch %s", group_id)
+        shutil.rmtree(group_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail="failed to save uploaded files")
+
+    video_probe = params["video"]["probe"]
+    if video_probe is not None and not video_probe["has_video"]:
+        shutil.rmtree(group_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="uploaded video has no video stream")
+    if not audio and video_probe is not None and not video_probe["has_audio"]:
+        shutil.rmtree(group_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="no audio uploaded and the video has no audio track to use as reference")
+
+    ref_audio_id = params["audio"]["sha256"] if audio else "video:" + params["video"]["sha256"]
+    ref_probe = params["audio"]["probe"] if audio else video_probe
+    # index -> {"job_id", "run_dir", "script", "key", "audio_key", "params", "cached"}
+    children = []
+    for index, script in enumerate(scripts):
+        job_id, run_dir = _new_run_dir()
+        key = make_key(
+            kind="video",
+            video=params["video"]["sha256"],
+            ref_audio=ref_audio_id,
+            script=script,
+            tts=TTS_SETTINGS,
+            lipsync=LIPSYNC_SETTINGS,
+        )
+        children.append({
+            "job_id": job_id,
+            "run_dir": run_dir,
+            "script": script,
+            "key": key,
+            "audio_key": _audio_cache_key(ref_audio_id, script),
+            "cached": result_cache.get(key),
+            "params": {
+                "script": script,
+                "index": index,
+                "has_audio": audio is not None,
+                "features": job_features(script, ref_probe=ref_probe, video_probe=video_probe),
+            },
+        })
+    pending = [child for child in children if child["cached"] is None]
+    needs_tts = [child for child in pending if result_cache.get(child["audio_key"]) is None]
+
+    # Admission control over the whole batch: the shared preprocessing plus every script still to generate
+    estimates = {}
+    if needs_tts:
+        shared_stages = ["ffmpeg", "tts"]
+        estimates[group_id] = admission.estimate(job_features("", ref_probe=ref_probe, video_probe=video_probe), shared_stages)
+    for child in pending:
+        stages = (["tts"] if child in needs_tts else []) + ["lipsync"]
+        estimates[child["job_id"]] = admission.estimate(child["params"]["features"], stages)
+    total = collections.Counter()
+    for estimate in estimates.values():
+        total.update(estimate)
+    memory = job_memory_bytes(children[0]["params"]["features"], ADMISSION_LIPSYNC_BASE_BYTES) if pending else 0
+    try:
+        admission.try_admit_group(
+            {job_id: (estimate, memory if job_id != group_id else 0) for job_id, estimate in estimates.items()}
+        )
+    except Rejected as e:
+        logging.warning("Rejected batch %s of %d scripts (estimate %s): %s", group_id, len(scripts), dict(total), e)
+        for run_dir in [group_dir] + [child["run_dir"] for child in children]:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+    params["jobs"] = [child["job_id"] for child in children]
+    params["estimate"] = estimates.get(group_id, {})
+    jobs.create(group_id, "batch", client=client, priority=priority, params=params)
+    for child in children:
+        job_id = child["job_id"]
+        child_params = dict(child["params"], estimate=estimates.get(job_id, {}))
+        if child["cached"] is not None:
+            outputs = {name: publish_copy(path, os.path.join(child["run_dir"], name)) for name, path in child["cached"].items()}
+            jobs.create(job_id, "video", client=client, priority=priority, params=dict(child_params, cache="hit"), group_id=group_id)
+            now = time.time()
+            jobs.update(
+                job_id,
+                state=jobstore.DONE,
+                started_at=now,
+                finished_at=now,
+                audio_path=outputs.get("generated_out.wav"),
+                video_path=outputs.get("final_output.mp4"),
+            )
+        else:
+            jobs.create(job_id, "video", client=client, priority=priority, params=child_params, group_id=group_id)
+
+    reference_wav = os.path.join(group_dir, "reference.wav")
+    alignment_cache = os.path.join(group_dir, "face_alignment.pt")
+
+    def _group_video_job(child, ref_audio, ref_text):
+        run_dir = child["run_dir"]
+        out_wav = os.path.join(run_dir, "generated_out.wav")
+        out_mp4 = os.path.join(run_dir, "final_output.mp4")
+
+        async def run(job_id):
+            tag = "(batch %s/%d)" % (group_id, child["params"]["index"])
+            cached_audio = result_cache.get(child["audio_key"])
+            if cached_audio is not None:
+                lipsync_audio = await _reuse_tts_output(job_id, cached_audio, out_wav, tag)
+            else:
+                lipsync_audio = await _tts_stage(
+                    job_id, ref_audio, child["script"], child["audio_key"], out_wav, tag, ref_text=ref_text
+                )
+            jobs.update(job_id, audio_path=out_wav)
+            await _lipsync_stage(
+                job_id,
+                saved_video,
+                lipsync_audio,
+                out_mp4,
+                tag,
+                group_id=group_id,
+                alignment_cache=alignment_cache,
+                progressive=progressive,
+            )
+
+        return _managed_job(child["key"], "video", run, [out_wav, out_mp4])
+
+    async def _run_batch_job(job_id):
+        """Shared preprocessing, then one scheduler job per script."""
+        tag = "(batch %s)" % job_id
+        ref_audio, ref_text = saved_input_audio, None
+        try:
+            if needs_tts:
+                ref_audio = await _ingest_reference(job_id, saved_input_audio or saved_video, group_dir, tag)
+                preparing = _prepare_reference(ref_audio, partial_path(reference_wav), tag)
+                ref_text = await scheduler.run_stage(job_id, "tts", preparing)
+                ref_audio = publish(partial_path(reference_wav), reference_wav)
+                jobs.update(job_id, params=dict(params, ref_text=ref_text))
+        except BaseException as e:
+            cancelled = isinstance(e, asyncio.CancelledError)
+            reason = "cancelled" if cancelled else f"shared preprocessing failed: {e}"
+            for child in pending:
+                if jobs.get(child["job_id"])["state"] == jobstore.QUEUED:
+                    jobs.update(
+                        child["job_id"],
+                        state=jobstore.CANCELLED if cancelled else jobstore.FAILED,
+                        error=reason,
+                        finished_at=time.time(),
+                    )
+            raise
+        for child in pending:
+            # a script cancelled while the shared preprocessing ran is not queued any more
+            if jobs.get(child["job_id"])["state"] == jobstore.QUEUED:
+                scheduler.submit(
+                    child["job_id"], _group_video_job(child, ref_audio, ref_text), client=client, priority=priority
+                )
+        logging.info("%s shared preprocessing done; queued %d script(s)", tag, len(pending))
+
+    scheduler.submit(group_id, _run_batch_job, client=client, priority=priority)
+    return {
+        "message": "Batch video generation started.",
+        "group_id": group_id,
+        "job_ids": params["jobs"],
+        "cached": [child["job_id"] for child in children if child["cached"] is not None],
+    }
 
 
 # API endpoint to retrieve generated audio for a run (returns 404 until file exists)
 from fastapi.responses import FileResponse, StreamingResponse
-from fastapi import HTTPException, Response
+from starlette.background import BackgroundTask
+
+
+def _pinned_file_response(path, media_type):
+    """FileResponse for a run artifact that the janitor will not delete while it is being sent.
+    Returns None if the file does not exist."""
+    janitor.pin(path)
+    if not os.path.isfile(path):
+        janitor.unpin(path)
+        return None
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path), background=BackgroundTask(janitor.unpin, path))
+
 
 @app.get("/api/jobs/{job_id}/audio")
 def get_job_audio(job_id: str):
     """Serve the generated_out.wav for the provided run_id when available.
     Returns 404 if the file is not yet present.
     """
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    run_dir = os.path.join(runs_root, job_id)
+    run_dir = os.path.join(RUNS_ROOT, job_id)
     out_wav = os.path.join(run_dir, 'generated_out.wav')
 
-    if os.path.exists(out_wav) and os.path.isfile(out_wav):
+    resp = _pinned_file_response(out_wav, 'audio/wav')
+    if resp is not None:
         # Stream the file back to the client. Set Content-Disposition to
         # inline and add CORS expose headers so browsers can fetch the blob
         # via XHR/fetch and access it from JavaScript.
-        resp = FileResponse(out_wav, media_type='audio/wav', filename='generated_out.wav')
         # prefer explicit inline so browsers don't force a download when
         # navigating to the URL; fetch() still works either way but some
         # clients are sensitive to attachment vs inline semantics.
@@ -319,34 +1235,14 @@ def get_job_audio(job_id: str):
 @app.get("/api/jobs/{job_id}/video")
 def get_job_video(job_id: str):
     """Serve the final output mp4 for the provided run_id when available.
-    Returns 404 until the file exists.
+    Returns 404 until the file exists. Outputs are renamed into place only
+    once complete (see artifacts.py), so an existing file is a whole file.
     """
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    run_dir = os.path.join(runs_root, job_id)
+    run_dir = os.path.join(RUNS_ROOT, job_id)
     out_mp4 = os.path.join(run_dir, 'final_output.mp4')
 
-    if os.path.exists(out_mp4) and os.path.isfile(out_mp4):
-        # Ensure the file is fully written (avoid serving a partially-written file)
-        # Some tools write files atomically, others write progressively; polling clients
-        # may observe the file as "exists" while it's still being written which can
-        # lead to Content-Length mismatches in the browser. Wait for the file size to
-        # stabilize before returning it.
-        stable_checks = 5
-        stable_interval = 0.2
-        last_size = -1
-        for i in range(stable_checks):
-            try:
-                size = os.path.getsize(out_mp4)
-            except Exception:
-                size = -1
-            logging.info("get_job_video: check %d/%d size=%d", i + 1, stable_checks, size)
-            if size == last_size and size > 0:
-                logging.info("get_job_video: file size stable (%d bytes) after %d checks", size, i + 1)
-                break
-            last_size = size
-            time.sleep(stable_interval)
-
-        resp = FileResponse(out_mp4, media_type='video/mp4', filename='final_output.mp4')
+    resp = _pinned_file_response(out_mp4, 'video/mp4')
+    if resp is not None:
         resp.headers['Content-Disposition'] = 'inline; filename="final_output.mp4"'
         # CORS is configured globally via middleware; keep these for legacy clients
         resp.headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
@@ -357,91 +1253,285 @@ def get_job_video(job_id: str):
         raise HTTPException(status_code=404, detail="not ready")
 
 
-@app.get("/api/jobs/{job_id}/video/fallback")
-def get_job_video_fallback(job_id: str):
-    """Fallback endpoint: directly read the run folder and return any MP4 found.
-
-    Use this when the primary `/api/jobs/{job_id}/video` path errors but the
-    video file exists on disk. This is a pragmatic patch for development and
-    debugging; consider removing or restricting it in production.
+@app.get("/api/jobs/{job_id}/stream/{name}")
+def get_job_stream(job_id: str, name: str):
+    """Progressive output of a video job submitted with `progressive=true`:
+    the HLS playlist `index.m3u8` and the fMP4 segments it lists. The
+    playlist grows while LatentSync renders (EXT-X-PLAYLIST-TYPE:EVENT) and
+    is final once it ends with EXT-X-ENDLIST. 404 until the stream exists.
     """
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    run_dir = os.path.join(runs_root, job_id)
-    if not os.path.exists(run_dir) or not os.path.isdir(run_dir):
-        raise HTTPException(status_code=404, detail="run not found")
-
-    # Serve exactly the run's final_output.mp4. This fallback intentionally
-    # avoids guessing or picking other files — the run directory for the
-    # provided job_id must contain final_output.mp4.
-    final_mp4 = os.path.join(run_dir, 'final_output.mp4')
-    if not (os.path.exists(final_mp4) and os.path.isfile(final_mp4)):
-        raise HTTPException(status_code=404, detail="final_output.mp4 not found for run")
-
-    try:
-        size = os.path.getsize(final_mp4)
-    except Exception:
-        size = None
-
-    logging.info("Fallback video serve for run %s -> %s (size=%s) ", job_id, final_mp4, size)
-
-    # Use FileResponse which supports Range requests and HEAD automatically.
-    resp = FileResponse(final_mp4, media_type='video/mp4', filename=os.path.basename(final_mp4))
-    resp.headers['Content-Disposition'] = f'inline; filename="{os.path.basename(final_mp4)}"'
-    resp.headers['Access-Control-Allow-Origin'] = 'http://localhost:3000'
-    resp.headers['Access-Control-Allow-Credentials'] = 'true'
-    resp.headers['Access-Control-Expose-Headers'] = 'Content-Disposition,Content-Length'
-    if size is not None:
-        resp.headers['Content-Length'] = str(size)
+    if not STREAM_FILE_RE.match(name) or not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        raise HTTPException(status_code=404, detail="not found")
+    path = os.path.join(RUNS_ROOT, job_id, "stream", name)
+    resp = _pinned_file_response(path, STREAM_MEDIA_TYPES[os.path.splitext(name)[1]])
+    if resp is None:
+        raise HTTPException(status_code=404, detail="not ready")
+    if name.endswith(".m3u8"):
+        # the playlist changes after every segment
+        resp.headers["Cache-Control"] = "no-cache"
     return resp
 
 
-@app.head("/api/jobs/{job_id}/video/fallback")
-def head_job_video_fallback(job_id: str):
-    """Respond to HEAD requests for the fallback video URL. Some clients
-    prefer to probe existence via HEAD. Return 200 with the same headers
-    (Content-Length, Content-Disposition) when the file exists, otherwise 404.
+def _snapshot_events(job):
+    """Events describing a job's current state, sent first on every /events connection."""
+    snapshot = [{"event": "state", "data": {"state": job["state"], "stage": job["stage"], "error": job["error"]}}]
+    progress = events.last_progress(job["id"])
+    if progress is not None:
+        snapshot.append(progress)
+    for column, (name, url) in ARTIFACT_URLS.items():
+        if job[column]:
+            snapshot.append({"event": "artifact", "data": {"name": name, "url": url.format(job_id=job["id"])}})
+    if os.path.isfile(os.path.join(RUNS_ROOT, job["id"], "stream", "index.m3u8")):
+        snapshot.append({"event": "artifact", "data": {"name": "stream", "url": STREAM_PLAYLIST_URL.format(job_id=job["id"])}})
+    return snapshot
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent events for one job: `state` (state/stage transitions),
+    `progress` (per-window lipsync progress) and `artifact` (an output was
+    published; its download URL). The stream ends once the job is finished.
     """
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    run_dir = os.path.join(runs_root, job_id)
-    if not os.path.exists(run_dir) or not os.path.isdir(run_dir):
-        raise HTTPException(status_code=404, detail="run not found")
+    if jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    queue = events.subscribe(job_id)
 
-    final_mp4 = os.path.join(run_dir, 'final_output.mp4')
-    if not (os.path.exists(final_mp4) and os.path.isfile(final_mp4)):
-        raise HTTPException(status_code=404, detail="final_output.mp4 not found for run")
+    async def stream():
+        try:
+            # snapshot after subscribing, so no transition can fall in between
+            job = jobs.get(job_id)
+            for event in _snapshot_events(job):
+                yield format_sse(event)
+            if job["state"] in jobstore.TERMINAL_STATES:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["event"] == "state" and event["data"]["state"] in jobstore.TERMINAL_STATES:
+                    return
+        finally:
+            events.unsubscribe(job_id, queue)
 
-    try:
-        size = os.path.getsize(final_mp4)
-    except Exception:
-        size = None
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Current state of a job: state (queued/running/done/failed), stage,
+    timestamps, error, and which artifacts are available."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    job["audio_ready"] = job.pop("audio_path") is not None
+    job["video_ready"] = job.pop("video_path") is not None
+    return job
 
-    headers = {
-        'Access-Control-Allow-Origin': 'http://localhost:3000',
-        'Access-Control-Allow-Credentials': 'true',
-        'Access-Control-Expose-Headers': 'Content-Disposition,Content-Length',
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job. A running stage's subprocess or worker
+    is killed (freeing its GPU memory) and half-written outputs are removed;
+    the job ends in state `cancelled`."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if job["state"] in jobstore.TERMINAL_STATES or not (scheduler.cancel(job_id) or _cancel_unscheduled(job)):
+        raise HTTPException(status_code=409, detail=f"job is already {job['state']}")
+    logging.info("Cancellation requested for job %s (was %s/%s)", job_id, job["state"], job["stage"])
+    return {"job_id": job_id, "cancelled": True}
+
+
+def _group_status(group):
+    """Aggregate state of a batch group: its shared preprocessing job plus one video job per script."""
+    members = jobs.list_group(group["id"])
+    counts = collections.Counter(job["state"] for job in members)
+    live_states = (jobstore.QUEUED, jobstore.RUNNING)
+    if group["state"] in live_states or counts[jobstore.QUEUED] or counts[jobstore.RUNNING]:
+        running = group["state"] == jobstore.RUNNING or counts[jobstore.RUNNING]
+        state = jobstore.RUNNING if running else jobstore.QUEUED
+    elif counts[jobstore.DONE] == len(members):
+        state = jobstore.DONE
+    elif counts[jobstore.DONE]:
+        # finished, but only some scripts produced a video
+        state = "partial"
+    elif group["state"] == jobstore.CANCELLED or counts[jobstore.CANCELLED] == len(members):
+        state = jobstore.CANCELLED
+    else:
+        state = jobstore.FAILED
+    return {
+        "group_id": group["id"],
+        "state": state,
+        "created_at": group["created_at"],
+        "preprocessing": {"state": group["state"], "stage": group["stage"], "error": group["error"]},
+        "total": len(members),
+        "counts": dict(counts),
+        "jobs": [
+            {
+                "job_id": job["id"],
+                "index": job["params"].get("index"),
+                "script": job["params"].get("script"),
+                "state": job["state"],
+                "stage": job["stage"],
+                "error": job["error"],
+                "cached": job["params"].get("cache") == "hit",
+                "audio_url": ARTIFACT_URLS["audio_path"][1].format(job_id=job["id"]) if job["audio_path"] else None,
+                "video_url": ARTIFACT_URLS["video_path"][1].format(job_id=job["id"]) if job["video_path"] else None,
+            }
+            for job in members
+        ],
     }
-    if size is not None:
-        headers['Content-Length'] = str(size)
-    headers['Content-Disposition'] = f'inline; filename="{os.path.basename(final_mp4)}"'
 
-    return Response(status_code=200, headers=headers)
+
+def _get_group(group_id):
+    group = jobs.get(group_id)
+    if group is None or group["kind"] != "batch":
+        raise HTTPException(status_code=404, detail="group not found")
+    return group
+
+
+@app.get("/api/groups/{group_id}")
+def get_group(group_id: str):
+    """State of a batch (see /api/batch/video-gen): overall state
+    (queued/running/done/partial/failed/cancelled), counts per job state and
+    each script's job with its download URLs once ready."""
+    return _group_status(_get_group(group_id))
+
+
+@app.get("/api/groups/{group_id}/events")
+async def group_events(group_id: str, request: Request):
+    """Server-sent events for a whole batch: the `state`, `progress` and
+    `artifact` events of every job in it (with a `job_id` field), plus a
+    `group` event carrying `/api/groups/{group_id}` whenever a job's state
+    changes. The stream ends once every job of the group has finished.
+    """
+    _get_group(group_id)
+    queue = events.subscribe(group_id)
+
+    async def stream():
+        try:
+            status = _group_status(jobs.get(group_id))
+            yield format_sse({"event": "group", "data": status})
+            if status["state"] not in (jobstore.QUEUED, jobstore.RUNNING):
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                # events of the batch job itself are published without a job id
+                event = {"event": event["event"], "data": dict({"job_id": group_id}, **event["data"])}
+                yield format_sse(event)
+                if event["event"] == "state":
+                    status = _group_status(jobs.get(group_id))
+                    yield format_sse({"event": "group", "data": status})
+                    if status["state"] not in (jobstore.QUEUED, jobstore.RUNNING):
+                        return
+        finally:
+            events.unsubscribe(group_id, queue)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _cancel_unscheduled(job):
+    """Cancel a batch job still waiting for its group's shared preprocessing (not on the scheduler yet)."""
+    if job["group_id"] and job["state"] == jobstore.QUEUED:
+        jobs.update(job["id"], state=jobstore.CANCELLED, error="cancelled", finished_at=time.time())
+        return True
+    return False
+
+
+@app.delete("/api/groups/{group_id}")
+async def cancel_group(group_id: str):
+    """Cancel every queued or running job of a batch, including its shared preprocessing."""
+    group = _get_group(group_id)
+    cancelled = []
+    if group["state"] not in jobstore.TERMINAL_STATES and scheduler.cancel(group_id):
+        cancelled.append(group_id)
+    for job in jobs.list_group(group_id):
+        if job["state"] in jobstore.TERMINAL_STATES:
+            continue
+        if scheduler.cancel(job["id"]) or _cancel_unscheduled(jobs.get(job["id"])):
+            cancelled.append(job["id"])
+    logging.info("Cancellation requested for batch %s (%d job(s))", group_id, len(cancelled))
+    return {"group_id": group_id, "cancelled": cancelled}
+
+
+@app.get("/api/scheduler")
+def scheduler_status():
+    """Queue depth, active jobs and per-stage occupancy of the scheduler."""
+    return scheduler.status()
+
+
+@app.get("/api/janitor")
+def janitor_status():
+    """Run-directory janitor: TTLs, quota, bytes per artifact class, pins and what has been freed."""
+    return janitor.stats()
+
+
+@app.get("/api/cache")
+def cache_status():
+    """Size, quota and hit/miss/coalesce counters of the result cache."""
+    return result_cache.stats()
+
+
+@app.get("/api/broker")
+def broker_status():
+    """Job broker: queued tasks per kind and the worker nodes currently heartbeating."""
+    if broker is None:
+        return {"enabled": False}
+    return dict(broker.status(), enabled=True, url=broker_description(BROKER_URL))
+
+
+@app.get("/api/admission")
+def admission_status():
+    """Admission control: estimated backlog per stage, admitted/rejected counts and the learned cost model."""
+    return admission.status()
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint: per-stage latency histograms, queue/job gauges and peak memory per stage."""
+    status = scheduler.status()
+    QUEUE_DEPTH.set(scheduler.queue_depth())
+    ACTIVE_JOBS.set(status["active_jobs"])
+    for name, stage in status["stages"].items():
+        STAGE_WAITING.set(stage["waiting"], stage=name)
+    JOBS_BY_STATE.clear()
+    for state, count in jobs.count_by_state().items():
+        JOBS_BY_STATE.set(count, state=state)
+    rss = peak_rss_bytes()
+    if rss is not None:
+        SERVER_PEAK_RSS.set(rss)
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 
-# Debug endpoint: list recent run IDs (useful for diagnosing client/server id mismatches)
+# Debug endpoint: list recent runs from the job table, newest first (useful
+# for diagnosing client/server id mismatches)
 @app.get("/api/debug/runs")
-def list_runs():
-    runs_root = os.path.join(os.path.dirname(__file__), "runs")
-    if not os.path.exists(runs_root):
-        return {"runs": []}
-    items = []
-    for name in sorted(os.listdir(runs_root)):
-        path = os.path.join(runs_root, name)
-        if os.path.isdir(path):
-            items.append({
-                "id": name,
-                "has_output": os.path.exists(os.path.join(path, 'generated_out.wav'))
-            })
-    return {"runs": items}
+def list_runs(offset: int = 0, limit: int = 50, state: str | None = None):
+    limit = max(1, min(limit, 500))
+    rows, total = jobs.list(offset=max(0, offset), limit=limit, state=state)
+    items = [
+        {
+            "id": job["id"],
+            "kind": job["kind"],
+            "state": job["state"],
+            "stage": job["stage"],
+            "created_at": job["created_at"],
+            "has_output": job["audio_path"] is not None,
+        }
+        for job in rows
+    ]
+    return {"runs": items, "total": total, "offset": offset, "limit": limit}
 
 # API endpoint for AI check
 @app.post("/api/ai-check")
@@ -0,0 +1,71 @@
+"""Async subprocess helper for the job pipeline in main.py.
+
+`run_process` replaces the blocking `subprocess.run` / `Popen` loops: it runs
+a command with `asyncio.create_subprocess_exec`, forwards its output to the
+log line by line and, when the awaiting job is cancelled (DELETE
+/api/jobs/{id}, a stage timeout, server shutdown), kills the whole process
+tree so e.g. the ffmpeg spawned by LatentSync does not outlive it and the
+GPU memory is released immediately.
+"""
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+
+# how many trailing output lines to keep for error messages
+TAIL_LINES = 20
+
+
+def _spawn_kwargs():
+    # own process group/session so the whole tree can be killed at once
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+async def kill_process_tree(proc):
+    if proc.returncode is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            await killer.wait()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, OSError):
+        proc.kill()
+    await proc.wait()
+
+
+async def run_process(cmd, tag, cwd=None, on_line=None):
+    """Run `cmd`, logging its merged stdout/stderr as it arrives.
+
+    `on_line(line)` is called for every output line. Returns
+    `(returncode, tail)` where `tail` holds the last output lines. Raises
+    FileNotFoundError when the executable does not exist.
+    """
+    logging.info("%s running: %s (cwd=%s)", tag, " ".join(cmd), cwd or os.getcwd())
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, **_spawn_kwargs()
+    )
+    tail = []
+    try:
+        async for raw in proc.stdout:
+            line = raw.decode("utf-8", errors="replace").rstrip()
+            logging.info("%s %s", tag, line)
+            tail = (tail + [line])[-TAIL_LINES:]
+            if on_line is not None:
+                on_line(line)
+        await proc.wait()
+    except BaseException:
+        # cancelled (or the reader failed): do not leave the process running
+        logging.warning("%s killing pid %s", tag, proc.pid)
+        await kill_process_tree(proc)
+        raise
+    logging.info("%s exited with returncode=%s", tag, proc.returncode)
+    return proc.returncode, tail
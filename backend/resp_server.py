@@ -0,0 +1,367 @@
+"""Local stand-in for a Redis server, for running the Redis broker without a Redis install.
+
+Speaks RESP2 over TCP and implements, in memory, just the commands that
+broker.RedisBroker uses (hashes, lists, sorted sets, sets, DEL/EXPIRE, and
+WATCH/MULTI/EXEC transactions). Every command runs under one lock, so each
+is atomic like on a real server, and so is the body of an EXEC. Every write
+bumps the version of the keys it touches; EXEC runs nothing and replies nil
+when a key the connection WATCHes changed since. Nothing is persisted.
+
+    python resp_server.py --port 6399
+    BROKER_URL=redis://localhost:6399/0 uvicorn main:app
+"""
+import argparse
+import bisect
+import logging
+import socketserver
+import threading
+import time
+
+
+class CommandError(Exception):
+    pass
+
+
+# commands that modify their first argument (DEL and FLUSHDB are handled on their own)
+WRITE_COMMANDS = {"expire", "hset", "hincrby", "rpush", "lpop", "lrem", "sadd", "zadd", "zrem"}
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        # key -> write counter value of its last modification, for WATCH
+        self.versions = {}
+        self._writes = 0
+
+    def _get(self, key, kind):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _create(self, key, kind):
+        value = self._get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    def _drop_if_empty(self, key):
+        if not self.data.get(key):
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    def _handler(self, name):
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name}'")
+        return handler
+
+    def _touch(self, name, args):
+        name = name.lower()
+        if name in WRITE_COMMANDS and args:
+            keys = args[:1]
+        elif name == "del":
+            keys = args
+        elif name == "flushdb":
+            keys = list(self.versions)
+        else:
+            return
+        self._writes += 1
+        for key in keys:
+            self.versions[key] = self._writes
+
+    def _run(self, name, args):
+        result = self._handler(name)(*args)
+        self._touch(name, args)
+        return result
+
+    def execute(self, name, args):
+        self._handler(name)
+        with self.lock:
+            return self._run(name, args)
+
+    def watch(self, keys):
+        """Versions of `keys` now, to compare at EXEC."""
+        with self.lock:
+            return {key: self.versions.get(key, 0) for key in keys}
+
+    def exec_transaction(self, commands, watched):
+        """Run queued `commands` as one step, or return None if a `watched` key changed."""
+        with self.lock:
+            if any(self.versions.get(key, 0) != version for key, version in watched.items()):
+                return None
+            replies = []
+            for command in commands:
+                try:
+                    replies.append(self._run(command[0], command[1:]))
+                except CommandError as e:
+                    replies.append(e)
+                except (TypeError, ValueError) as e:
+                    replies.append(CommandError(f"ERR {e}"))
+            return replies
+
+    # -- connection ---------------------------------------------------------
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    # -- keys ---------------------------------------------------------------
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if key in self.data:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_expire(self, key, seconds):
+        if self._get(key, object) is None:
+            return 0
+        self.expires[key] = time.time() + float(seconds)
+        return 1
+
+    def cmd_flushdb(self):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    # -- hashes -------------------------------------------------------------
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise CommandError("ERR wrong number of arguments for 'hset' command")
+        value = self._create(key, dict)
+        added = sum(1 for field in pairs[::2] if field not in value)
+        value.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        value = self._get(key, dict) or {}
+        return [value.get(field) for field in fields]
+
+    def cmd_hgetall(self, key):
+        value = self._get(key, dict) or {}
+        return [item for pair in value.items() for item in pair]
+
+    def cmd_hincrby(self, key, field, amount):
+        value = self._create(key, dict)
+        value[field] = str(int(value.get(field) or 0) + int(amount))
+        return int(value[field])
+
+    # -- lists --------------------------------------------------------------
+
+    def cmd_rpush(self, key, *items):
+        value = self._create(key, list)
+        value.extend(items)
+        return len(value)
+
+    def cmd_lpop(self, key):
+        value = self._get(key, list)
+        if not value:
+            return None
+        item = value.pop(0)
+        self._drop_if_empty(key)
+        return item
+
+    def cmd_lindex(self, key, index):
+        value = self._get(key, list) or []
+        index = int(index)
+        return value[index] if -len(value) <= index < len(value) else None
+
+    def cmd_lrem(self, key, count, item):
+        value = self._get(key, list) or []
+        count = int(count)
+        kept, removed = [], 0
+        for element in value:
+            if element == item and (count == 0 or removed < abs(count)):
+                removed += 1
+            else:
+                kept.append(element)
+        if value:
+            value[:] = kept
+            self._drop_if_empty(key)
+        return removed
+
+    def cmd_llen(self, key):
+        return len(self._get(key, list) or [])
+
+    # -- sets ---------------------------------------------------------------
+
+    def cmd_sadd(self, key, *members):
+        value = self._create(key, set)
+        added = len(set(members) - value)
+        value.update(members)
+        return added
+
+    def cmd_smembers(self, key):
+        return sorted(self._get(key, set) or ())
+
+    # -- sorted sets (member -> score dict; ranges are sorted on demand) ------
+
+    def cmd_zadd(self, key, *pairs):
+        value = self._create(key, _ZSet)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in value
+            value[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        value = self._get(key, _ZSet)
+        if not value:
+            return 0
+        removed = sum(1 for member in members if value.pop(member, None) is not None)
+        self._drop_if_empty(key)
+        return removed
+
+    def cmd_zrangebyscore(self, key, low, high):
+        value = self._get(key, _ZSet) or {}
+        ordered = sorted((score, member) for member, score in value.items())
+        scores = [score for score, _ in ordered]
+        start = bisect.bisect_left(scores, float(low))
+        stop = bisect.bisect_right(scores, float(high))
+        return [member for _, member in ordered[start:stop]]
+
+
+class _ZSet(dict):
+    pass
+
+
+NOT_HANDLED = object()
+
+
+def _encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, CommandError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    if value in ("OK", "PONG", "QUEUED"):
+        return f"+{value}\r\n".encode()
+    data = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # inline command (e.g. typed into telnet)
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def _transaction_command(self, command):
+        """WATCH/MULTI/EXEC/DISCARD/UNWATCH and commands queued by MULTI; NOT_HANDLED for any other command."""
+        name = command[0].lower()
+        store = self.server.store
+        if name == "watch":
+            if self.queued is not None:
+                raise CommandError("ERR WATCH inside MULTI is not allowed")
+            self.watched.update(store.watch(command[1:]))
+            return "OK"
+        if name == "unwatch":
+            self.watched = {}
+            return "OK"
+        if name == "multi":
+            if self.queued is not None:
+                raise CommandError("ERR MULTI calls can not be nested")
+            self.queued = []
+            return "OK"
+        if name in ("exec", "discard"):
+            if self.queued is None:
+                raise CommandError(f"ERR {name.upper()} without MULTI")
+            queued, watched = self.queued, self.watched
+            self.queued, self.watched = None, {}
+            return store.exec_transaction(queued, watched) if name == "exec" else "OK"
+        if self.queued is not None:
+            store._handler(command[0])
+            self.queued.append(command)
+            return "QUEUED"
+        return NOT_HANDLED
+
+    def handle(self):
+        # per-connection transaction state: WATCHed key versions and the commands queued since MULTI
+        self.watched = {}
+        self.queued = None
+        while True:
+            try:
+                command = self._read_command()
+            except (OSError, ValueError):
+                return
+            if command is None:
+                return
+            if not command:
+                continue
+            try:
+                result = self._transaction_command(command)
+                if result is NOT_HANDLED:
+                    result = self.server.store.execute(command[0], command[1:])
+                reply = _encode(result)
+            except CommandError as e:
+                reply = f"-{e}\r\n".encode()
+            except (TypeError, ValueError) as e:
+                reply = f"-ERR {e}\r\n".encode()
+            try:
+                self.wfile.write(reply)
+            except OSError:
+                return
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=6399):
+        super().__init__((host, port), _Handler)
+        self.store = Store()
+
+    def start(self):
+        """Serve from a background thread (for scripts that need a broker server next to them)."""
+        threading.Thread(target=self.serve_forever, daemon=True, name="resp-server").start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Redis-protocol stand-in for the job broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    server = RespServer(args.host, args.port)
+    logging.info("RESP stand-in listening on %s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Content-addressed cache of finished generation results for main.py.
+
+A result is keyed on everything that determines it: the sha256 of the
+uploaded video/audio bytes, the script, the model/checkpoint ids and the
+sampling settings (nfe steps, LatentSync inference steps, guidance scale,
+seeds). A resubmission of the same inputs (e.g. a browser retry) is answered
+from the cache without touching the GPU.
+
+Entries live in `<root>/<key>/` as hard links to the run's output files (a
+copy when the run dir is on another filesystem) and are indexed in a small
+SQLite table that records their size and last use. When the cache grows past
+`max_bytes` the least recently used entries are deleted.
+
+The cache also does singleflight: while a job for a key is running, further
+requests for that key are pointed at the running job instead of starting
+another one.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key          TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    files        TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    created_at   REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_last_used_at ON entries (last_used_at);
+"""
+
+
+def make_key(**parts):
+    """Stable sha256 over the given key parts (any JSON-serialisable values)."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard-link `src` to `dst`, copying when linking is not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        # key -> job_id of the job currently producing that result
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _get_locked(self, key):
+        row = self._conn.execute("SELECT files FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        files = {name: os.path.join(self._entry_dir(key), name) for name in json.loads(row[0])}
+        if not all(os.path.isfile(path) for path in files.values()):
+            # deleted behind our back; forget it
+            self._remove_locked(key)
+            return None
+        self._conn.execute(
+            "UPDATE entries SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+        )
+        return files
+
+    def lookup(self, key, job_id):
+        """Resolve a new request for `key`.
+
+        Returns `("hit", {filename: path})` for a cached result,
+        `("inflight", leader_job_id)` when another job is already producing
+        it, or `("miss", None)` after registering `job_id` as the producer;
+        the caller must then call `release(key, job_id)` when that job ends.
+        """
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is not None:
+                self.coalesced += 1
+                return "inflight", leader
+            files = self._get_locked(key) if self.enabled else None
+            if files is not None:
+                self.hits += 1
+                return "hit", files
+            self.misses += 1
+            self._inflight[key] = job_id
+            return "miss", None
+
+    def get(self, key):
+        """Cached files for `key` or None (no singleflight bookkeeping)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return self._get_locked(key)
+
+    def release(self, key, job_id):
+        with self._lock:
+            if self._inflight.get(key) == job_id:
+                del self._inflight[key]
+
+    def put(self, key, kind, files):
+        """Store `{filename: source_path}` under `key`. Call before `release()`."""
+        if not self.enabled:
+            return
+        size = sum(os.path.getsize(path) for path in files.values())
+        if size > self.max_bytes:
+            logging.info("[cache] not caching %s (%d bytes exceeds the %d byte quota)", key[:12], size, self.max_bytes)
+            return
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir + ".tmp-%d" % threading.get_ident()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, path in files.items():
+            link_or_copy(path, os.path.join(tmp_dir, name))
+        now = time.time()
+        with self._lock:
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, files, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(sorted(files)), size, now, now),
+            )
+            self._evict_locked()
+        logging.info("[cache] stored %s result %s (%d bytes)", kind, key[:12], size)
+
+    def _remove_locked(self, key):
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict_locked(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove_locked(key)
+            total -= size
+            logging.info("[cache] evicted %s (%d bytes)", key[:12], size)
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
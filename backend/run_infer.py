@@ -4,12 +4,30 @@ This script supports CLI arguments so a supervisor process (FastAPI) can
 invoke it with the reference audio, generation text, and output path.
 If arguments are not provided, the script falls back to the hardcoded
 defaults present below (maintained for backward compatibility).
+
+With `--stream wav|opus` the audio is also written while it is generated,
+one text chunk at a time (F5TTS.infer_stream), to stdout, a TCP listener
+(`--stream-to tcp://host:port`) or a file/FIFO:
+
+    python run_infer.py --gen-text "..." --stream wav | ffplay -nodisp -
 """
 import os
 import argparse
+import json
+import math
+import shutil
+import socket
+import sys
+import time
 from pathlib import Path
 
+import soundfile as sf
+import torch
+import torchaudio
+
 from f5_tts.api import F5TTS
+from f5_tts.infer.stream_writer import STREAM_WRITERS
+from f5_tts.infer.utils_infer import preprocess_ref_audio_text
 
 # === Edit these parameters to match your environment (defaults) ===
 MODEL_TYPE = "F5-TTS"  # or 'E2-TTS'
@@ -20,6 +38,11 @@ NFE_STEPS = 64
 SWAY_SAMPLING_COEF = -1
 SPEED = 0.7
 DEVICE = None  # None -> let F5TTS choose (cuda/mps/cpu)
+# CPU-only nodes: "int8" or "bf16" runs the DiT and Vocos in reduced precision (see f5_tts/infer/precision.py)
+PRECISION = os.environ.get("TTS_PRECISION") or None
+# "onnx" runs the DiT and Vocos with onnxruntime on the cpu (see f5_tts/infer/onnx_backend.py); the graphs are
+# exported to ONNX_DIR on first use and must be deleted when CHECKPOINT_PATH changes
+BACKEND = os.environ.get("TTS_BACKEND", "torch")
 
 USE_DURATION_MODEL = True
 
@@ -37,37 +60,139 @@ OUT_DIR = Path(".") / "infer_out"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_WAV = OUT_DIR / "generated_out.wav"
 
+# Preprocessed reference voices (clip, transcript, cond mel) are kept here across runs (see f5_tts/infer/voice_store.py)
+VOICE_DIR = os.environ.get("VOICE_DIR", str(OUT_DIR / "voices"))
+# Every new reference adds a profile, so the least recently used ones are deleted past this size and age
+VOICE_DIR_MAX_BYTES = int(os.environ.get("VOICE_DIR_MAX_BYTES", str(2 * 1024 ** 3)))
+VOICE_TTL = float(os.environ.get("VOICE_TTL", str(30 * 24 * 60 * 60)))
+
+# Shape-bucketed torch.compile of the sampler (see f5_tts/model/compiled.py): comma-separated bucket
+# lengths in mel frames, or "default". Empty keeps sampling eager. Compiling every bucket takes a while at
+# start-up, so this is meant for the long-lived worker (worker.py); the compiled kernels are kept in
+# COMPILE_DIR, which lets later processes skip most of that.
+COMPILE_BUCKETS = os.environ.get("TTS_COMPILE_BUCKETS", "")
+COMPILE_DIR = os.environ.get("TTS_COMPILE_DIR", str(OUT_DIR / "compiled"))
+
+ONNX_DIR = os.environ.get("TTS_ONNX_DIR", str(OUT_DIR / "onnx"))
 
-def parse_args():
+# LatentSync's Whisper features and muxed audio track are 16 kHz mono (see backend/audio_ingest.py)
+LIPSYNC_SAMPLE_RATE = 16000
+
+
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Run F5-TTS inference with optional overrides")
     p.add_argument("--ref-audio", type=str, help="Path to reference audio file")
     p.add_argument("--ref-text", type=str, help="Reference text associated with ref audio")
     p.add_argument("--gen-text", type=str, help="Generation text to synthesize")
     p.add_argument("--out-wav", type=str, help="Output WAV path to write generated audio")
+    p.add_argument("--out-wav-16k", type=str, help="Also write the generated audio as 16 kHz mono (LatentSync's input) here")
     p.add_argument("--nfe-steps", type=int, help="Number of NFE steps to use for ODE sampler")
     p.add_argument("--sway-coef", type=float, help="Sway sampling coefficient (sway_sampling_coef)")
     p.add_argument("--speed", type=float, help="Speaking speed multiplier")
     p.add_argument("--seed", type=int, help="RNG seed for sampling (int)")
-    return p.parse_args()
+    p.add_argument("--batch-chunks", action="store_true", help="Sample all text chunks in padded batches instead of one by one")
+    p.add_argument("--max-batch-frames", type=int, help="With --batch-chunks: most mel frames (batch size x longest chunk) per batch")
+    p.add_argument("--long-form", action="store_true",
+                   help="Write the audio to --out-wav as it is generated, in memory bounded by the chunk size (long scripts)")
+    p.add_argument("--stream", choices=sorted(STREAM_WRITERS),
+                   help="Also stream the audio in this format while it is generated (see --stream-to)")
+    p.add_argument("--stream-to", type=str, default="-",
+                   help="Where --stream writes: '-' for stdout (logs then go to stderr), tcp://host:port, or a path/FIFO")
+    p.add_argument("--voice-id", type=str,
+                   help="Use a voice already in VOICE_DIR instead of --ref-audio/--ref-text")
+    p.add_argument("--prepare-ref", action="store_true",
+                   help="Only clip/transcribe --ref-audio into --out-wav (see prepare_reference); no synthesis")
+    return p.parse_args(argv)
 
 
-def main():
-    args = parse_args()
+def load_tts():
+    """Build the F5TTS instance from the module-level defaults.
 
-    ref_audio = args.ref_audio if args.ref_audio else REF_AUDIO
-    ref_text = args.ref_text if args.ref_text else REF_TEXT
-    # Ensure gen_text is at least an empty string when not provided so the
-    # downstream model sees a defined value (avoids ambiguous fallback).
-    gen_text = args.gen_text if args.gen_text is not None else ""
-    if isinstance(gen_text, str):
-        gen_text = gen_text.strip()
-    out_wav = Path(args.out_wav) if (args.out_wav) else OUT_WAV
-    nfe_steps = args.nfe_steps if args.nfe_steps else NFE_STEPS
-    sway_coef = args.sway_coef if args.sway_coef is not None else SWAY_SAMPLING_COEF
-    speed = args.speed if args.speed is not None else SPEED
-    seed = args.seed if args.seed is not None else 42
+    Kept separate from `synthesize` so a long-lived worker (see worker.py)
+    can load the models once and reuse them for every request.
+    """
+    return F5TTS(
+        model_type=MODEL_TYPE,
+        ckpt_file=CHECKPOINT_PATH,
+        vocab_file=VOCAB_FILE,
+        use_ema=USE_EMA,
+        device=DEVICE,
+        voice_dir=VOICE_DIR,
+        voice_max_bytes=VOICE_DIR_MAX_BYTES,
+        voice_ttl=VOICE_TTL,
+        precision=PRECISION,
+        backend=BACKEND,
+        onnx_dir=ONNX_DIR,
+        compile_buckets=_compile_buckets(),
+        compile_dir=COMPILE_DIR,
+    )
+
+
+def _compile_buckets():
+    """COMPILE_BUCKETS as F5TTS's compile_buckets: None (eager), True (the default buckets) or a tuple of lengths."""
+    if not COMPILE_BUCKETS.strip():
+        return None
+    if COMPILE_BUCKETS.strip() == "default":
+        return True
+    return tuple(int(bucket) for bucket in COMPILE_BUCKETS.split(","))
+
+
+def reset_gpu_peak():
+    """Start a new peak-GPU-memory window (see resource_usage)."""
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+
+def resource_usage():
+    """Peak RSS of this process and peak CUDA memory since reset_gpu_peak(), in bytes (None if unknown)."""
+    usage = {"peak_rss_bytes": None, "gpu_peak_bytes": None}
+    try:
+        import resource
+
+        # ru_maxrss is in KiB on Linux (not available on Windows)
+        usage["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    if torch.cuda.is_available():
+        usage["gpu_peak_bytes"] = torch.cuda.max_memory_allocated()
+    return usage
+
+
+def prepare_reference(ref_audio, out_wav, ref_text=None):
+    """Clip and convert `ref_audio` like F5TTS.infer does, transcribing it unless `ref_text` is given.
+
+    Writes the processed clip to `out_wav` and returns its transcript. Passing
+    both to synthesize() skips the ASR pass, so a batch of generations with
+    the same reference (see main.py's /api/batch/video-gen) transcribes once.
+    Does not need a loaded F5TTS.
+    """
+    clip, ref_text = preprocess_ref_audio_text(ref_audio, ref_text or "")
+    Path(out_wav).parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(clip, out_wav)
+    return ref_text
+
+
+def synthesize(tts, ref_audio=None, gen_text=None, out_wav=None, ref_text=None, nfe_steps=None, sway_coef=None, speed=None, seed=None, timings=None, out_wav_16k=None, batch_chunks=False, max_batch_frames=None, voice_id=None, long_form=False):
+    """Run one generation with an already-loaded F5TTS and write it to `out_wav`.
+
+    Any argument left as None falls back to the defaults at the top of this file.
+    If `timings` is a dict it receives seconds spent per TTS stage.
+    With `out_wav_16k` the waveform is also resampled in memory and written
+    there at LIPSYNC_SAMPLE_RATE, so LatentSync does not decode and resample
+    the file again.
+    `batch_chunks` samples all text chunks of a long script in padded batches
+    (of at most `max_batch_frames` mel frames) instead of one after another.
+    `voice_id` names a voice in the F5TTS voice store; the reference is then
+    not read at all. A reference given by path is stored on first use, so a
+    repeat of the same file and transcript skips its preprocessing too.
+    `long_form` writes `out_wav` (and `out_wav_16k`) while generating, without
+    holding the whole waveform in memory (F5TTS.infer_long_form).
+    Returns the output path.
+    """
+    ref_audio, ref_text, gen_text, out_wav, nfe_steps, sway_coef, speed, seed = _with_defaults(
+        ref_audio, ref_text, gen_text, out_wav, nfe_steps, sway_coef, speed, seed
+    )
 
-    print("Initializing F5TTS...")
     print(f"Using ref_audio={ref_audio}")
     print(f"ref_text_len={len(ref_text) if ref_text else 0}, gen_text_len={len(gen_text) if gen_text else 0}, out_wav={out_wav}")
     if gen_text:
@@ -75,18 +200,30 @@ def main():
     else:
         print("Warning: gen_text is empty. If you expect the model to synthesize custom text, ensure the caller passes --gen-text.")
 
-    tts = F5TTS(
-        model_type=MODEL_TYPE,
-        ckpt_file=CHECKPOINT_PATH,
-        vocab_file=VOCAB_FILE,
-        use_ema=USE_EMA,
-        device=DEVICE,
-    )
-
     print("Running inference...")
 
     out_wav.parent.mkdir(parents=True, exist_ok=True)
 
+    if long_form:
+        _, sr, samples = tts.infer_long_form(
+            ref_file=ref_audio,
+            ref_text=ref_text,
+            gen_text=gen_text,
+            file_wave=str(out_wav),
+            nfe_step=nfe_steps,
+            sway_sampling_coef=sway_coef,
+            speed=speed,
+            seed=seed,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+            voice_id=voice_id,
+        )
+        if out_wav_16k:
+            _write_16k_from_file(out_wav, out_wav_16k)
+        print(f"Inference complete. Output saved to: {out_wav} (sr={sr}, {samples / sr:.1f}s)")
+        return out_wav
+
     # F5TTS.infer returns (wav, sr, spect). It will write to out_wav if file_wave is supplied.
     wav, sr, spect = tts.infer(
         ref_file=ref_audio,
@@ -97,10 +234,199 @@ def main():
         speed=speed,
         seed=seed,
         file_wave=str(out_wav),
+        timings=timings,
+        batch_chunks=batch_chunks,
+        max_batch_frames=max_batch_frames,
+        voice_id=voice_id,
     )
 
+    if out_wav_16k:
+        _write_16k(wav, sr, out_wav_16k)
+
     print(f"Inference complete. Output saved to: {out_wav} (sr={sr})")
     print(f"Returned waveform shape/type: {type(wav)}")
+    return out_wav
+
+
+def _with_defaults(ref_audio, ref_text, gen_text, out_wav, nfe_steps, sway_coef, speed, seed):
+    """Fill arguments left as None with the defaults at the top of this file."""
+    ref_audio = ref_audio if ref_audio else REF_AUDIO
+    ref_text = ref_text if ref_text else REF_TEXT
+    # Ensure gen_text is at least an empty string when not provided so the
+    # downstream model sees a defined value (avoids ambiguous fallback).
+    gen_text = gen_text if gen_text is not None else ""
+    if isinstance(gen_text, str):
+        gen_text = gen_text.strip()
+    out_wav = Path(out_wav) if out_wav else OUT_WAV
+    nfe_steps = nfe_steps if nfe_steps else NFE_STEPS
+    sway_coef = sway_coef if sway_coef is not None else SWAY_SAMPLING_COEF
+    speed = speed if speed is not None else SPEED
+    seed = seed if seed is not None else 42
+    return ref_audio, ref_text, gen_text, out_wav, nfe_steps, sway_coef, speed, seed
+
+
+def _write_16k(wav, sr, out_wav_16k):
+    resampled = torchaudio.functional.resample(torch.as_tensor(wav, dtype=torch.float32), sr, LIPSYNC_SAMPLE_RATE)
+    sf.write(str(out_wav_16k), resampled.numpy(), LIPSYNC_SAMPLE_RATE, subtype="PCM_16")
+
+
+def _write_16k_from_file(wav_path, out_wav_16k, block_seconds=30):
+    """_write_16k for a file that need not fit in memory: resamples `wav_path` block by block.
+
+    Every block is resampled with extra samples on both sides (more than the
+    resampling filter reaches) that are cut off again, and blocks start on
+    multiples of the rate ratio's period, so the output equals resampling
+    the whole file at once.
+    """
+    sr = sf.info(str(wav_path)).samplerate
+    period = sr // math.gcd(sr, LIPSYNC_SAMPLE_RATE)  # input samples per whole number of output samples
+    out_period = LIPSYNC_SAMPLE_RATE // math.gcd(sr, LIPSYNC_SAMPLE_RATE)
+    block = period * max(1, int(block_seconds * sr) // period)
+    context = period * 64
+    with sf.SoundFile(str(wav_path)) as src, sf.SoundFile(
+        str(out_wav_16k), "w", samplerate=LIPSYNC_SAMPLE_RATE, channels=1, subtype="PCM_16"
+    ) as out:
+        for start in range(0, src.frames, block):
+            left = min(context, start)
+            src.seek(start - left)
+            wave = src.read(left + block + context, dtype="float32")
+            resampled = torchaudio.functional.resample(torch.from_numpy(wave), sr, LIPSYNC_SAMPLE_RATE)
+            first = left // period * out_period
+            out.write(resampled[first : first + block // period * out_period].numpy())
+
+
+def open_stream_target(target):
+    """Binary file object for --stream-to: '-' (stdout), 'tcp://host:port' or a path (e.g. a FIFO)."""
+    if target in (None, "-"):
+        # keep the real stdout for the audio; anything printed from now on goes to stderr
+        sys.stdout.flush()
+        audio_fd = os.dup(1)
+        os.dup2(2, 1)
+        return os.fdopen(audio_fd, "wb", buffering=0)
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].rpartition(":")
+        sock = socket.create_connection((host, int(port)))
+        stream = sock.makefile("wb", buffering=0)
+        # the connection stays open until the file object is closed
+        sock.close()
+        return stream
+    return open(target, "wb", buffering=0)
+
+
+def synthesize_stream(tts, sink, stream_format="wav", ref_audio=None, gen_text=None, out_wav=None, ref_text=None, nfe_steps=None, sway_coef=None, speed=None, seed=None, timings=None, out_wav_16k=None, batch_chunks=False, max_batch_frames=None, voice_id=None):
+    """Like synthesize(), but writes the audio to the binary file object `sink`
+    (in `stream_format`, see STREAM_WRITERS) as each text chunk is generated.
+
+    `out_wav` is written block by block alongside the stream if given, and
+    `out_wav_16k` resampled from it at the end, so no more than a block of the
+    waveform is held in memory. If `timings` is a dict it also receives
+    `tts_first_audio`, the seconds until the first block was written. Returns
+    the output path, or None without `out_wav`.
+    """
+    ref_audio, ref_text, gen_text, _, nfe_steps, sway_coef, speed, seed = _with_defaults(
+        ref_audio, ref_text, gen_text, out_wav, nfe_steps, sway_coef, speed, seed
+    )
+    print(f"Streaming {stream_format} for gen_text_len={len(gen_text)} (ref_audio={ref_audio})")
+
+    start = time.perf_counter()
+    writer = STREAM_WRITERS[stream_format](sink, tts.target_sample_rate)
+    wav_file = None
+    if out_wav:
+        out_wav = Path(out_wav)
+        out_wav.parent.mkdir(parents=True, exist_ok=True)
+        wav_file = sf.SoundFile(str(out_wav), "w", samplerate=tts.target_sample_rate, channels=1)
+    first = True
+    try:
+        for block in tts.infer_stream(
+            ref_file=ref_audio,
+            ref_text=ref_text,
+            gen_text=gen_text,
+            nfe_step=nfe_steps,
+            sway_sampling_coef=sway_coef,
+            speed=speed,
+            seed=seed,
+            timings=timings,
+            batch_chunks=batch_chunks,
+            max_batch_frames=max_batch_frames,
+            voice_id=voice_id,
+        ):
+            writer.write(block)
+            if first and timings is not None:
+                timings["tts_first_audio"] = time.perf_counter() - start
+            first = False
+            if wav_file is not None:
+                wav_file.write(block)
+    finally:
+        if wav_file is not None:
+            wav_file.close()
+    writer.close()
+    sink.close()
+
+    if not out_wav:
+        return None
+    if out_wav_16k:
+        _write_16k_from_file(out_wav, out_wav_16k)
+    print(f"Streaming complete. Output saved to: {out_wav}")
+    return out_wav
+
+
+def main():
+    args = parse_args()
+
+    if args.prepare_ref:
+        ref_text = prepare_reference(args.ref_audio or REF_AUDIO, args.out_wav or OUT_WAV, args.ref_text)
+        # machine-readable transcript for the backend (see main.py)
+        print("[reference] " + json.dumps({"ref_text": ref_text}), flush=True)
+        return
+
+    # opened first: streaming to stdout moves everything printed below to stderr
+    sink = open_stream_target(args.stream_to) if args.stream else None
+
+    print("Initializing F5TTS...")
+    tts = load_tts()
+
+    timings = {}
+    reset_gpu_peak()
+    if args.stream:
+        synthesize_stream(
+            tts,
+            sink,
+            args.stream,
+            ref_audio=args.ref_audio,
+            gen_text=args.gen_text,
+            out_wav=args.out_wav,
+            ref_text=args.ref_text,
+            nfe_steps=args.nfe_steps,
+            sway_coef=args.sway_coef,
+            speed=args.speed,
+            seed=args.seed,
+            timings=timings,
+            out_wav_16k=args.out_wav_16k,
+            batch_chunks=args.batch_chunks,
+            max_batch_frames=args.max_batch_frames,
+            voice_id=args.voice_id,
+        )
+        print("[timings] " + json.dumps({"timings": timings, **resource_usage()}), flush=True)
+        return
+    synthesize(
+        tts,
+        ref_audio=args.ref_audio,
+        gen_text=args.gen_text,
+        out_wav=args.out_wav,
+        ref_text=args.ref_text,
+        nfe_steps=args.nfe_steps,
+        sway_coef=args.sway_coef,
+        speed=args.speed,
+        seed=args.seed,
+        timings=timings,
+        out_wav_16k=args.out_wav_16k,
+        batch_chunks=args.batch_chunks,
+        max_batch_frames=args.max_batch_frames,
+        voice_id=args.voice_id,
+        long_form=args.long_form,
+    )
+    # one machine-readable line for the backend's /metrics (see main.py)
+    print("[timings] " + json.dumps({"timings": timings, **resource_usage()}), flush=True)
 
 
 if __name__ == "__main__":
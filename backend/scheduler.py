@@ -0,0 +1,245 @@
+"""Bounded, prioritized job scheduler for main.py.
+
+Replaces `BackgroundTasks.add_task`, which started every upload on Starlette's
+thread pool at once. Jobs wait in per-priority queues and at most
+`max_active_jobs` run at a time. Within one priority level clients are served
+round-robin, so one client submitting many jobs cannot starve the others.
+
+Jobs are coroutines running as tasks on the server's event loop; the heavy
+lifting happens in subprocesses or resident workers that they await, so no
+thread is parked per job or per stage. Inside a running job each pipeline
+stage (TTS, lipsync, ffmpeg) is run through `Scheduler.run_stage()`, which
+enforces a per-stage concurrency limit (e.g. only one LatentSync pass occupies
+the GPU while another job's TTS runs) and a per-stage timeout, and records
+how long the stage ran in the job's `timings` (the admission cost model
+learns from these).
+`Scheduler.cancel()` removes a queued job or cancels a running job's task; the
+stage being awaited is expected to kill its subprocess/worker on cancellation.
+All state/stage transitions are written to the JobStore.
+"""
+import asyncio
+import collections
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import jobstore
+
+
+class JobFailed(Exception):
+    """Raised by a job function to fail the job with a user-facing message."""
+
+
+class _PendingJob:
+    __slots__ = ("job_id", "fn", "client", "priority", "submitted_at")
+
+    def __init__(self, job_id, fn, client, priority):
+        self.job_id = job_id
+        self.fn = fn
+        self.client = client
+        self.priority = priority
+        self.submitted_at = time.time()
+
+
+class Scheduler:
+    def __init__(self, store, max_active_jobs=2, stage_limits=None, stage_timeouts=None):
+        self.store = store
+        self.max_active_jobs = max(1, int(max_active_jobs))
+        # stage name -> max concurrent holders; stages without a limit are unbounded
+        self.stage_limits = {name: max(1, int(n)) for name, n in (stage_limits or {}).items()}
+        # stage name -> seconds a stage may run before the job fails; missing/0 means no limit
+        self.stage_timeouts = {name: float(t) for name, t in (stage_timeouts or {}).items() if t}
+        self._stage_sems = {name: asyncio.Semaphore(n) for name, n in self.stage_limits.items()}
+        self._stage_active = collections.Counter()
+        self._stage_waiting = collections.Counter()
+        # guards the queues/counters, which status() reads from request threads
+        self._lock = threading.Lock()
+        # priority -> OrderedDict(client -> deque of _PendingJob); OrderedDict order is the round-robin order
+        self._pending = {}
+        # job_id -> asyncio.Task of running jobs
+        self._running = {}
+        # job_id -> {stage: seconds} of the stages a running job has completed
+        self._timings = {}
+        self._closed = False
+
+    # -- queueing -----------------------------------------------------------
+
+    def submit(self, job_id, fn, client="", priority=0):
+        """Queue `fn(job_id)` (a coroutine function) to run when a slot is free.
+
+        Higher priority runs first. Must be called from the event loop.
+        """
+        job = _PendingJob(job_id, fn, client or "", int(priority))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("scheduler is shut down")
+            clients = self._pending.setdefault(job.priority, collections.OrderedDict())
+            clients.setdefault(job.client, collections.deque()).append(job)
+        self._pump()
+
+    def _pop_next(self):
+        """Pop the next job: highest priority first, then round-robin over clients. Caller holds the lock."""
+        for priority in sorted(self._pending, reverse=True):
+            clients = self._pending[priority]
+            if not clients:
+                continue
+            client, jobs = next(iter(clients.items()))
+            job = jobs.popleft()
+            if jobs:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            if not clients:
+                del self._pending[priority]
+            return job
+        return None
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if self._closed or len(self._running) >= self.max_active_jobs:
+                    return
+                job = self._pop_next()
+                if job is None:
+                    return
+                self._running[job.job_id] = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job):
+        started = time.time()
+        self.store.update(job.job_id, state=jobstore.RUNNING, started_at=started)
+        logging.info("[scheduler] job %s started after %.1fs in queue", job.job_id, started - job.submitted_at)
+        try:
+            await job.fn(job.job_id)
+        except asyncio.CancelledError:
+            logging.info("[scheduler] job %s cancelled", job.job_id)
+            self.store.update(
+                job.job_id, state=jobstore.CANCELLED, stage=None, error="cancelled", finished_at=time.time()
+            )
+        except JobFailed as e:
+            logging.error("[scheduler] job %s failed: %s", job.job_id, e)
+            self.store.update(job.job_id, state=jobstore.FAILED, error=str(e), finished_at=time.time())
+        except Exception as e:
+            logging.exception("[scheduler] job %s crashed", job.job_id)
+            self.store.update(job.job_id, state=jobstore.FAILED, error=f"{type(e).__name__}: {e}", finished_at=time.time())
+        else:
+            self.store.update(job.job_id, state=jobstore.DONE, stage=None, finished_at=time.time())
+            logging.info("[scheduler] job %s done in %.1fs", job.job_id, time.time() - started)
+        finally:
+            with self._lock:
+                self._running.pop(job.job_id, None)
+                self._timings.pop(job.job_id, None)
+            if not self._closed:
+                self._pump()
+
+    def _remove_pending(self, job_id):
+        """Drop a queued job. Caller holds the lock. Returns True if it was queued."""
+        for priority, clients in list(self._pending.items()):
+            for client, jobs in list(clients.items()):
+                for job in jobs:
+                    if job.job_id != job_id:
+                        continue
+                    jobs.remove(job)
+                    if not jobs:
+                        del clients[client]
+                    if not clients:
+                        del self._pending[priority]
+                    return True
+        return False
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns False if the scheduler does not know it."""
+        with self._lock:
+            removed = self._remove_pending(job_id)
+            task = None if removed else self._running.get(job_id)
+        if removed:
+            self.store.update(job_id, state=jobstore.CANCELLED, error="cancelled", finished_at=time.time())
+            logging.info("[scheduler] job %s removed from the queue", job_id)
+            return True
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    # -- stages -------------------------------------------------------------
+
+    @asynccontextmanager
+    async def stage(self, job_id, name):
+        """Run a block as pipeline stage `name`, waiting for a free slot of that stage first."""
+        sem = self._stage_sems.get(name)
+        if sem is not None:
+            self.store.update(job_id, stage=f"waiting:{name}")
+            with self._lock:
+                self._stage_waiting[name] += 1
+            try:
+                await sem.acquire()
+            finally:
+                with self._lock:
+                    self._stage_waiting[name] -= 1
+        self.store.update(job_id, stage=name)
+        with self._lock:
+            self._stage_active[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage_active[name] -= 1
+            if sem is not None:
+                sem.release()
+
+    async def run_stage(self, job_id, name, coro):
+        """Await `coro` as stage `name`, failing the job if the stage's timeout expires."""
+        try:
+            async with self.stage(job_id, name):
+                timeout = self.stage_timeouts.get(name)
+                started = time.time()
+                try:
+                    result = await asyncio.wait_for(coro, timeout)
+                except asyncio.TimeoutError:
+                    raise JobFailed(f"{name} timed out after {timeout:.0f}s")
+                with self._lock:
+                    timings = self._timings.setdefault(job_id, {})
+                    timings[name] = timings.get(name, 0.0) + time.time() - started
+                    timings = dict(timings)
+                self.store.update(job_id, timings=timings)
+                return result
+        finally:
+            # no-op once it ran; avoids a never-awaited warning when cancelled while waiting for the slot
+            coro.close()
+
+    # -- introspection ------------------------------------------------------
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(len(jobs) for clients in self._pending.values() for jobs in clients.values())
+
+    def status(self):
+        with self._lock:
+            queued = {
+                str(priority): sum(len(jobs) for jobs in clients.values()) for priority, clients in self._pending.items()
+            }
+            return {
+                "max_active_jobs": self.max_active_jobs,
+                "active_jobs": len(self._running),
+                "queued": queued,
+                "stages": {
+                    name: {
+                        "limit": self.stage_limits.get(name),
+                        "timeout": self.stage_timeouts.get(name),
+                        "active": self._stage_active[name],
+                        "waiting": self._stage_waiting[name],
+                    }
+                    for name in sorted(set(self.stage_limits) | set(self._stage_active))
+                },
+            }
+
+    async def shutdown(self):
+        """Drop queued jobs and cancel running ones (their stages clean up after themselves)."""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
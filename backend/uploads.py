@@ -0,0 +1,192 @@
+"""Constant-memory upload spooling for main.py.
+
+`spool_upload` copies an `UploadFile` into the run directory in fixed-size
+chunks instead of `await upload.read()`-ing the whole body into RAM. While the
+bytes stream past it also
+
+* hashes them (sha256), so later stages and caches can key on content, and
+* feeds the first part of the stream to `ffprobe` reading from a pipe, so the
+  container, fps, resolution and duration are known as soon as the upload is
+  on disk and later stages never re-open the file just to learn them.
+
+Files whose index sits at the end (non-faststart MP4) cannot be probed from a
+prefix; for those the probe falls back to running ffprobe on the finished file.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+# Only this much of the stream is piped to ffprobe; headers live at the front of nearly every container.
+PROBE_PIPE_BYTES = 32 * 1024 * 1024
+FFPROBE_ARGS = ["-v", "error", "-print_format", "json", "-show_format", "-show_streams"]
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit):
+        super().__init__(f"upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+def _parse_rate(rate):
+    """'30000/1001' -> 29.97; None for missing or 0/0 rates."""
+    try:
+        num, _, den = str(rate).partition("/")
+        num, den = float(num), float(den or 1)
+        return round(num / den, 3) if num and den else None
+    except ValueError:
+        return None
+
+
+def summarize_probe(raw):
+    """Reduce ffprobe's JSON to the fields the pipeline cares about."""
+    fmt = raw.get("format") or {}
+    streams = raw.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    duration = fmt.get("duration") or (video or audio or {}).get("duration")
+    info = {
+        "container": fmt.get("format_name"),
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "has_video": video is not None,
+        "has_audio": audio is not None,
+    }
+    if video is not None:
+        fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+        frames = video.get("nb_frames")
+        info.update(
+            video_codec=video.get("codec_name"),
+            width=video.get("width"),
+            height=video.get("height"),
+            fps=fps,
+            frames=int(frames) if frames and str(frames).isdigit() else (
+                int(info["duration"] * fps) if info["duration"] and fps else None
+            ),
+        )
+    if audio is not None:
+        info.update(
+            audio_codec=audio.get("codec_name"),
+            sample_rate=int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+            channels=audio.get("channels"),
+        )
+    return info
+
+
+def _probe_is_complete(info):
+    return info is not None and info.get("duration") is not None and (info["has_video"] or info["has_audio"])
+
+
+class _PipeProbe:
+    """ffprobe reading from stdin, fed with the upload's leading chunks."""
+
+    def __init__(self):
+        self.proc = None
+        self.fed = 0
+
+    async def start(self):
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                "ffprobe", *FFPROBE_ARGS, "-i", "pipe:0",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except (FileNotFoundError, OSError):
+            logging.warning("ffprobe not found; uploads will not be probed")
+            self.proc = None
+
+    async def feed(self, chunk):
+        if self.proc is None or self.proc.stdin.is_closing() or self.fed >= PROBE_PIPE_BYTES:
+            return
+        try:
+            self.proc.stdin.write(chunk)
+            await self.proc.stdin.drain()
+            self.fed += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffprobe has read all it needs and exited
+            self.fed = PROBE_PIPE_BYTES
+        if self.fed >= PROBE_PIPE_BYTES:
+            self.proc.stdin.close()
+
+    async def result(self):
+        if self.proc is None:
+            return None
+        if not self.proc.stdin.is_closing():
+            self.proc.stdin.close()
+        out, _ = await self.proc.communicate()
+        try:
+            return summarize_probe(json.loads(out or b"{}"))
+        except ValueError:
+            return None
+
+    async def abort(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+
+
+async def probe_file(path):
+    """Run ffprobe on a file on disk. Returns the summarized dict, or None."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", *FFPROBE_ARGS, path, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except (FileNotFoundError, OSError):
+        return None
+    out, _ = await proc.communicate()
+    try:
+        return summarize_probe(json.loads(out or b"{}"))
+    except ValueError:
+        return None
+
+
+async def spool_upload(upload, dest_path, max_bytes=MAX_UPLOAD_BYTES, probe=True):
+    """Copy `upload` to `dest_path` chunk by chunk, hashing and probing on the way.
+
+    Returns `{"path", "size", "sha256", "probe"}`; `probe` is None when ffprobe
+    is unavailable or could not read the file. Raises UploadTooLarge (after
+    removing the partial file) when more than `max_bytes` arrive.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    prober = _PipeProbe() if probe else None
+    if prober is not None:
+        await prober.start()
+
+    f = await run_in_threadpool(open, dest_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+            if prober is not None:
+                await prober.feed(chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        if prober is not None:
+            await prober.abort()
+        try:
+            os.remove(dest_path)
+        except OSError:
+            pass
+        raise
+    await run_in_threadpool(f.close)
+
+    info = None
+    if prober is not None:
+        info = await prober.result()
+        if not _probe_is_complete(info):
+            info = await probe_file(dest_path)
+
+    logging.info("Spooled upload to %s (%d bytes, sha256=%s, probe=%s)", dest_path, size, digest.hexdigest()[:12], info)
+    return {"path": dest_path, "size": size, "sha256": digest.hexdigest(), "probe": info}
@@ -0,0 +1,231 @@
+"""Long-lived inference worker used by the backend's worker-pool mode.
+
+`main.py` normally launches `run_infer.py` and `run_inference_hardcoded.py` as
+fresh processes for every request, which reloads F5TTS, Vocos, the duration
+model, Whisper, the VAE, the UNet3D and insightface each time. This script
+loads one of the two model stacks once, runs a dummy inference to warm it up
+and then serves jobs until stdin is closed:
+
+    python worker.py --kind tts       # F5TTS (run from backend/)
+    python worker.py --kind lipsync   # LatentSync (run from backend/latentsync/)
+
+Protocol: one JSON object per line. Requests arrive on stdin as
+`{"id": ..., "params": {...}}`; replies go to the *original* stdout as
+`{"id": ..., "ok": true, "result": {...}}` or `{"id": ..., "ok": false, "error": "..."}`.
+Once warm-up has finished the worker announces `{"event": "ready"}`. While a
+job runs the worker may send `{"id": ..., "event": "progress", ...}` lines
+(e.g. LatentSync's per-window progress) ahead of the reply.
+Everything the models print is redirected to stderr so it cannot corrupt the
+protocol stream; the pool forwards stderr to the server log.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+LATENTSYNC_DIR = os.path.join(BACKEND_DIR, "latentsync")
+
+
+def _open_protocol_stream():
+    """Return a private handle on the real stdout and point fd 1 at stderr.
+
+    Libraries (and ffmpeg children spawned by the pipeline) write to fd 1
+    directly, so re-pointing `sys.stdout` alone is not enough.
+    """
+    sys.stdout.flush()
+    proto_fd = os.dup(1)
+    os.dup2(2, 1)
+    return os.fdopen(proto_fd, "w", buffering=1, encoding="utf-8")
+
+
+class TTSBackend:
+    """F5TTS loaded once through run_infer.load_tts()."""
+
+    # Bundled example shipped with f5_tts; giving its transcript avoids loading the ASR model at warm-up.
+    WARMUP_REF_AUDIO = os.path.join(BACKEND_DIR, "f5_tts", "infer", "examples", "basic", "basic_ref_en.wav")
+    WARMUP_REF_TEXT = "some call me nature, others call me mother nature."
+
+    def __init__(self):
+        import run_infer
+
+        self.run_infer = run_infer
+        self.tts = run_infer.load_tts()
+
+    def warmup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.run_infer.synthesize(
+                self.tts,
+                ref_audio=self.WARMUP_REF_AUDIO,
+                ref_text=self.WARMUP_REF_TEXT,
+                gen_text="Warming up.",
+                out_wav=os.path.join(tmp, "warmup.wav"),
+                nfe_steps=4,
+            )
+
+    def run(self, params, progress):
+        if params.get("task") == "prepare_ref":
+            ref_text = self.run_infer.prepare_reference(params["ref_audio"], params["out_wav"], params.get("ref_text"))
+            return {"out_wav": params["out_wav"], "ref_text": ref_text}
+        timings = {}
+        self.run_infer.reset_gpu_peak()
+        out_wav = self.run_infer.synthesize(
+            self.tts,
+            ref_audio=params.get("ref_audio"),
+            gen_text=params.get("gen_text"),
+            out_wav=params.get("out_wav"),
+            ref_text=params.get("ref_text"),
+            nfe_steps=params.get("nfe_steps"),
+            sway_coef=params.get("sway_coef"),
+            speed=params.get("speed"),
+            seed=params.get("seed"),
+            timings=timings,
+            out_wav_16k=params.get("out_wav_16k"),
+            batch_chunks=params.get("batch_chunks", False),
+            max_batch_frames=params.get("max_batch_frames"),
+            voice_id=params.get("voice_id"),
+        )
+        return {"out_wav": str(out_wav), "timings": timings, **self.run_infer.resource_usage()}
+
+
+class LipsyncBackend:
+    """LatentSync pipeline loaded once through run_inference_hardcoded.load_pipeline()."""
+
+    def __init__(self):
+        # LatentSync resolves configs/ and checkpoints/ relative to its own folder.
+        os.chdir(LATENTSYNC_DIR)
+        if LATENTSYNC_DIR not in sys.path:
+            sys.path.insert(0, LATENTSYNC_DIR)
+        import run_inference_hardcoded
+
+        self.runner = run_inference_hardcoded
+        self.pipeline, self.config = run_inference_hardcoded.load_pipeline()
+
+    def warmup(self):
+        """Push dummy tensors through Whisper, the UNet and the VAE decoder.
+
+        A real end-to-end call needs a video with a detectable face, so this
+        exercises each model on zeros of the production shapes instead and
+        builds the insightface detector up front.
+        """
+        import numpy as np
+        import soundfile as sf
+        import torch
+
+        pipeline = self.pipeline
+        config = self.config
+        height = config.data.resolution
+        num_frames = config.data.num_frames
+        dtype = torch.float16
+        device = pipeline._execution_device
+
+        pipeline.prepare_image_processor(height, config.data.mask_image_path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            silence_path = os.path.join(tmp, "silence.wav")
+            sf.write(silence_path, np.zeros(16000, dtype=np.float32), 16000)
+            feature = pipeline.audio_encoder.audio2feat(silence_path)
+        chunks = pipeline.audio_encoder.feature2chunks(feature_array=feature, fps=25)
+
+        frames = min(num_frames, len(chunks))
+        with torch.no_grad():
+            # batch of 2 mirrors the classifier-free guidance layout used at inference
+            audio_embeds = None
+            if pipeline.unet.add_audio_layer:
+                audio_embeds = torch.stack(chunks[:frames]).to(device, dtype=dtype)
+                audio_embeds = torch.cat([torch.zeros_like(audio_embeds), audio_embeds])
+            latent_size = height // pipeline.vae_scale_factor
+            unet_input = torch.zeros(
+                (2, pipeline.unet.config.in_channels, frames, latent_size, latent_size), device=device, dtype=dtype
+            )
+            pipeline.scheduler.set_timesteps(1, device=device)
+            pipeline.unet(unet_input, pipeline.scheduler.timesteps[0], encoder_hidden_states=audio_embeds)
+            latents = torch.zeros(
+                (1, pipeline.vae.config.latent_channels, 1, latent_size, latent_size), device=device, dtype=dtype
+            )
+            pipeline.decode_latents(latents)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def run(self, params, progress):
+        timings = {}
+        self.runner.reset_gpu_peak()
+        out_mp4 = self.runner.run(
+            self.pipeline,
+            self.config,
+            window_callback=lambda done, total: progress(stage="lipsync", window=done, windows=total),
+            video_path=params["video_path"],
+            audio_path=params["audio_path"],
+            video_out_path=params["video_out_path"],
+            inference_steps=params.get("inference_steps"),
+            guidance_scale=params.get("guidance_scale"),
+            seed=params.get("seed"),
+            temp_dir=params.get("temp_dir"),
+            alignment_cache=params.get("alignment_cache"),
+            stream_dir=params.get("stream_dir"),
+            timings=timings,
+        )
+        return {"video_out_path": out_mp4, "timings": timings, **self.runner.resource_usage()}
+
+
+BACKENDS = {
+    "tts": TTSBackend,
+    "lipsync": LipsyncBackend,
+}
+
+
+def serve(backend, proto):
+    def send(message):
+        proto.write(json.dumps(message) + "\n")
+        proto.flush()
+
+    send({"event": "ready"})
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            print(f"[worker] ignoring malformed request line: {line[:200]}", file=sys.stderr)
+            continue
+        job_id = request.get("id")
+        start = time.time()
+
+        def progress(**data):
+            send({"id": job_id, "event": "progress", **data})
+
+        try:
+            result = backend.run(request.get("params") or {}, progress)
+            send({"id": job_id, "ok": True, "result": result, "elapsed": time.time() - start})
+        except Exception as e:
+            traceback.print_exc()
+            send({"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}", "elapsed": time.time() - start})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident F5TTS / LatentSync worker for main.py")
+    parser.add_argument("--kind", choices=sorted(BACKENDS), required=True)
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the dummy inference at start-up")
+    args = parser.parse_args()
+
+    proto = _open_protocol_stream()
+
+    print(f"[worker] loading {args.kind} models (pid={os.getpid()})", file=sys.stderr)
+    start = time.time()
+    backend = BACKENDS[args.kind]()
+    print(f"[worker] {args.kind} models loaded in {time.time() - start:.1f}s", file=sys.stderr)
+
+    if not args.no_warmup:
+        start = time.time()
+        backend.warmup()
+        print(f"[worker] {args.kind} warm-up finished in {time.time() - start:.1f}s", file=sys.stderr)
+
+    serve(backend, proto)
+
+
+if __name__ == "__main__":
+    main()
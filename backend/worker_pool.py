@@ -0,0 +1,233 @@
+"""Pool of resident inference workers (see worker.py) for main.py.
+
+Each `WorkerPool` owns one or more `python worker.py --kind <kind>` processes
+that keep their models loaded between requests. Jobs are put on a shared
+queue; every worker process has a dispatcher thread that pulls the next job
+when the process is idle, writes it to the worker's stdin and resolves the
+job's `concurrent.futures.Future` with the reply. A worker that dies is
+restarted and its in-flight job fails instead of hanging the caller.
+`WorkerPool.cancel()` drops a queued job, or kills the worker running it (the
+only way to stop a model mid-inference and hand its GPU memory back); the
+worker is then restarted and warmed up again.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# overridable so the load test (loadtest.py) can run the pool on fake_worker.py
+WORKER_SCRIPT = os.environ.get("WORKER_SCRIPT", os.path.join(BACKEND_DIR, "worker.py"))
+
+
+class WorkerError(RuntimeError):
+    """Raised (through the job's Future) when a worker reports a failure or dies mid-job."""
+
+
+class WorkerProcess:
+    """A single `worker.py` child process and the thread that feeds it jobs."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.name = f"{pool.kind}-{index}"
+        self.proc = None
+        self.ready = threading.Event()
+        self.busy = False
+        # Future of the job currently being run, so cancel() can find its worker
+        self.current = None
+        self.jobs_done = 0
+        self.started_at = None
+        self._replies = queue.Queue()
+
+    def start(self):
+        cmd = [self.pool.python, WORKER_SCRIPT, "--kind", self.pool.kind]
+        logging.info("[pool] starting worker %s: %s (cwd=%s)", self.name, " ".join(cmd), self.pool.cwd)
+        self.ready.clear()
+        self.started_at = time.time()
+        # fresh reply queue so an EOF marker from a previous process cannot fail the next job
+        self._replies = queue.Queue()
+        self.proc = subprocess.Popen(
+            cmd,
+            cwd=self.pool.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        out_reader = threading.Thread(
+            target=self._read_stdout, args=(self.proc, self._replies), daemon=True, name=f"{self.name}-out"
+        )
+        err_reader = threading.Thread(target=self._read_stderr, args=(self.proc,), daemon=True, name=f"{self.name}-err")
+        out_reader.start()
+        err_reader.start()
+
+    def _read_stdout(self, proc, replies):
+        for line in proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logging.info("(%s) %s", self.name, line)
+                continue
+            if message.get("event") == "ready":
+                logging.info("[pool] worker %s is warm after %.1fs", self.name, time.time() - self.started_at)
+                self.ready.set()
+            else:
+                replies.put(message)
+        # EOF: the process exited; wake up a dispatcher waiting on a reply
+        replies.put(None)
+
+    def _read_stderr(self, proc):
+        for line in proc.stderr:
+            logging.info("(%s) %s", self.name, line.rstrip())
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def is_ready(self):
+        return self.ready.is_set() and self.alive()
+
+    def run_job(self, job_id, params, on_progress=None):
+        """Send one job to the process and block until its reply (or the process dies).
+
+        Progress messages the worker sends for the job are passed to `on_progress`.
+        """
+        self.proc.stdin.write(json.dumps({"id": job_id, "params": params}) + "\n")
+        self.proc.stdin.flush()
+        while True:
+            reply = self._replies.get()
+            if reply is None:
+                raise WorkerError(f"worker {self.name} exited with code {self.proc.wait()} while running job {job_id}")
+            if reply.get("id") != job_id:
+                continue
+            if reply.get("event") == "progress":
+                if on_progress is not None:
+                    try:
+                        on_progress(reply)
+                    except Exception:
+                        logging.exception("[pool] progress callback for job %s failed", job_id)
+                continue
+            return reply
+
+    def dispatch_forever(self):
+        while not self.pool.closed:
+            if not self.alive():
+                self.start()
+            if not self.ready.wait(timeout=1.0):
+                if not self.alive():
+                    logging.error("[pool] worker %s exited during start-up (code %s)", self.name, self.proc.poll())
+                    time.sleep(self.pool.restart_delay)
+                continue
+            try:
+                job = self.pool.jobs.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if job is None:
+                break
+            job_id, params, future, on_progress = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            self.current = future
+            try:
+                reply = self.run_job(job_id, params, on_progress)
+                if reply.get("ok"):
+                    future.set_result(reply.get("result") or {})
+                else:
+                    future.set_exception(WorkerError(reply.get("error") or "worker reported failure"))
+                self.jobs_done += 1
+            except Exception as e:
+                logging.exception("[pool] worker %s failed on job %s", self.name, job_id)
+                future.set_exception(e if isinstance(e, WorkerError) else WorkerError(str(e)))
+                self.kill()
+            finally:
+                self.busy = False
+                self.current = None
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+            self.proc.wait()
+
+    def status(self):
+        return {
+            "name": self.name,
+            "pid": self.proc.pid if self.proc else None,
+            "alive": self.alive(),
+            "ready": self.is_ready(),
+            "busy": self.busy,
+            "jobs_done": self.jobs_done,
+        }
+
+
+class WorkerPool:
+    """A fixed-size set of resident workers of one kind ("tts" or "lipsync")."""
+
+    def __init__(self, kind, python, cwd, size=1, restart_delay=5.0):
+        self.kind = kind
+        self.python = python
+        self.cwd = cwd
+        self.size = max(1, int(size))
+        self.restart_delay = restart_delay
+        self.jobs = queue.Queue()
+        self.closed = False
+        self.workers = [WorkerProcess(self, i) for i in range(self.size)]
+        self._ids = itertools.count(1)
+
+    def start(self):
+        for worker in self.workers:
+            threading.Thread(target=worker.dispatch_forever, daemon=True, name=f"{worker.name}-dispatch").start()
+
+    def submit(self, params, on_progress=None):
+        """Queue a job and return a Future resolved with the worker's result dict.
+
+        `on_progress(message)` is called from the dispatcher thread for every
+        progress message the worker sends while running the job.
+        """
+        if self.closed:
+            raise WorkerError(f"{self.kind} pool is shut down")
+        future = Future()
+        self.jobs.put((f"{self.kind}-{next(self._ids)}", params, future, on_progress))
+        return future
+
+    def cancel(self, future):
+        """Cancel a job returned by `submit()`, killing its worker if it is already running."""
+        if future.cancel():
+            return
+        for worker in self.workers:
+            if worker.current is future:
+                logging.warning("[pool] killing worker %s to cancel its running job", worker.name)
+                worker.kill()
+
+    @property
+    def ready(self):
+        return all(worker.is_ready() for worker in self.workers)
+
+    def status(self):
+        return {
+            "kind": self.kind,
+            "size": self.size,
+            "ready": self.ready,
+            "queued": self.jobs.qsize(),
+            "workers": [worker.status() for worker in self.workers],
+        }
+
+    def shutdown(self):
+        self.closed = True
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            if worker.proc is not None and worker.alive():
+                try:
+                    worker.proc.stdin.close()
+                    worker.proc.wait(timeout=10)
+                except Exception:
+                    worker.kill()
@@ -468,6 +468,11 @@ const UploaderPage = ({ onGenerateStart, onGenerateFinish, mode = 'createVideo'
                 body: form // browser sets Content-Type automatically
             });
 
+            if (resp.status === 429) {
+                // admission control: the GPU server is saturated right now
+                const retryAfter = resp.headers.get('Retry-After');
+                throw new Error(`The server is busy. Please try again${retryAfter ? ` in about ${retryAfter} seconds` : ' later'}.`);
+            }
             if (!resp.ok) {
                 const txt = await resp.text();
                 throw new Error(`Server error ${resp.status}: ${txt}`);
@@ -486,8 +491,8 @@ const UploaderPage = ({ onGenerateStart, onGenerateFinish, mode = 'createVideo'
                         const dbgJson = await dbg.json();
                         const runs = dbgJson.runs || [];
                         if (runs.length > 0) {
-                            // pick the most recently-created run (last in sorted list from server)
-                            runId = runs[runs.length - 1].id;
+                            // pick the most recently-created run (server lists newest first)
+                            runId = runs[0].id;
                             console.log('Falling back to debug run id:', runId);
                         }
                     }
@@ -658,7 +663,7 @@ const UploaderPage = ({ onGenerateStart, onGenerateFinish, mode = 'createVideo'
     );
 };
 
-// --- Processing Page Component (with polling for result) ---
+// --- Processing Page Component (follows the job's event stream) ---
 const ProcessingPage = ({ processType = 'createVideo', runId, onJobComplete }) => {
     const [progress, setProgress] = useState(0);
     const [audioUrl, setAudioUrl] = useState(null);
@@ -666,109 +671,152 @@ const ProcessingPage = ({ processType = 'createVideo', runId, onJobComplete }) =
     const [error, setError] = useState(null);
     const [phase, setPhase] = useState('audio'); // 'audio' | 'video' | 'done'
 
+    // Generic progress animator: increments but respects current phase cap
     useEffect(() => {
-        let mounted = true;
-
-        // Generic progress animator: increments but respects current phase cap
         const interval = setInterval(() => {
             setProgress(prev => {
-                const cap = phase === 'audio' ? 50 : 100;
+                const cap = phase === 'audio' ? 50 : phase === 'video' ? 95 : 100;
                 if (prev >= cap) return prev;
                 return Math.min(cap, prev + 1);
             });
         }, 40);
+        return () => clearInterval(interval);
+    }, [phase]);
 
-        const backendBase = 'http://localhost:8000/api';
-        const pollIntervalMs = 2000;
+    useEffect(() => {
+        let mounted = true;
+
+        const backendOrigin = 'http://localhost:8000';
+        const backendBase = `${backendOrigin}/api`;
         // Increase timeout to 15 minutes to allow long-running video generation
         const timeoutMs = 15 * 60 * 1000; // 900000 ms
 
-        const pollForAudio = async () => {
-            let elapsed = 0;
-            while (mounted) {
-                try {
-                    const resp = await fetch(`${backendBase}/jobs/${runId}/audio`);
-                    if (resp.ok) {
-                        const blob = await resp.blob();
-                        const url = URL.createObjectURL(blob);
-                        if (!mounted) return null;
-                        setAudioUrl(url);
-                        // immediately raise progress cap to 50
-                        setPhase('video');
-                        setProgress(50);
-                        return url;
-                    }
-                } catch (err) {
-                    console.error('(pollForAudio) error', err);
-                }
-                elapsed += pollIntervalMs;
-                if (elapsed >= timeoutMs) {
-                    if (mounted) setError('Timed out waiting for generated audio (2 minutes).');
-                    return null;
-                }
-                await new Promise(r => setTimeout(r, pollIntervalMs));
-            }
-            return null;
+        // The job's event stream pushes state changes, lip-sync progress and
+        // an `artifact` event once an output has been published, so there is
+        // no need to poll the artifact URLs until they stop returning 404.
+        const source = new EventSource(`${backendBase}/jobs/${runId}/events`);
+        const artifacts = {};
+        const waiters = {};
+
+        const finish = () => {
+            source.close();
+            Object.keys(waiters).forEach(name => {
+                waiters[name](null);
+                delete waiters[name];
+            });
         };
 
-        const pollForVideo = async () => {
-            let elapsed = 0;
-            while (mounted) {
-                try {
-                    const resp = await fetch(`${backendBase}/jobs/${runId}/video`);
-                    if (resp.ok) {
-                        const blob = await resp.blob();
-                        const url = URL.createObjectURL(blob);
-                        if (!mounted) return null;
-                        setVideoUrl(url);
-                        setPhase('done');
-                        // allow progress animator to reach 100 then immediately complete
-                        setProgress(100);
-                        return url;
-                    }
-                } catch (err) {
-                    console.error('(pollForVideo) error', err);
-                }
-                elapsed += pollIntervalMs;
-                if (elapsed >= timeoutMs) {
-                    if (mounted) setError('Timed out waiting for final video (2 minutes).');
-                    return null;
-                }
-                await new Promise(r => setTimeout(r, pollIntervalMs));
+        const waitForArtifact = (name) => new Promise(resolve => {
+            if (artifacts[name]) resolve(artifacts[name]);
+            else waiters[name] = resolve;
+        });
+
+        source.addEventListener('artifact', (e) => {
+            const { name, url } = JSON.parse(e.data);
+            artifacts[name] = url;
+            if (waiters[name]) {
+                waiters[name](url);
+                delete waiters[name];
             }
-            return null;
+        });
+
+        source.addEventListener('progress', (e) => {
+            const data = JSON.parse(e.data);
+            if (!mounted || !data.windows) return;
+            // lip-sync windows fill the second half of the bar
+            setProgress(prev => Math.max(prev, 50 + Math.floor((45 * data.window) / data.windows)));
+        });
+
+        source.addEventListener('state', (e) => {
+            const job = JSON.parse(e.data);
+            if (job.state === 'failed' || job.state === 'cancelled') {
+                if (mounted) setError(`Generation ${job.state}: ${job.error || 'unknown error'}`);
+                finish();
+            } else if (job.state === 'done') {
+                // artifact events are sent before the final state; nothing more will arrive
+                source.close();
+            }
+        });
+
+        source.onerror = (err) => {
+            // EventSource reconnects on its own; the server replays the job state on reconnect
+            console.error('(job events) connection error', err);
+        };
+
+        const timeout = setTimeout(() => {
+            if (mounted) setError('Timed out waiting for the generated result.');
+            finish();
+        }, timeoutMs);
+
+        const fetchArtifact = async (url) => {
+            const resp = await fetch(`${backendOrigin}${url}`);
+            if (!resp.ok) throw new Error(`Failed to download ${url} (${resp.status})`);
+            const blob = await resp.blob();
+            return URL.createObjectURL(blob);
+        };
+
+        const waitForAudio = async () => {
+            const url = await waitForArtifact('audio');
+            if (!url || !mounted) return null;
+            const blobUrl = await fetchArtifact(url);
+            if (!mounted) return null;
+            setAudioUrl(blobUrl);
+            // immediately raise progress cap to 50
+            setPhase('video');
+            setProgress(prev => Math.max(prev, 50));
+            return blobUrl;
+        };
+
+        const waitForVideo = async () => {
+            const url = await waitForArtifact('video');
+            if (!url || !mounted) return null;
+            const blobUrl = await fetchArtifact(url);
+            if (!mounted) return null;
+            setVideoUrl(blobUrl);
+            setPhase('done');
+            // allow progress animator to reach 100 then immediately complete
+            setProgress(100);
+            return blobUrl;
         };
 
-        // Orchestrate polling depending on process type
+        // Orchestrate depending on process type
         (async () => {
             if (!runId) return;
-            if (processType === 'createVideo') {
-                // Step 1: wait for audio gen
-                const a = await pollForAudio();
-                if (!a) return; // error/timeout already set
+            try {
+                if (processType === 'createVideo') {
+                    // Step 1: wait for audio gen
+                    const a = await waitForAudio();
+                    if (!a) return; // error/timeout already set
 
-                // Step 2: wait for video/lip-sync
-                const v = await pollForVideo();
-                if (!v) return;
+                    // Step 2: wait for video/lip-sync
+                    const v = await waitForVideo();
+                    if (!v) return;
 
-                // Finished: notify parent with final video URL
-                if (mounted) onJobComplete(v);
-            } else {
-                // cloneAudio: behave as before (single audio step)
-                const a = await pollForAudio();
-                if (!a) return;
-                // Wait until visual progress reaches 100
-                setProgress(100);
-                if (mounted) onJobComplete(a);
+                    // Finished: notify parent with final video URL
+                    if (mounted) onJobComplete(v);
+                } else {
+                    // cloneAudio: single audio step
+                    const a = await waitForAudio();
+                    if (!a) return;
+                    // Wait until visual progress reaches 100
+                    setProgress(100);
+                    if (mounted) onJobComplete(a);
+                }
+            } catch (err) {
+                console.error('(ProcessingPage) error', err);
+                if (mounted) setError(err.message);
+            } finally {
+                clearTimeout(timeout);
+                source.close();
             }
         })();
 
         return () => {
             mounted = false;
-            clearInterval(interval);
+            clearTimeout(timeout);
+            finish();
         };
-    // eslint-disable-next-line react-hooks/exhaustive-deps
-    }, [runId, onJobComplete, processType, phase]);
+    }, [runId, onJobComplete, processType]);
 
     const isVideo = processType === 'createVideo';
     const title = isVideo ? 'Processing your video...' : 'Cloning your audio...';